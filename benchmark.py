@@ -0,0 +1,77 @@
+# benchmark.py
+"""
+Benchmarks full game turns without network access.
+
+    LLM_BACKEND=stub python benchmark.py --turns 5
+    LLM_BACKEND=replay LLM_REPLAY_LATENCY=recorded python benchmark.py --turns 5
+
+Record the cassettes for replay once with LLM_BACKEND=record and a live API key.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+from global_defines import *
+from game import Game
+from turn_budget import turn_budget_scope
+from utils import RollingWindow
+
+
+async def run_benchmark(turns: int, action: str):
+    started_at = time.monotonic()
+    game = await Game.create()
+    print(f"{TIME_COLOR}Game.create: {time.monotonic() - started_at:.3f}s{Colors.RESET}")
+
+    first_message = RollingWindow()
+    total = RollingWindow()
+    for turn in range(turns):
+        character = game.chapter.characters[0]
+        turn_started_at = time.monotonic()
+        first_message_at = None
+        with turn_budget_scope():
+            events, _ = await game.chapter.process_interaction(character, action)
+            async for event in events:
+                if first_message_at is None and event.get("event") in ("DM_message_chunk", "message"):
+                    first_message_at = time.monotonic()
+        elapsed = time.monotonic() - turn_started_at
+        total.add(elapsed)
+        if first_message_at is not None:
+            first_message.add(first_message_at - turn_started_at)
+        print(f"{TIME_COLOR}Turn {turn + 1}: {elapsed:.3f}s{Colors.RESET}")
+
+    # Background summarization is not part of turn latency, but its calls belong in the stats
+    await game.chapter.summarizer.wait_idle()
+    registry = game.llm_registry
+    summary = {
+        "backend": registry.backend.get_stats() if registry.backend else {"mode": "live"},
+        "turns": turns,
+        "turn_p50": total.percentile(50),
+        "turn_p95": total.percentile(95),
+        "first_message_p50": first_message.percentile(50),
+        "first_message_p95": first_message.percentile(95),
+        "routes": registry.router.get_stats()["routes"],
+        "telemetry": registry.telemetry.get_aggregates(),
+        "context": game.chapter.state.get_stats(),
+        "event_log": game.chapter.event_log.get_stats(),
+        "summarizer": game.chapter.summarizer.get_stats(),
+        "history_index": game.chapter.history.get_stats(),
+        "npc_prefetch": game.chapter.npc_prefetcher.get_stats(),
+        "scheduler": registry.scheduler.get_stats(),
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark game turns against a recorded or stubbed LLM backend.")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--action", default="Я осматриваю комнату и атакую ближайшего врага.")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.turns, args.action))
@@ -1,6 +1,10 @@
 from calendar import c
-from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
 import inspect
+import os
+import time
+import uuid
 
 from pydantic import BaseModel
 
@@ -22,7 +26,9 @@ from models.schemas import (
     TurnList, 
     NextScene,
     ProactiveChangeType,
-    AfterActionAnalysis
+    AfterActionAnalysis,
+    StatePatch,
+    StoryProgressionCheck
 )
 from server_communication.events import EventBuilder
 from story_manager import StoryManager
@@ -31,35 +37,77 @@ from global_defines import *
 from imagen import ImageGenerator
 from classifier import Classifier
 from prompter import Prompter
+from llm_clients import LLMClientRegistry
+from turn_budget import BudgetExhausted, get_turn_budget
+from llm_scheduler import LLMPriority
+from llm_routing import CallSite
+from state_patch import PatchError, apply_patch
+from rules_engine import RulesEngine, describe_change, enforce_character_rules
+from character_registry import CharacterEntry, CharacterRegistry
+from event_log import DEFAULT_EVENT_PAGE_SIZE, EventLog
+from context_summarizer import ContextSummarizer
+from history_index import HistoryIndex
+from npc_prefetch import NPCActionPrefetcher
+from game_state_context import CONTEXT_PROJECTIONS, FULL_PROJECTION, GameStateContext
 
 
 class CorrectionList(BaseModel):
     corrections: List[ChangesToMake]
 
+CHARACTER_PATCH_RULES = """
+1.  **Rule of Life and Death:** If damage reduces `current_hp` to 0 or below, set `current_hp` to exactly `0` and `is_alive` to `false`. If a dead character is healed, set `is_alive` to `true`.
+2.  **Rule of Inventory Management:** Items gained are added to `/inventory/-` as complete item objects; items lost are removed by their index.
+3.  **Rule of Armor Class (AC):** If the character equips or unequips armor or a shield, replace `/ac` accordingly.
+4.  **Rule of Health Cap:** `current_hp` can NEVER exceed `max_hp`.
+5.  **Rule of Minimal Change:** Only touch fields that are directly affected by the changes.
+"""
+
+SCENE_PATCH_RULES = """
+1.  **Rule of Minimal Change:** Only touch fields that are directly affected by the changes.
+2.  **Rule of Objects:** New objects are added to `/objects/-` as complete objects; objects that leave the scene are removed by their index.
+"""
+
+# Added to the summary that is folded when a fight starts
+FIGHT_SUMMARY_INSTRUCTIONS = """
+A fight is starting. Store which characters are allied with which ones and what can change this alliance, and their motivations and goals.
+Imagine where all the players should be located in the scene. Give more attention to the script and story and less to the scene and characters details.
+"""
+
+
 class Chapter:
     """Fight logic for a chapter in a game, handling character interactions and actions."""
 
     
-    def __init__(self, context: str, story_manager: StoryManager, game : 'Game', characters: List[Character] = [], language: str = "Russian"):
+    def __init__(self, context: str, story_manager: StoryManager, game : 'Game', characters: List[Character] = [], language: str = "Russian", registry: Optional[LLMClientRegistry] = None):
         self.context = context
         self.last_scene = context
-        self.characters = characters        
-        self.generator = ObjectGenerator()
+        self.characters = CharacterRegistry(characters)
+        self.generator = ObjectGenerator(registry=registry)
         self.scene = None
-        self.classifier = Classifier()
+        self.classifier = Classifier(registry=registry)
         self.language = language
-        self.turn_order = [char.name for char in self.characters]
+        # References to cast entries: they survive character updates, unlike names or objects
+        self.turn_order: List[CharacterEntry] = list(self.characters.entries)
         self.current_turn = 0
         self.game_mode = GameMode.NARRATIVE
         self.story_manager = story_manager
         self.prompter = Prompter()
-        self.event_log: List[Dict[str, Any]] = []
+        self.event_log = EventLog()
+        self.state = GameStateContext()
+        # Push the DM narrative to listeners while the model is still generating it
+        self.stream_narration = os.getenv("DM_STREAM_NARRATION", "true").lower() in ("1", "true", "yes")
+        # "patch": the model returns field operations that are applied locally; "full": it echoes the whole object
+        self.state_update_mode = os.getenv("STATE_UPDATE_MODE", "patch").lower()
+        self.rules_engine = RulesEngine()
+        self.summarizer = ContextSummarizer(self)
+        # Searchable session history for recalling events the summary has compressed away
+        self.history = HistoryIndex()
+        self.npc_prefetcher = NPCActionPrefetcher(self)
         self.game = game
-        self.image_generator = ImageGenerator(game)
+        self.image_generator = ImageGenerator(game, registry=registry)
         self.image_generator.start()
-        self.generate_scene()
 
-    def generate_character(self, prompt : str, context : Optional[str]) -> Character:
+    async def generate_character(self, prompt : str, context : Optional[str]) -> Character:
         """Used to generate a NEW character. 
 
         Args:
@@ -68,24 +116,62 @@ class Chapter:
         Returns:
             Character: generated character
         """
-        new_character =  self.generator.generate(
+        new_character = await self.generator.generate_async(
             pydantic_model=Character,
             prompt=prompt,
             context=context,
-            language=self.language
+            language=self.language,
+            call_site=CallSite.CHARACTER_GENERATION
         )
         self.image_generator.submit_generation_task(new_character.appearance, new_character.name)
         return new_character
          
     def add_character(self, character: Character):
-        self.characters.append(character)
-        self.turn_order.append(character.name)
+        self.turn_order.append(self.characters.add(character))
+
+    def remove_character(self, character: Character):
+        entry = self.characters.remove(character)
+        if entry in self.turn_order:
+            position = self.turn_order.index(entry)
+            self.turn_order.remove(entry)
+            if position < self.current_turn:
+                self.current_turn -= 1
+            if self.turn_order:
+                self.current_turn %= len(self.turn_order)
+            else:
+                self.current_turn = 0
         
+    def degrade(self, step: str, error: Optional[BaseException] = None):
+        """
+        Records that an optional step of the turn was skipped (turn budget exhausted or LLM failure).
+        """
+        reason = str(error) if error else "turn budget exhausted"
+        budget = get_turn_budget()
+        if budget:
+            budget.degrade(step, reason)
+        else:
+            print(f"{WARNING_COLOR}Skipping {step}: {reason}{Colors.RESET}")
+        self.log_event("degraded_step", step=step, reason=reason)
+
+    def out_of_budget(self, step: str) -> bool:
+        """
+        True (and the step is recorded as skipped) when the current turn has no budget left.
+        """
+        budget = get_turn_budget()
+        if budget and budget.expired:
+            self.degrade(step)
+            return True
+        return False
+
     def log_event(self, event_type: str, **kwargs):
         """Logs a game event to the event log."""
-        self.event_log.append({"event": event_type, "details": kwargs})
+        self.event_log.append(event_type, kwargs)
+
+    def get_recent_events(self, limit: int = DEFAULT_EVENT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """The latest events as dicts, oldest first; older ones are read with `event_log.page`."""
+        return [record.to_dict() for record in self.event_log.recent(limit)]
     
-    def shuffle_turns(self):
+    async def shuffle_turns(self):
         """
         Used to set up turn order (using AI).
         """
@@ -99,11 +185,11 @@ Create a new turn order for the characters involved in the scene. The order shou
 </GOAL>
 
 <CONTEXT>
-{self.get_actual_context()}
+{self.get_actual_context(call_site=CallSite.TURN_ORDER)}
 </CONTEXT>
 
 <CHARACTERS_IN_SCENE>
-{json.dumps(self.turn_order)}
+{json.dumps([entry.name for entry in self.turn_order], ensure_ascii=False)}
 </CHARACTERS_IN_SCENE>
 
 <HEURISTICS_FOR_DETERMINING_TURN_ORDER>
@@ -117,18 +203,66 @@ Create a new turn order for the characters involved in the scene. The order shou
 Based on the context and heuristics, generate a JSON object that conforms to the `TurnList` model. The `turn_list` field should contain the names of the characters in the new logical order. The `reasoning` field should briefly explain your logic.
 </TASK>
 """
-        new_turns : TurnList = self.classifier.generate(
+        new_turns : TurnList = await self.classifier.generate_async(
             contents=prompt,
             pydantic_model=TurnList,
+            call_site=CallSite.TURN_ORDER
         ) # type: ignore
         print(f"Raw turn shuffle result:{DEBUG_COLOR} {new_turns.turn_list}{Colors.RESET}")
         print(f"Reasoning : {new_turns.reasoning}") # type: ignore
         verify_turns = []
         for char in new_turns.turn_list:
-            verify_turns.append(find_closest_match(char, self.turn_order))
+            verify_turns.append(self.characters.find_entry(char))
         self.turn_order = verify_turns
         
     
+    async def patch_object(self, obj: BaseModel, object_type: str, changes_to_make: str, rules: str, protected: tuple = ()) -> Optional[BaseModel]:
+        """
+        Asks the model for a compact list of patch operations and applies them locally.
+        Returns the patched copy of `obj`, or None if the patch could not be applied
+        (the caller then falls back to regenerating the whole object).
+        """
+        prompt = f"""
+<ROLE>
+You are a meticulous D&D Game State Engine. You receive the current JSON data of a {object_type} and a description of relative changes, and output ONLY the JSON-Patch style operations that apply these changes.
+</ROLE>
+
+<GAME_RULES>
+{rules}
+</GAME_RULES>
+
+<{object_type.upper()}_DATA>
+{obj.model_dump_json()}
+</{object_type.upper()}_DATA>
+
+<CHANGES_TO_APPLY>
+{changes_to_make}
+</CHANGES_TO_APPLY>
+
+<OUTPUT_INSTRUCTIONS>
+Paths are JSON Pointers into the data above. Values are absolute: to deal 5 damage to a character with current_hp 12, replace '/current_hp' with 7.
+Fields that are not affected by the changes MUST NOT appear in any operation.
+</OUTPUT_INSTRUCTIONS>
+"""
+        try:
+            patch: StatePatch = await self.generator.generate_async(
+                pydantic_model=StatePatch,
+                prompt=prompt,
+                language=self.language,
+                call_site=CallSite.STATE_UPDATE
+            )
+            patched, paths = apply_patch(obj, patch.operations, protected)
+        except (PatchError, ValueError) as e:
+            print(f"{WARNING_COLOR}Patch update of {object_type} failed, regenerating it instead:{Colors.RESET} {e}")
+            self.log_event("state_patch_failure", object_type=object_type, error=str(e))
+            return None
+
+        if isinstance(patched, Character):
+            patched = enforce_character_rules(patched)
+        print(f"{Colors.DIM}Patched {object_type}: {', '.join(paths) or 'no changes'}{Colors.RESET}")
+        self.log_event("state_patch_applied", object_type=object_type, paths=paths)
+        return patched
+
     async def update_scene(self, scene_name: str, changes_to_make: str):
         """
         Updates the current scene with the provided changes.
@@ -138,11 +272,17 @@ Based on the context and heuristics, generate a JSON object that conforms to the
         """
         print(f"\n{ENTITY_COLOR}{scene_name}{Colors.RESET} {INFO_COLOR}updates attributes with:{Colors.RESET} {changes_to_make}")
         try:
-            original_scene_json = self.scene.model_dump_json(indent=2) # type: ignore
-            self.log_event("scene_update_start", scene_name=scene_name, changes=changes_to_make, original_scene=original_scene_json)
-            
-            # Create a prompt that instructs the LLM to modify the scene based on relative changes
-            prompt = f"""
+            scene = self.scene
+            self.log_event("scene_update_start", scene_name=scene_name, changes=changes_to_make)
+
+            updated_scene = None
+            if self.state_update_mode == "patch":
+                updated_scene = await self.patch_object(scene, "scene", changes_to_make, SCENE_PATCH_RULES) # type: ignore
+
+            if updated_scene is None:
+                # Create a prompt that instructs the LLM to modify the scene based on relative changes
+                original_scene_json = scene.model_dump_json(indent=2) # type: ignore
+                prompt = f"""
 <ROLE>
 You are a meticulous D&D Game State Engine. Your task is to receive the current JSON data of a scene and a description of relative changes, then output a new, updated JSON object for that scene.
 </ROLE>
@@ -167,15 +307,17 @@ Update the following scene's data based on the described changes.
 Your response must be ONLY the complete, updated JSON object for the scene. Do not include any explanations, markdown formatting, or any other text outside of the final JSON structure.
 </OUTPUT_INSTRUCTIONS>
 """
-
-            self.scene = self.generator.generate(
-                pydantic_model=Scene,
-                prompt=prompt,
-                language=self.language
-            )
+                updated_scene = await self.generator.generate_async(
+                    pydantic_model=Scene,
+                    prompt=prompt,
+                    language=self.language,
+                    call_site=CallSite.STATE_UPDATE
+                )
+            self.scene = updated_scene
             
             update_log = f"<SCENE_UPDATE>\n<NAME>{scene_name}</NAME>\n<CHANGES>{changes_to_make}</CHANGES>\n</SCENE_UPDATE>"
             self.context += f"\n{update_log}\n"
+            self.history.add("scene_update", f"{scene_name}: {changes_to_make}")
             self.log_event("scene_update_success", scene_name=scene_name, changes=changes_to_make)
             
             print(f"{SUCCESS_COLOR} Scene updated successfully!{Colors.RESET}")
@@ -193,16 +335,19 @@ Your response must be ONLY the complete, updated JSON object for the scene. Do n
         """
         print(f"\n{ENTITY_COLOR}{character_name}{Colors.RESET} {INFO_COLOR}updates attributes with:{Colors.RESET} {changes_to_make}")
         try:        
-            char_name_list = [char.name for char in self.characters]
-            char_dict = {char.name: char for char in self.characters}
-            
-            target_char_name = find_closest_match(character_name, char_name_list)
-            character = char_dict[target_char_name]
-            # Convert the current character object to a JSON string for clean input to the LLM
-            character_json = character.model_dump_json(indent=2)
-            self.log_event("character_update_start", character_name=character_name, changes=changes_to_make, original_character=character.model_dump())
-
-            prompt = f"""
+            character = self.characters.find(character_name)
+            self.log_event("character_update_start", character_name=character_name, changes=changes_to_make)
+
+            # Plain mechanical changes (damage, healing, AC, conditions) never reach the LLM
+            updated_character = self.rules_engine.apply(character, changes_to_make)
+            if updated_character is None and self.state_update_mode == "patch":
+                # The name is the character's identity (turn order, lookups): patches never rename
+                updated_character = await self.patch_object(character, "character", changes_to_make, CHARACTER_PATCH_RULES, protected=("name",))
+
+            if updated_character is None:
+                # Convert the current character object to a JSON string for clean input to the LLM
+                character_json = character.model_dump_json(indent=2)
+                prompt = f"""
 <ROLE>
 You are a meticulous D&D Game State Engine. Your task is to receive the current JSON data of a character and a description of relative changes, then output a new, updated JSON object for that character. You must follow the game rules precisely and only output the final JSON.
 </ROLE>
@@ -236,19 +381,18 @@ Update the following character's data based on the described changes.
 Your response must be ONLY the complete, updated JSON object for the character. Do not include any explanations, markdown formatting, or any other text outside of the final JSON structure.
 </OUTPUT_INSTRUCTIONS>
     """
-            
-            if character:
-                self.characters.remove(character) 
-            
-            updated_character = self.generator.generate(
-                pydantic_model=Character,
-                prompt=prompt,
-                language=self.language
-            )
-            self.characters.append(updated_character)
+                updated_character = await self.generator.generate_async(
+                    pydantic_model=Character,
+                    prompt=prompt,
+                    language=self.language,
+                    call_site=CallSite.STATE_UPDATE
+                )
+            # Replaced in place so the character keeps its position and its turn
+            self.characters.replace(character, updated_character)
             
             update_log = f"<CHARACTER_UPDATE>\n<NAME>{character_name}</NAME>\n<CHANGES>{changes_to_make}</CHANGES>\n</CHARACTER_UPDATE>"
             self.context += f"\n{update_log}\n"
+            self.history.add("character_update", f"{character_name}: {changes_to_make}")
             self.log_event("character_update_success", character_name=character_name, changes=changes_to_make)
             
             print(f"{SUCCESS_COLOR} Character '{updated_character.name}' updated successfully!{Colors.RESET}")
@@ -261,12 +405,87 @@ Your response must be ONLY the complete, updated JSON object for the character.
         except Exception as e:
             print(f"{ERROR_COLOR} Error updating character: {e}{Colors.RESET}")
             self.log_event("character_update_failure", character_name=character_name, error=str(e))
-            # Optionally re-add the original character on any failure
-            if 'character' in locals() and character not in self.characters: # type: ignore
-                self.characters.append(character) # type: ignore
             raise e
             
-    def generate_scene(self, scene_prompt: Optional[NextScene] = None):
+    def group_changes(self, changes: List[ChangesToMake]) -> List[Tuple[str, str, List[str]]]:
+        """
+        Groups changes by target object, in first-seen order, as (object type, object name, descriptions).
+        Character names are matched against the cast so spelling variants land in the same group.
+        """
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for change in changes:
+            if change.object_type == "character":
+                name = self.characters.find(change.object_name).name if len(self.characters) else change.object_name
+            elif change.object_type == "scene":
+                name = self.scene.name if self.scene else change.object_name
+            else:
+                continue
+            description = describe_change(change)
+            if description:
+                groups.setdefault((change.object_type, name), []).append(description)
+        return [(object_type, name, descriptions) for (object_type, name), descriptions in groups.items()]
+
+    async def apply_changes(self, changes: List[ChangesToMake], step: str = "apply_changes", alert_prefix: str = "", report_progress: bool = True, raise_errors: bool = True):
+        """
+        Applies structural changes with one update request per target object; different
+        objects are updated concurrently. Yields progress and alert events per applied object.
+
+        :param step: Name of the step for degradation reports and logs.
+        :param raise_errors: Re-raise the first failure once all updates finished, otherwise only log it.
+        """
+        groups = self.group_changes(changes)
+        if not groups:
+            return
+
+        async def apply_group(object_type: str, name: str, descriptions: List[str]) -> Tuple[str, str]:
+            if len(descriptions) == 1:
+                changes_to_make = descriptions[0]
+            else:
+                changes_to_make = "\n".join(f"{i}. {description}" for i, description in enumerate(descriptions, 1))
+            if object_type == "character":
+                await self.update_character(name, changes_to_make)
+            else:
+                await self.update_scene(name, changes_to_make)
+            return name, "; ".join(descriptions)
+
+        if len(changes) > len(groups):
+            print(f"{INFO_COLOR}Coalesced {len(changes)} changes into {len(groups)} object updates{Colors.RESET}")
+        tasks = [asyncio.ensure_future(apply_group(*group)) for group in groups]
+        applied = 0
+        budget_error: Optional[BudgetExhausted] = None
+        errors: List[Exception] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    name, description = await next_done
+                except BudgetExhausted as e:
+                    budget_error = e
+                    continue
+                except Exception as e:
+                    print(f"{ERROR_COLOR}Failed to apply changes ({step}): {e}{Colors.RESET}")
+                    self.log_event("change_group_failed", step=step, error=str(e))
+                    errors.append(e)
+                    continue
+
+                applied += 1
+                if report_progress:
+                    yield EventBuilder.state_update_required(
+                        update=f"{name} был обновлен ({description})",
+                        total=len(groups),
+                        current=applied
+                    )
+                yield EventBuilder.alert(f"{alert_prefix}{name}: {description}", inspect.currentframe().f_code.co_name) # type: ignore
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if budget_error:
+            self.degrade(step, budget_error)
+            self.context += f"<ACTION_OUTCOMES>{len(groups) - applied} of {len(groups)} object updates were not applied (out of time).</ACTION_OUTCOMES>"
+        if errors and raise_errors:
+            raise errors[0]
+
+    async def generate_scene(self, scene_prompt: Optional[NextScene] = None):
         # If this is the very first scene generation, use the story's starting info.
         if self.scene is None:
             current_plot = self.story_manager.get_current_plot_point()
@@ -287,141 +506,101 @@ Your response must be ONLY the complete, updated JSON object for the character.
                 The initial objective is not clear, so create a scene of arrival with an air of mystery.
                 The scene should be mysterious and engaging, drawing the players into the world.
                 """
-            scene_d : NextScene = self.classifier.generate(prompt, NextScene) # type: ignore
+            scene_d : NextScene = await self.classifier.generate_async(prompt, NextScene, call_site=CallSite.SCENE_GENERATION) # type: ignore
         elif scene_prompt is None:
-            scene_d : NextScene = self.classifier.generate(
+            scene_d : NextScene = await self.classifier.generate_async(
                 f"Generate a scene description and difficulty based on the context: {self.context}",
-                NextScene
+                NextScene,
+                call_site=CallSite.SCENE_GENERATION
             ) # type: ignore
         else:
             scene_d : NextScene = scene_prompt
 
-        self.scene = self.generator.generate(
+        self.scene = await self.generator.generate_async(
             pydantic_model=Scene,
             prompt=str(scene_d.scene_description), # type: ignore
             context=self.context,
-            language=self.language
+            language=self.language,
+            call_site=CallSite.SCENE_GENERATION
         )
         
         if scene_d.new_characters:
-            for character in scene_d.new_characters:
-                print(f"(generate_scene) New character {character}")
-                self.add_character(
-                    self.generator.generate(Character, character) 
-                )
+            print(f"(generate_scene) New characters {scene_d.new_characters}")
+            # One request for the whole cast instead of a round-trip per character
+            new_characters = await self.generator.generate_many_async(Character, scene_d.new_characters, call_site=CallSite.CHARACTER_GENERATION)
+            for character in new_characters:
+                self.add_character(character)
 
         print(f"\n{SUCCESS_COLOR}Generated Scene:{Colors.RESET} {ENTITY_COLOR}{self.scene.name}{Colors.RESET}")
         print(f"{INFO_COLOR} Difficulty: {scene_d.scene_difficulty}{Colors.RESET}") # type: ignore
         print(f"{INFO_COLOR} Description:{Colors.RESET} {self.scene.description}")
         self.log_event("scene_generated", scene_name=self.scene.name, description=self.scene.description, difficulty=scene_d.scene_difficulty) # type: ignore
+        self.history.add("scene", f"{self.scene.name}: {self.scene.description}") # type: ignore
         self.image_generator.submit_generation_task(self.scene.description , self.scene.name, generation_type="SCENE")
 
 
-    def setup_fight(self):
+    async def setup_fight(self):
         """
         Initializes the fight by generating objects and their actions based on the context.
         """
+        # Speculations from an earlier fight were made for a turn order that is about to be rebuilt
+        self.npc_prefetcher.discard()
         self.game_mode = GameMode.COMBAT
         print(f"\n{HEADER_COLOR} Generating Scene...{Colors.RESET}")
         
         
-        # Here i remove unnecessary parts from the context to reduce memory usage
-        self.context = self.classifier.general_text_llm_request(
-        f"""
-            Provide the details that matter for the next scene. 
-            Store which characters are allied with which ones and what can change this alliance. Store their motivations and goals.
-            Dont ask additional information.
-            Imagine where all the players should be located in the scene. Dont analyze characters at all.
-            Give more attention to the script and story and less to the scene and characters details.
-            IMPORTANT: Keep your response maximum {MAX_CONTEXT_LENGTH} words.
-            ---
-            <Context>
-            {self.get_actual_context()}
-            </Context>
-        """
-        )
+        # Here i remove unnecessary parts from the context to reduce memory usage (in the background)
+        self.summarizer.schedule(force=True, instructions=FIGHT_SUMMARY_INSTRUCTIONS, call_site=CallSite.FIGHT_SETUP)
         
-        self.turn_order = [char.name for char in self.characters]
+        self.turn_order = list(self.characters.entries)
         # random.shuffle(self.turn_order)
-        self.shuffle_turns()
+        await self.shuffle_turns()
         print(f"{INFO_COLOR}Turn order shuffled{Colors.RESET}")
         
         
     def move_to_next_turn(self):
         self.current_turn = (self.current_turn + 1) % len(self.turn_order) # type: ignore
 
+    def prefetch_next_NPC_action(self):
+        """
+        Starts choosing the action of the character after the active one in the background,
+        if it is an NPC (see NPCActionPrefetcher).
+        """
+        if self.game_mode == GameMode.COMBAT and len(self.turn_order) > 1:
+            self.npc_prefetcher.start(self.turn_order[(self.current_turn + 1) % len(self.turn_order)])
+
     def get_active_character_name(self) -> str:
-        return self.turn_order[self.current_turn] # type: ignore
+        return self.turn_order[self.current_turn].name
 
-    def get_active_character(self) -> Character: # type: ignore
-        for character in self.characters:
-            if character.name == self.get_active_character_name():
-                return character
+    def get_active_character(self) -> Character:
+        return self.turn_order[self.current_turn].character
 
-    def get_actual_context(self, active_character_name = None) -> str:
+    def get_turn_order_names(self) -> List[str]:
+        return [entry.name for entry in self.turn_order]
+
+    def get_actual_context(self, active_character_name = None, call_site: CallSite = CallSite.DEFAULT, focus: Iterable[str] = ()) -> str:
         """
         Generates a comprehensive and clearly structured JSON string representing the current game state.
         An optional active_character_name can be provided to mark who is currently acting.
+        `call_site` selects the context projection (see CONTEXT_PROJECTIONS); `focus` names the
+        characters (or "scene") the prompt is about.
+        Serialized characters, scene and events are cached in `self.state` until they change.
         """
-        all_characters_data = []
-        for char in self.characters:
-            char_data = char.model_dump()
-            # Mark the active character if one is specified
-            if active_character_name and char.name == active_character_name:
-                char_data['is_currently_acting'] = True
-            else:
-                char_data['is_currently_acting'] = False
-            all_characters_data.append(char_data)
-
-        # NEW: Include the last 10 events for short-term memory
-        recent_events = self.event_log[-10:]
-
-        context_dict = {
-            "game_state": {
-                "summary_of_past_events": self.context,
-                "recent_events": recent_events,  # <-- ADDED
-                "current_scene": self.scene.model_dump() if self.scene else "No scene is currently active.",
-                "participants": {
-                    "description": "A list of all characters currently in the scene.",
-                    "characters": all_characters_data
-                }
-            },
-            "global_story_context": self.story_manager.get_current_plot_context()
-        }
-
-        return f"<CONTEXT_DATA>\n{json.dumps(str(context_dict), indent=2, ensure_ascii=False)}\n</CONTEXT_DATA>"
-    
-    def trim_context(self):
-        print(f"\n{DEBUG_COLOR}Context trimming...{Colors.RED} {len(self.context)} chars of context {Colors.RESET}") # type: ignore
-        print(f"{Colors.RED}context before{self.context}")
-        self.context = self.classifier.general_text_llm_request(
-            f"""
-<ROLE>
-Ты — ассистент Мастера Игры. Твоя задача — сжать длинную историю в краткую, но информативную сводку для следующей сцены.
-</ROLE>
-
-<FULL_CONTEXT>
-{self.get_actual_context()}
-</FULL_CONTEXT>
-
-<TASK>
-<TASK>
-Создай новую сводку (не более {MAX_CONTEXT_LENGTH} слов), которая сохраняет только самую важную информацию для предстоящей сцены. Обязательно включи в нее:
-1.  **Расположение персонажей:** Проанализируй и кратко опиши, где находятся все персонажи в текущей сцене.
-2.  **Основная цель:** Какова главная цель группы авантюристов в данный момент?
-3.  **Основная цель врагов:** Какова главная цель их противников?
-4.  **Ключевые отношения:** Какие союзы или конфликты существуют между персонажами?
-5.  **Важные детали прошлого:** Упомяни 1-2 самых важных события из прошлого, которые напрямую влияют на текущую мотивацию персонажей.
-6.  **Намерение DM:** Если в тексте есть намеки на будущие события или секреты от Мастера, сохрани их.
-
-Не включай в сводку нерелевантные детали или описания уже прошедших действий, если они не влияют на будущее.
-</TASK>
-</TASK>
-"""
+        return self.state.render(
+            summary=self.context,
+            event_log=self.event_log,
+            scene=self.scene,
+            characters=self.characters,
+            active_character_name=active_character_name,
+            story_context=self.story_manager.get_current_plot_context(),
+            projection=CONTEXT_PROJECTIONS.get(call_site, FULL_PROJECTION),
+            focus=focus
         )
-        print(f"{Colors.GREEN}context after{self.context} {Colors.RESET}")
-        
 
+    def get_changed_objects(self, changes: List[ChangesToMake]) -> List[str]:
+        """Names of the characters touched by `changes`, plus "scene" if the scene is."""
+        return [name if object_type == "character" else "scene" for object_type, name, _ in self.group_changes(changes)]
+    
     async def process_interaction(self, character: Character, interaction: str):
         """
         Processes a character's interaction, deciding the outcome of actions and questions.
@@ -431,10 +610,10 @@ Your response must be ONLY the complete, updated JSON object for the character.
             # return self.askedDM(character, interaction), False
             pass
 
-        # Get the full game context to help the AI make a better decision
-        context = self.get_actual_context(active_character_name=character.name)
+        # Recent events, names and the acting character are enough to route the request
+        context = self.get_actual_context(active_character_name=character.name, call_site=CallSite.INTENT_CLASSIFICATION)
 
-        user_request: UserRequest = self.classifier.generate(
+        user_request: UserRequest = await self.classifier.generate_async(
             contents=f"""
 <ROLE>
 You are an intelligent request router for a D&D game. Your task is to analyze a player's request in the context of recent events and classify it as either an in-game character action OR a meta-question to the Dungeon Master.
@@ -462,7 +641,7 @@ Analyze the player's request below, using the provided game context. Your goal i
 </CATEGORY_DEFINITIONS>
 
 <CONTEXT_FOR_DECISION>
-{self.get_actual_context()}
+{context}
 </CONTEXT_FOR_DECISION>
 
 <PLAYER_REQUEST_TO_CLASSIFY>
@@ -473,7 +652,9 @@ Analyze the player's request below, using the provided game context. Your goal i
 Provide your response as a single JSON object matching the `UserRequest` model, with no other text.
 </OUTPUT_INSTRUCTIONS>
 """,
-            pydantic_model=UserRequest
+            pydantic_model=UserRequest,
+            priority=LLMPriority.INTERACTIVE,
+            call_site=CallSite.INTENT_CLASSIFICATION
         ) # type: ignore
         
         return self.process_player_input(character, user_request), user_request.request_type == "action"
@@ -484,13 +665,51 @@ Provide your response as a single JSON object matching the `UserRequest` model,
         """
         print(f"\n{ENTITY_COLOR}{character.name}{Colors.RESET} {INFO_COLOR}performs action:{Colors.RESET} {user_request.text}")
         self.log_event("action_start", character_name=character.name, action_text=user_request.text, is_npc=is_NPC)
+        # The narrative is indexed as a DM message when the game sends it
+        self.history.add("action", f"{character.name}: {user_request.text}")
 
-        # Use a generator that can directly output a Pydantic object
-        outcome: ActionOutcome = self.generator.generate(
-            pydantic_model=ActionOutcome,
-            prompt=self.prompter.get_process_player_input_prompt(self, character, user_request, is_NPC),
-            language=self.language
-        )
+        prompt = self.prompter.get_process_player_input_prompt(self, character, user_request, is_NPC)
+        message_id = None
+        narrative_sent = False
+        try:
+            if self.stream_narration:
+                # Narrative chunks go out as they are generated; the finished narrative is sent
+                # as soon as its field closes, before the structural changes have arrived
+                message_id = str(uuid.uuid4())
+                outcome = None
+                async for kind, payload in self.generator.generate_streaming_async(
+                    pydantic_model=ActionOutcome,
+                    prompt=prompt,
+                    language=self.language,
+                    stream_field="narrative_description",
+                    priority=LLMPriority.INTERACTIVE,
+                    call_site=CallSite.ACTION_OUTCOME
+                ):
+                    if kind == "text":
+                        yield EventBuilder.DM_message_chunk(payload, message_id)
+                    elif kind == "field":
+                        field_name, value = payload
+                        if field_name == "narrative_description" and isinstance(value, str):
+                            narrative_sent = True
+                            yield EventBuilder.DM_message(value, message_id)
+                    else:
+                        outcome = payload
+            else:
+                # Use a generator that can directly output a Pydantic object
+                outcome: ActionOutcome = await self.generator.generate_async(
+                    pydantic_model=ActionOutcome,
+                    prompt=prompt,
+                    language=self.language,
+                    priority=LLMPriority.INTERACTIVE,
+                    call_site=CallSite.ACTION_OUTCOME
+                )
+        except BudgetExhausted as e:
+            # Degraded outcome: the action is not resolved, the turn ends without changes
+            self.degrade("action_outcome", e)
+            self.context += f"\n<ACTION_FAILURE>Action by {character.name} ('{user_request.text}') could not be resolved in time. No changes were made.</ACTION_FAILURE>\n"
+            yield EventBuilder.alert("Мастер не успел обработать действие, попробуйте ещё раз.", inspect.currentframe().f_code.co_name) # type: ignore
+            yield EventBuilder.end_of_turn()
+            return
 
         narrative = outcome.narrative_description
         changes = outcome.structural_changes
@@ -500,30 +719,18 @@ Provide your response as a single JSON object matching the `UserRequest` model,
         # The rest of the a
         action_summary = f"Action by {character.name}: '{user_request.text}'. Outcome: {narrative}"
         self.context += f"\n\n<ACTION_LOG>\n{action_summary}\n</ACTION_LOG>\n"
-        yield EventBuilder.DM_message(narrative) # type: ignore
+        if not narrative_sent:
+            yield EventBuilder.DM_message(narrative, message_id) # type: ignore
 
         if is_NPC: outcome.is_legal = True
         
         if outcome.is_legal:
             if changes:
-                for i, change in enumerate(changes, 1):
-                    if change.object_type == "character":
-                        await self.update_character(change.object_name, change.changes)
-                    elif change.object_type == "scene":
-                        await self.update_scene(change.object_name, change.changes)
-                        
-                    yield EventBuilder.state_update_required(
-                        update=f"{change.object_name} был обновлен ({change.changes})",
-                        total=len(changes), 
-                        current=i
-                    )
-                    yield EventBuilder.alert(f"{change.object_name}: {change.changes}", inspect.currentframe().f_code.co_name) # type: ignore
+                async for event in self.apply_changes(changes):
+                    yield event
             else:
                 self.context += "<ACTION_OUTCOMES>No structural changes occurred.</ACTION_OUTCOMES>"
             
-            async for event in self.audit_action_application(outcome):
-                yield event
-
             print(f"{SUCCESS_COLOR}All changes applied successfully{Colors.RESET}")    
             async for value in self.after_action(outcome):
                 yield value
@@ -531,40 +738,38 @@ Provide your response as a single JSON object matching the `UserRequest` model,
             self.context += f"\n<ACTION_FAILURE>Action by {character.name} ('{user_request.text}') was deemed illegal. No changes were made.</ACTION_FAILURE>\n"
             yield EventBuilder.alert("Impossible to act...", inspect.currentframe().f_code.co_name) # type: ignore
 
-    async def audit_action_application(self, outcome: ActionOutcome):
+    async def audit_action_application(self, prompt: str) -> List[ChangesToMake]:
         """
-        Audits the result of an action, finds discrepancies, and applies corrections.
+        Audits the result of an action and returns the corrections it needs (not applied yet).
+        `prompt` is the audit prompt rendered from the state right after the action's changes.
         """
-        print(f"\n{INFO_COLOR}Auditing application of action: {outcome.narrative_description[:50]}...{Colors.RESET}")
-
-        prompt = self.prompter.get_audit_prompt(self, outcome)
-
-        
-        correction_wrapper = self.generator.generate(
-            pydantic_model=CorrectionList,
-            prompt=prompt,
-            language=self.language
-        )
+        try:
+            correction_wrapper = await self.generator.generate_async(
+                pydantic_model=CorrectionList,
+                prompt=prompt,
+                language=self.language,
+                priority=LLMPriority.BACKGROUND,
+                call_site=CallSite.AUDIT
+            )
+        except Exception as e:
+            # The audit is a safety net; the turn goes on without it
+            self.degrade("audit", e)
+            return []
 
         corrections = correction_wrapper.corrections
-
         if not corrections:
             print(f"{SUCCESS_COLOR}Audit passed. No corrections needed.{Colors.RESET}")
-            return
+        else:
+            print(f"{WARNING_COLOR}Audit found {len(corrections)} discrepancies.{Colors.RESET}")
+            self.log_event("audit_found_discrepancies", count=len(corrections), corrections=corrections)
+        return corrections
 
-        print(f"{WARNING_COLOR}Audit found {len(corrections)} discrepancies. Applying corrections...{Colors.RESET}")
-        self.log_event("audit_found_discrepancies", count=len(corrections), corrections=corrections)
-
-        for change in corrections:
-            try:
-                if change.object_type == "character":
-                    await self.update_character(change.object_name, change.changes)
-                elif change.object_type == "scene":
-                    await self.update_scene(change.object_name, change.changes)
-                yield EventBuilder.alert(f"AUDIT CORRECTION: {change.object_name}: {change.changes}", inspect.currentframe().f_code.co_name) # type: ignore
-            except Exception as e:
-                print(f"{ERROR_COLOR}Failed to apply audit correction: {e}{Colors.RESET}")
-                self.log_event("audit_correction_failed", error=str(e), change=change)
+    async def apply_audit_corrections(self, corrections: List[ChangesToMake]):
+        if not corrections:
+            return
+        print(f"{WARNING_COLOR}Applying {len(corrections)} audit corrections...{Colors.RESET}")
+        async for event in self.apply_changes(corrections, step="audit_corrections", alert_prefix="AUDIT CORRECTION: ", report_progress=False, raise_errors=False):
+            yield event
     
     def get_character_by_name(self, name: str) -> Character:
         """
@@ -574,12 +779,8 @@ Provide your response as a single JSON object matching the `UserRequest` model,
         :return: The Character object with the closest matching name.
         :raises Exception: If no character is found.
         """
-        char_name_list = [char.name for char in self.characters]
-        char_dict = {char.name: char for char in self.characters}
-        
         try:
-            target_char_name = find_closest_match(name, char_name_list)
-            return char_dict[target_char_name]
+            return self.characters.find(name)
         except ValueError as e:
             # Re-raise with a more specific message
             raise Exception(f"Character '{name}' not found. {e}")
@@ -593,27 +794,101 @@ Provide your response as a single JSON object matching the `UserRequest` model,
         return "\n".join(last_n_messages)
     
     
-    async def after_action(self, outcome: ActionOutcome):
+    async def analyze_after_action(self, prompt: str) -> Optional[AfterActionAnalysis]:
+        """
+        Gets the combined turn and narrative analysis (game mode, proactive world changes).
+        """
+        try:
+            return await self.generator.generate_async(
+                pydantic_model=AfterActionAnalysis,
+                prompt=prompt,
+                language="Russian",
+                call_site=CallSite.AFTER_ACTION
+            )
+        except Exception as e:
+            self.degrade("after_action_analysis", e)
+            return None
+
+    async def check_story_progress(self, context: str) -> Optional[StoryProgressionCheck]:
+        try:
+            return await self.story_manager.check_progress(context)
+        except Exception as e:
+            self.degrade("story_progression_check", e)
+            return None
+
+    def reconcile_post_action(self, corrections: List[ChangesToMake], analysis: Optional[AfterActionAnalysis]) -> List[ChangesToMake]:
         """
-        Analyzes the outcome of an action to determine game mode changes and proactive world events.
-        This combines the previous turn analysis and narrative analysis into a single LLM call.
+        Drops audit corrections made obsolete by the after-action analysis, which was computed
+        from the same snapshot: corrections to characters it removes, or to a scene it replaces.
         """
-        print(f"\n{HEADER_COLOR}Analyzing turn outcome...{Colors.RESET}")
+        if not corrections or analysis is None or analysis.recommended_mode != GameMode.NARRATIVE:
+            return corrections
+        removed = set()
+        scene_replaced = False
+        for change in analysis.proactive_world_changes:
+            if change.change_type == ProactiveChangeType.REMOVE_CHARACTER and isinstance(change.payload, str) and len(self.characters):
+                removed.add(self.characters.find(change.payload).name)
+            elif change.change_type == ProactiveChangeType.CHANGE_SCENE:
+                scene_replaced = True
+
+        kept = []
+        for correction in corrections:
+            if correction.object_type == "scene" and scene_replaced:
+                continue
+            if correction.object_type == "character" and len(self.characters) and self.characters.find(correction.object_name).name in removed:
+                continue
+            kept.append(correction)
+        if len(kept) < len(corrections):
+            print(f"{DEBUG_COLOR}Dropped {len(corrections) - len(kept)} audit corrections superseded by world changes{Colors.RESET}")
+            self.log_event("audit_corrections_superseded", count=len(corrections) - len(kept))
+        return kept
 
-        # 1. Get the combined analysis from the LLM
-        analysis: AfterActionAnalysis = self.generator.generate(
-            pydantic_model=AfterActionAnalysis,
-            prompt=self.prompter.get_after_action_analysis_prompt(self),
-            language="Russian"
+    async def after_action(self, outcome: ActionOutcome):
+        """
+        Audits the action's changes and analyzes its outcome (game mode changes, proactive world
+        events, story progression). The audit, the analysis and the story check run concurrently
+        on the state right after the action's changes; their results are reconciled and applied
+        in that order before the turn ends.
+        """
+        print(f"\n{HEADER_COLOR}Auditing and analyzing turn outcome...{Colors.RESET}")
+
+        # 1. Every stage's input is rendered before the first await, so all of them see the same state
+        audit_prompt = None if self.out_of_budget("audit") else self.prompter.get_audit_prompt(self, outcome)
+        analysis_prompt = None if self.out_of_budget("after_action_analysis") else self.prompter.get_after_action_analysis_prompt(self)
+        # The story check only matters in narrative mode; it is started speculatively if the turn is in it now
+        story_checked = self.game_mode == GameMode.NARRATIVE and not self.out_of_budget("story_progression_check")
+        story_context = self.context
+        plot_point_id = self.story_manager.story.current_plot_point_id
+
+        started = time.perf_counter()
+        corrections, analysis, progress = await asyncio.gather(
+            self.audit_action_application(audit_prompt) if audit_prompt else asyncio.sleep(0, result=[]),
+            self.analyze_after_action(analysis_prompt) if analysis_prompt else asyncio.sleep(0, result=None),
+            self.check_story_progress(story_context) if story_checked else asyncio.sleep(0, result=None),
         )
+        print(f"{TIME_COLOR}Post-action stages took {time.perf_counter() - started:.2f}s{Colors.RESET}")
+
+        # 2. Reconcile, then apply the audit corrections first: they fix the action's own changes
+        corrections = self.reconcile_post_action(corrections, analysis)
+        async for event in self.apply_audit_corrections(corrections):
+            yield event
+
+        if analysis is None:
+            # Degraded outcome: game mode stays as is, no proactive world changes this turn
+            self.story_manager.apply_progress(progress, plot_point_id)
+            self.summarizer.schedule()
+            yield EventBuilder.end_of_turn()
+            return
         print(f"{DEBUG_COLOR}Raw analysis: {analysis.model_dump_json(indent=2)}{Colors.RESET}")
 
-        # 2. Handle Game Mode Change
+        # 3. Handle Game Mode Change
         if self.game_mode != analysis.recommended_mode:
+            if self.game_mode == GameMode.COMBAT:
+                self.npc_prefetcher.discard()
             self.game_mode = analysis.recommended_mode
             yield EventBuilder.alert(f'Game mode changed to <span class="keyword">{self.game_mode.name}</span>', inspect.currentframe().f_code.co_name) # type: ignore
 
-        # 3. Process Proactive World Changes
+        # 4. Process Proactive World Changes
         if self.game_mode == GameMode.NARRATIVE:
             for change in analysis.proactive_world_changes:
                 try:
@@ -627,60 +902,61 @@ Provide your response as a single JSON object matching the `UserRequest` model,
                     if change_type in {ProactiveChangeType.ADD_OBJECT, ProactiveChangeType.UPDATE_OBJECT, ProactiveChangeType.REMOVE_OBJECT, ProactiveChangeType.UPDATE_SCENE, ProactiveChangeType.UPDATE_CHARACTER}:
                         if hasattr(payload, 'object_type') and hasattr(payload, 'object_name') and hasattr(payload, 'changes'):
                             if payload.object_type == "character": # type: ignore
-                                await self.update_character(payload.object_name, payload.changes) # type: ignore
+                                await self.update_character(payload.object_name, describe_change(payload)) # type: ignore
                             elif payload.object_type == "scene": # type: ignore
-                                await self.update_scene(payload.object_name, payload.changes) # type: ignore
-                            yield EventBuilder.alert(f"(narrative){payload.object_name}: {payload.changes}", inspect.currentframe().f_code.co_name) # type: ignore
+                                await self.update_scene(payload.object_name, describe_change(payload)) # type: ignore
+                            yield EventBuilder.alert(f"(narrative){payload.object_name}: {describe_change(payload)}", inspect.currentframe().f_code.co_name) # type: ignore
                         else:
                             raise TypeError(f"Invalid payload for {change_type}: {payload}")
 
                     elif change_type == ProactiveChangeType.ADD_CHARACTER:
-                        new_char = self.generate_character(change.description, self.context)
+                        new_char = await self.generate_character(change.description, self.context)
                         self.add_character(new_char)
                         yield EventBuilder.alert(f"(narrative) A new character, {new_char.name}, appears: {change.description}", inspect.currentframe().f_code.co_name) # type: ignore
 
                     elif change_type == ProactiveChangeType.REMOVE_CHARACTER:
                         if isinstance(payload, str):
                             char_to_remove = self.get_character_by_name(payload)
-                            self.characters.remove(char_to_remove)
+                            self.remove_character(char_to_remove)
                             yield EventBuilder.alert(f"(narrative){payload} was removed: {change.description}", inspect.currentframe().f_code.co_name) # type: ignore
                         else:
                             raise TypeError(f"REMOVE_CHARACTER payload must be a string, but got {type(payload)}")
 
                     elif change_type == ProactiveChangeType.CHANGE_SCENE:
                         if isinstance(payload, NextScene):
-                            self.generate_scene(payload)
+                            await self.generate_scene(payload)
                         else:
                             raise TypeError(f"CHANGE_SCENE payload must be a NextScene object, but got {type(payload)}")
                     
                     else:
                         print(f"{WARNING_COLOR}Unhandled proactive change type: {change_type}{Colors.RESET}")
 
+                except BudgetExhausted as e:
+                    self.degrade("proactive_world_changes", e)
+                    break
                 except Exception as e:
                     error_message = f"Error processing proactive change '{change.change_type}': {e}"
                     print(f"{ERROR_COLOR}{error_message}{Colors.RESET}")
                     yield EventBuilder.error(error_message)
                     continue
         
-            self.story_manager.check_and_advance(self.context)
-
-        # 4. End of Turn and Context Trimming
+            # The check ran on the pre-change snapshot; it is run now only if the turn just entered narrative mode
+            if not story_checked and not self.out_of_budget("story_progression_check"):
+                progress = await self.check_story_progress(self.context)
+            self.story_manager.apply_progress(progress, plot_point_id)
+
+        # 5. End of Turn; the context is summarized in the background
+        # Scheduled before the last event: the consumer may not resume the generator after it
+        self.summarizer.schedule()
         yield EventBuilder.end_of_turn()
-        if len(self.context) > MAX_CONTEXT_LENGTH_CHARS:
-            self.trim_context()
-            if self.context:
-                print(f"{SUCCESS_COLOR}Context updated{Colors.RESET}")
 
-    async def NPC_turn(self):
+    def get_NPC_action_choice_prompt(self, active_char: Character) -> str:
         """
-        Handles the npc's turn in the fight.
+        Prompt for choosing an NPC's next combat action (a short first-person phrase).
         """
-        active_char = self.get_active_character()
-        print(f"\n{HEADER_COLOR}NPC's turn: {active_char.name}{Colors.RESET}")
-        
-        context_with_active_char = self.get_actual_context(active_character_name=active_char.name)
+        context_with_active_char = self.get_actual_context(active_character_name=active_char.name, call_site=CallSite.NPC_ACTION)
         
-        NPC_action_prompt = f"""
+        return f"""
 <ROLE>
 Ты — тактический ИИ, управляющий неигровым персонажем (NPC) в бою в D&D.
 Твоя задача — выбрать наиболее логичное, тактически верное и соответствующее характеру действие для этого NPC на его ходу.
@@ -732,7 +1008,26 @@ Provide your response as a single JSON object matching the `UserRequest` model,
 
 Твой ответ:
 """
-        NPC_action = self.classifier.general_text_llm_request(NPC_action_prompt)
+
+    async def NPC_turn(self):
+        """
+        Handles the npc's turn in the fight.
+        """
+        active_entry = self.turn_order[self.current_turn]
+        active_char = active_entry.character
+        print(f"\n{HEADER_COLOR}NPC's turn: {active_char.name}{Colors.RESET}")
+
+        try:
+            # Usually chosen in the background while the previous turn was being resolved
+            NPC_action = await self.npc_prefetcher.take(active_entry)
+            if NPC_action is None:
+                NPC_action = await self.classifier.general_text_llm_request_async(self.get_NPC_action_choice_prompt(active_char), call_site=CallSite.NPC_ACTION)
+        except BudgetExhausted as e:
+            # Degraded outcome: the NPC loses its turn
+            self.degrade("NPC_action", e)
+            yield EventBuilder.alert(f"{active_char.name} медлит и пропускает ход.", inspect.currentframe().f_code.co_name) # type: ignore
+            yield EventBuilder.end_of_turn()
+            return
         user_request = UserRequest(request_type=RequestType.ACTION, text=NPC_action)
         async for value in self.process_player_input(self.get_active_character(), user_request, is_NPC=True):
             yield value
@@ -0,0 +1,117 @@
+# character_registry.py
+
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from models.schemas import Character
+
+
+class CharacterEntry:
+    """
+    Stable reference to a cast member. Updates replace the Character object but keep
+    the entry, so turn order and other references stay valid.
+    """
+    def __init__(self, character: Character):
+        self.character = character
+
+    @property
+    def name(self) -> str:
+        return self.character.name
+
+    def __repr__(self) -> str:
+        return f"CharacterEntry({self.name!r})"
+
+
+class CharacterRegistry:
+    """
+    The cast of a chapter, in order, with an exact-name index and a cached fuzzy-name index.
+
+    Behaves like the list of characters it replaces (iteration, len, indexing), while
+    name lookups are O(1) for exact names and reuse preprocessed names for fuzzy matches.
+    The indexes are rebuilt lazily after add, remove, replace or `reindex`.
+    """
+    def __init__(self, characters: Iterable[Character] = ()):
+        self.entries: List[CharacterEntry] = [CharacterEntry(character) for character in characters]
+        self._by_name: Optional[Dict[str, CharacterEntry]] = None
+        self._fuzzy_choices: Optional[List[str]] = None
+
+    def _index(self) -> Dict[str, CharacterEntry]:
+        if self._by_name is None:
+            self._by_name = {}
+            for entry in self.entries:
+                self._by_name.setdefault(entry.name, entry)
+                self._by_name.setdefault(default_process(entry.name), entry)
+            # Same order as self.entries, so a fuzzy match's index is the entry's index
+            self._fuzzy_choices = [default_process(entry.name) for entry in self.entries]
+        return self._by_name
+
+    def reindex(self):
+        """Drops the name indexes; call after renaming a character in place."""
+        self._by_name = None
+        self._fuzzy_choices = None
+
+    def __iter__(self) -> Iterator[Character]:
+        return (entry.character for entry in self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, index: int) -> Character:
+        return self.entries[index].character
+
+    def __contains__(self, character: Character) -> bool:
+        return any(entry.character is character for entry in self.entries)
+
+    def names(self) -> List[str]:
+        return [entry.name for entry in self.entries]
+
+    def entry_of(self, character: Character) -> CharacterEntry:
+        for entry in self.entries:
+            if entry.character is character:
+                return entry
+        raise ValueError(f"Character '{character.name}' is not in the registry")
+
+    def add(self, character: Character) -> CharacterEntry:
+        entry = CharacterEntry(character)
+        self.entries.append(entry)
+        self.reindex()
+        return entry
+
+    def remove(self, character: Character) -> CharacterEntry:
+        entry = self.entry_of(character)
+        self.entries.remove(entry)
+        self.reindex()
+        return entry
+
+    def replace(self, character: Character, updated: Character) -> CharacterEntry:
+        """Puts `updated` in place of `character`, keeping its entry and position."""
+        entry = self.entry_of(character)
+        entry.character = updated
+        if updated.name != character.name:
+            self.reindex()
+        return entry
+
+    def find_entry(self, name: str) -> CharacterEntry:
+        """
+        The entry whose name matches `name` exactly (also after normalization), otherwise the closest one.
+
+        Raises:
+            ValueError: If the registry is empty.
+        """
+        if not self.entries:
+            raise ValueError("No choices provided. (options are not close enough)")
+        index = self._index()
+        entry = index.get(name)
+        if entry is not None:
+            return entry
+        query = default_process(name)
+        entry = index.get(query)
+        if entry is not None:
+            return entry
+        _, _, position = process.extractOne(query, self._fuzzy_choices, scorer=fuzz.WRatio, processor=None)  # type: ignore
+        return self.entries[position]
+
+    def find(self, name: str) -> Character:
+        return self.find_entry(name).character
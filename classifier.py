@@ -1,10 +1,12 @@
 import os
 from dotenv import load_dotenv
-from google import genai
-from pydantic import BaseModel
-from typing import Type, TypeVar, Optional
+from pydantic import BaseModel, TypeAdapter
+from typing import Any, Type, TypeVar, Optional
 from pydantic import BaseModel
 from global_defines import *
+from llm_clients import LLMClientRegistry, get_llm_registry
+from llm_scheduler import LLMPriority
+from llm_routing import CallSite, Route
 
 from models import *
 
@@ -15,49 +17,120 @@ class Classifier:
     """
     Uses gemini AI model to generate objects of type [T] (pydantic schema) based on the input text.
     """
-    def __init__(self):
-        self.client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-        self.model = os.getenv("GEMINI_MODEL_DUMB")
-        
-    def generate(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json"):
+    def __init__(self, model: Optional[str] = None, registry: Optional[LLMClientRegistry] = None):
+        self.registry = registry or get_llm_registry()
+        self.client = self.registry.get_client()
+        self.model = model or self.registry.default_model
+        self.cache = self.registry.response_cache
+        self.single_flight = self.registry.single_flight
+        self.resilience = self.registry.resilience
+        self.router = self.registry.router
+
+    def _from_cache(self, cache_key: str, schema: Any):
+        """
+        Returns the cached response for `cache_key` parsed into `schema`, or None on a miss.
+        """
+        return self._parse_cached(self.cache.get(cache_key), schema)
+
+    def _parse_cached(self, cached_text: Optional[str], schema: Any):
+        if cached_text is None:
+            return None
+        print(f"{SUCCESS_COLOR}Cache hit{Colors.RESET} for model: {ENTITY_COLOR}{self.model}{Colors.RESET}")
+        return TypeAdapter(schema).validate_json(cached_text)
+
+    @staticmethod
+    def _config(route: Route, response_mime_type: str, schema: Any = None) -> dict:
+        config = dict(route.generation_config)
+        config["response_mime_type"] = response_mime_type
+        if schema is not None:
+            config["response_schema"] = schema
+        return config
+
+    def _request_structured(self, contents: str, schema: Any, response_mime_type: str, call_site: CallSite):
+        route = self.router.resolve(call_site, self.model)
+        cache_key = self.cache.make_key(route.cache_namespace, contents, schema)
+        cached = self._from_cache(cache_key, schema)
+        if cached is not None:
+            return cached
         try:
-            print(f"{INFO_COLOR}Generating content with model:{Colors.RESET} {ENTITY_COLOR}{self.model}{Colors.RESET}")
-            response = self.client.models.generate_content(
-                model=self.model, # type: ignore
-                contents=contents,
-                config={
-                    "response_mime_type": response_mime_type,
-                    "response_schema": pydantic_model,
-                }
-            )
+            print(f"{INFO_COLOR}Generating content with model:{Colors.RESET} {ENTITY_COLOR}{route.model}{Colors.RESET}")
+            with self.router.track(route, contents) as tracked:
+                response = self.client.models.generate_content(
+                    model=route.model,
+                    contents=contents,
+                    config=self._config(route, response_mime_type, schema) # type: ignore
+                )
+                tracked.set_response(response)
+            if response.parsed is not None:
+                self.cache.put(cache_key, response.text) # type: ignore
             return response.parsed
         except Exception as e:
             print(f"{ERROR_COLOR}Error generating content: {e}{Colors.RESET}")
             raise e
-       
-    def generate_list(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json"):
-        try:
-            print(f"{INFO_COLOR}Generating content with model:{Colors.RESET} {ENTITY_COLOR}{self.model}{Colors.RESET}")
-            response = self.client.models.generate_content(
-                model=self.model, # type: ignore
-                contents=contents,
-                config={
-                    "response_mime_type": response_mime_type,
-                    "response_schema": list[pydantic_model],
-                }
-            )
+
+    async def _request_structured_async(self, contents: str, schema: Any, response_mime_type: str, priority: LLMPriority, call_site: CallSite):
+        route = self.router.resolve(call_site, self.model)
+        cache_key = self.cache.make_key(route.cache_namespace, contents, schema)
+        cached = self._parse_cached(await self.cache.get_async(cache_key), schema)
+        if cached is not None:
+            return cached
+
+        async def request():
+            print(f"{INFO_COLOR}Generating content (async) with model:{Colors.RESET} {ENTITY_COLOR}{route.model}{Colors.RESET}")
+            with self.router.track(route, contents) as tracked:
+                response = await self.resilience.call(
+                    f"Classifier:{schema.__name__ if isinstance(schema, type) else schema}",
+                    lambda: self.client.aio.models.generate_content(
+                        model=route.model,
+                        contents=contents,
+                        config=self._config(route, response_mime_type, schema) # type: ignore
+                    ),
+                    model=route.model,
+                    priority=priority
+                )
+                tracked.set_response(response)
+            if response.parsed is not None:
+                await self.cache.put_async(cache_key, response.text) # type: ignore
             return response.parsed
+
+        try:
+            # Concurrent identical requests share one model call
+            return await self.single_flight.do(cache_key, request)
         except Exception as e:
             print(f"{ERROR_COLOR}Error generating content: {e}{Colors.RESET}")
             raise e
-        
-        
-        
+
+    def generate(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json", call_site: CallSite = CallSite.DEFAULT):
+        return self._request_structured(contents, pydantic_model, response_mime_type, call_site)
+
+    async def generate_async(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json", priority: LLMPriority = LLMPriority.NORMAL, call_site: CallSite = CallSite.DEFAULT):
+        """
+        Awaitable counterpart of `generate` (uses the SDK's `aio` client).
+        """
+        return await self._request_structured_async(contents, pydantic_model, response_mime_type, priority, call_site)
+
+    def generate_list(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json", call_site: CallSite = CallSite.DEFAULT):
+        return self._request_structured(contents, list[pydantic_model], response_mime_type, call_site)
+
+    async def generate_list_async(self, contents: str, pydantic_model: Type[T], response_mime_type: str = "application/json", priority: LLMPriority = LLMPriority.NORMAL, call_site: CallSite = CallSite.DEFAULT):
+        """
+        Awaitable counterpart of `generate_list`.
+        """
+        return await self._request_structured_async(contents, list[pydantic_model], response_mime_type, priority, call_site)
+
+    def _build_text_prompt(self, contents: str, language: str) -> str:
+        return (
+            f"Задание: Ответь на следующий запрос на {language} языке.\n"
+            "---\n"
+            f"{contents}"
+        )
+
     def general_text_llm_request(
         self,
         contents: str,
         language: str = "Russian",
-        response_mime_type: str = "text/plain"
+        response_mime_type: str = "text/plain",
+        call_site: CallSite = CallSite.DEFAULT
     ) -> str:
         """
         Makes a clear text request to the LLM, ensuring a non-empty string response.
@@ -66,6 +139,7 @@ class Classifier:
             contents: The primary prompt or content for the LLM.
             language: The desired language for the response (e.g., "Russian", "English").
             response_mime_type: The expected MIME type for the response.
+            call_site: Where the request comes from; selects the model and generation config.
 
         Returns:
             The response text as a string.
@@ -74,29 +148,81 @@ class Classifier:
             ValueError: If the LLM returns an empty or null response.
             Exception: Propagates exceptions from the underlying API call.
         """
-        full_prompt = (
-            f"Задание: Ответь на следующий запрос на {language} языке.\n"
-            "---\n"
-            f"{contents}"
-        )
+        full_prompt = self._build_text_prompt(contents, language)
+        route = self.router.resolve(call_site, self.model)
+        cache_key = self.cache.make_key(route.cache_namespace, full_prompt)
+        cached_text = self.cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
 
         try:
-            print(f"{INFO_COLOR}Making text request to model: {ENTITY_COLOR}{self.model}{Colors.RESET}")
-            response = self.client.models.generate_content(
-                model=self.model,  # type: ignore
-                contents=full_prompt,
-                config={
-                    "response_mime_type": response_mime_type,
-                }
-            )
-            
-            if response.text:
-                return response.text
-            else:
-                # If the response or its text is empty, it's a failure case.
-                raise ValueError("LLM returned an empty response.")
-                
+            print(f"{INFO_COLOR}Making text request to model: {ENTITY_COLOR}{route.model}{Colors.RESET}")
+            with self.router.track(route, full_prompt) as tracked:
+                response = self.client.models.generate_content(
+                    model=route.model,
+                    contents=full_prompt,
+                    config=self._config(route, response_mime_type) # type: ignore
+                )
+                tracked.set_response(response)
+
+                if not response.text:
+                    # If the response or its text is empty, it's a failure case.
+                    raise ValueError("LLM returned an empty response.")
+
+            self.cache.put(cache_key, response.text)
+            return response.text
+
         except Exception as e:
             print(f"{ERROR_COLOR}Error during general text LLM request: {e}{Colors.RESET}")
             # Re-raise the exception to be handled by the caller.
             raise
+
+    async def general_text_llm_request_async(
+        self,
+        contents: str,
+        language: str = "Russian",
+        response_mime_type: str = "text/plain",
+        priority: LLMPriority = LLMPriority.NORMAL,
+        call_site: CallSite = CallSite.DEFAULT
+    ) -> str:
+        """
+        Awaitable counterpart of `general_text_llm_request`.
+        `priority` is the request's scheduling class.
+
+        Raises:
+            ValueError: If the LLM returns an empty or null response.
+            Exception: Propagates exceptions from the underlying API call.
+        """
+        full_prompt = self._build_text_prompt(contents, language)
+        route = self.router.resolve(call_site, self.model)
+        cache_key = self.cache.make_key(route.cache_namespace, full_prompt)
+        cached_text = await self.cache.get_async(cache_key)
+        if cached_text is not None:
+            return cached_text
+
+        async def request() -> str:
+            print(f"{INFO_COLOR}Making async text request to model: {ENTITY_COLOR}{route.model}{Colors.RESET}")
+            with self.router.track(route, full_prompt) as tracked:
+                response = await self.resilience.call(
+                    "Classifier:text",
+                    lambda: self.client.aio.models.generate_content(
+                        model=route.model,
+                        contents=full_prompt,
+                        config=self._config(route, response_mime_type) # type: ignore
+                    ),
+                    model=route.model,
+                    priority=priority
+                )
+                tracked.set_response(response)
+
+                if not response.text:
+                    raise ValueError("LLM returned an empty response.")
+
+            await self.cache.put_async(cache_key, response.text)
+            return response.text
+
+        try:
+            return await self.single_flight.do(cache_key, request)
+        except Exception as e:
+            print(f"{ERROR_COLOR}Error during general text LLM request: {e}{Colors.RESET}")
+            raise
@@ -0,0 +1,154 @@
+# context_summarizer.py
+
+import asyncio
+import contextvars
+import os
+import re
+import time
+from typing import TYPE_CHECKING, List, Optional
+
+from global_defines import *
+from llm_routing import CallSite
+from llm_scheduler import LLMPriority
+
+if TYPE_CHECKING:
+    from chapter_logic import Chapter
+
+# New context (after the rolling summary) that triggers a background fold
+DEFAULT_CONTEXT_FOLD_CHARS = 3000
+# If folding falls behind, the oldest unsummarized blocks are dropped past this size
+DEFAULT_CONTEXT_HARD_LIMIT_CHARS = MAX_CONTEXT_LENGTH_CHARS * 3
+
+# Context blocks (<ACTION_LOG>, <ACTION_OUTCOMES>, ...) start on a line with an opening tag
+_BLOCK_START = re.compile(r"\n(?=<[A-Z_]+>)")
+
+
+class ContextSummarizer:
+    """
+    Keeps `chapter.context` bounded off the critical path.
+
+    The context is a rolling summary followed by the blocks appended since it was made.
+    When those blocks grow past CONTEXT_FOLD_CHARS, a background task asks the LLM to
+    fold them into the summary; blocks appended while it runs are kept after the new
+    summary. Turns never wait for it.
+    """
+    def __init__(self, chapter: 'Chapter', fold_chars: Optional[int] = None, hard_limit_chars: Optional[int] = None):
+        self.chapter = chapter
+        self.fold_chars = fold_chars or int(os.getenv("CONTEXT_FOLD_CHARS", DEFAULT_CONTEXT_FOLD_CHARS))
+        self.hard_limit_chars = hard_limit_chars or int(os.getenv("CONTEXT_HARD_LIMIT_CHARS", DEFAULT_CONTEXT_HARD_LIMIT_CHARS))
+        # chapter.context[:summary_length] is the rolling summary
+        self.summary_length = 0
+        self._task: Optional[asyncio.Task] = None
+        self._forced = False
+        self._instructions: List[str] = []
+        self._call_site = CallSite.SUMMARIZATION
+        self.stats = {"folds": 0, "failed": 0, "discarded": 0, "chars_folded": 0, "chars_dropped": 0, "last_fold_seconds": 0.0}
+
+    @property
+    def pending_chars(self) -> int:
+        """Size of the context not folded into the summary yet."""
+        return len(self.chapter.context) - self.summary_length
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def schedule(self, force: bool = False, instructions: str = "", call_site: CallSite = CallSite.SUMMARIZATION):
+        """
+        Starts a background fold if enough new context has accumulated (or `force`).
+        `instructions` are added to the next fold's task, e.g. what to keep for a fight.
+        """
+        if instructions:
+            self._instructions.append(instructions)
+            self._call_site = call_site
+        self._enforce_hard_limit()
+        if force:
+            self._forced = True
+        if self.running:
+            return  # The running fold picks the request up when it finishes
+        if not self._should_fold():
+            return
+        # A fresh context: the fold must not inherit (and be cut off by) the current turn's budget
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    def _should_fold(self) -> bool:
+        pending = self.pending_chars
+        return pending > 0 and (self._forced or pending >= self.fold_chars)
+
+    async def _run(self):
+        while self._should_fold():
+            self._forced = False
+            if not await self._fold():
+                break
+
+    async def _fold(self) -> bool:
+        chapter = self.chapter
+        snapshot = chapter.context
+        summary, new_events = snapshot[:self.summary_length], snapshot[self.summary_length:]
+        # History indexed so far is covered by the snapshot; once folded, it is only recalled from the index
+        history_watermark = chapter.history.next_id
+        instructions, self._instructions = self._instructions, []
+        call_site, self._call_site = self._call_site, CallSite.SUMMARIZATION
+        prompt = chapter.prompter.get_context_fold_prompt(
+            summary=summary.strip(),
+            new_events=new_events.strip(),
+            state=chapter.get_actual_context(call_site=call_site),
+            instructions="\n".join(instructions)
+        )
+        print(f"{DEBUG_COLOR}(Summarizer) Folding {len(new_events)} chars into a {len(summary)} chars summary{Colors.RESET}")
+
+        started = time.perf_counter()
+        try:
+            folded = await chapter.classifier.general_text_llm_request_async(
+                prompt,
+                priority=LLMPriority.BACKGROUND,
+                call_site=call_site
+            )
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"{WARNING_COLOR}(Summarizer) Fold failed, retrying after the next turn: {e}{Colors.RESET}")
+            self._instructions = instructions + self._instructions
+            return False
+        self.stats["last_fold_seconds"] = round(time.perf_counter() - started, 3)
+
+        if not chapter.context.startswith(snapshot):
+            # The context was replaced or cut meanwhile; the next fold starts from it
+            self.stats["discarded"] += 1
+            self.summary_length = min(self.summary_length, len(chapter.context))
+            return True
+        folded = folded.strip() + "\n"
+        chapter.context = folded + chapter.context[len(snapshot):]
+        self.summary_length = len(folded)
+        chapter.history.folded_until = history_watermark
+        self.stats["folds"] += 1
+        self.stats["chars_folded"] += len(new_events)
+        print(f"{SUCCESS_COLOR}(Summarizer) Context folded: {len(snapshot)} -> {len(folded)} chars{Colors.RESET}")
+        return True
+
+    def _enforce_hard_limit(self):
+        self.summary_length = min(self.summary_length, len(self.chapter.context))
+        excess = len(self.chapter.context) - self.hard_limit_chars
+        if excess <= 0:
+            return
+        # Drop whole blocks from the oldest unsummarized ones
+        context = self.chapter.context
+        cut = self.summary_length + excess
+        match = _BLOCK_START.search(context, cut)
+        cut = match.start() if match else len(context)
+        self.stats["chars_dropped"] += cut - self.summary_length
+        self.chapter.context = context[:self.summary_length] + context[cut:]
+        print(f"{WARNING_COLOR}(Summarizer) Summaries fall behind, dropped {cut - self.summary_length} chars of old context{Colors.RESET}")
+
+    async def wait_idle(self):
+        """Waits for the running fold (if any) to finish."""
+        while self.running:
+            await asyncio.shield(self._task)  # type: ignore
+
+    def get_stats(self) -> dict:
+        return dict(
+            self.stats,
+            running=self.running,
+            summary_chars=self.summary_length,
+            pending_chars=self.pending_chars,
+            context_chars=len(self.chapter.context),
+        )
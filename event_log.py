@@ -0,0 +1,187 @@
+# event_log.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from global_defines import *
+from game_state_context import to_json
+
+DEFAULT_EVENT_LOG_RING_SIZE = 200
+DEFAULT_EVENT_LOG_DIR = ".event_log"
+DEFAULT_EVENT_PAGE_SIZE = 50
+DEFAULT_EVENT_LOG_FLUSH_EVENTS = 64
+# Byte offset of every Nth spilled event is kept, so a page read seeks close to its first event
+SPILL_INDEX_STRIDE = 256
+
+
+class EventRecord:
+    """
+    One logged game event. Details are serialized once, when the event is logged,
+    so the record holds no references to game objects.
+    """
+    __slots__ = ("seq", "timestamp", "event", "json")
+
+    def __init__(self, seq: int, timestamp: float, event: str, details: Dict[str, Any]):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.event = event
+        # The form used in prompts: {"event": ..., "details": ...}
+        self.json = to_json({"event": event, "details": details})
+
+    def to_dict(self) -> dict:
+        data = json.loads(self.json)
+        data["seq"] = self.seq
+        data["timestamp"] = self.timestamp
+        return data
+
+
+class EventLog:
+    """
+    Chapter event log with bounded memory.
+
+    The latest EVENT_LOG_RING_SIZE events are kept in memory; older ones are appended
+    to a per-log segment file in EVENT_LOG_DIR (empty = dropped) and read back page
+    by page with `page`. Evicted events are buffered and written through one open
+    handle EVENT_LOG_FLUSH_EVENTS at a time; `close` writes the rest.
+    """
+    def __init__(self, ring_size: Optional[int] = None, spill_dir: Optional[str] = None):
+        self.ring_size = ring_size or int(os.getenv("EVENT_LOG_RING_SIZE", DEFAULT_EVENT_LOG_RING_SIZE))
+        spill_dir = spill_dir if spill_dir is not None else os.getenv("EVENT_LOG_DIR", DEFAULT_EVENT_LOG_DIR)
+        self.spill_path = os.path.join(spill_dir, f"events-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl") if spill_dir else ""
+        self.flush_events = max(1, int(os.getenv("EVENT_LOG_FLUSH_EVENTS", DEFAULT_EVENT_LOG_FLUSH_EVENTS)))
+        self._spill_file = None
+        # Evicted lines not written yet; they follow the `_flushed` events already in the file
+        self._pending: List[bytes] = []
+        self._flushed = 0
+        self._ring = deque()
+        self._next_seq = 0
+        # Seq of the oldest event still available (in the segment file or in memory)
+        self._first_seq = 0
+        self._spilled = 0
+        self._spill_offsets: List[int] = []
+        self._spill_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of events ever logged."""
+        return self._next_seq
+
+    def append(self, event: str, details: Dict[str, Any]) -> EventRecord:
+        with self._lock:
+            record = EventRecord(self._next_seq, time.time(), event, details)
+            self._next_seq += 1
+            self._ring.append(record)
+            if len(self._ring) > self.ring_size:
+                self._evict(self._ring.popleft())
+            return record
+
+    def _evict(self, record: EventRecord):
+        # Caller holds the lock
+        if not self.spill_path:
+            self._first_seq = record.seq + 1
+            return
+        line = (json.dumps(record.to_dict(), ensure_ascii=False) + "\n").encode("utf-8")
+        if self._spilled % SPILL_INDEX_STRIDE == 0:
+            self._spill_offsets.append(self._spill_size)
+        self._spilled += 1
+        self._spill_size += len(line)
+        self._pending.append(line)
+        if len(self._pending) >= self.flush_events:
+            self._flush()
+
+    def _flush(self):
+        # Caller holds the lock
+        if not self._pending or not self.spill_path:
+            return
+        try:
+            if self._spill_file is None:
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                self._spill_file = open(self.spill_path, "ab")
+            self._spill_file.writelines(self._pending)
+            self._spill_file.flush()
+        except OSError as e:
+            print(f"{WARNING_COLOR}(Event log) Failed to write {self.spill_path}, {len(self._pending)} events dropped: {e}{Colors.RESET}")
+            # Older events on disk can no longer be addressed by position
+            self._close_file()
+            self.spill_path = ""
+            self._pending = []
+            self._first_seq = self._ring[0].seq if self._ring else self._next_seq
+            return
+        self._flushed += len(self._pending)
+        self._pending = []
+
+    def _close_file(self):
+        if self._spill_file is not None:
+            try:
+                self._spill_file.close()
+            except OSError:
+                pass
+            self._spill_file = None
+
+    def close(self):
+        """Writes the buffered evicted events and closes the segment file."""
+        with self._lock:
+            self._flush()
+            self._close_file()
+
+    def recent(self, limit: int) -> List[EventRecord]:
+        """The latest `limit` in-memory events, oldest first."""
+        with self._lock:
+            if limit <= 0:
+                return []
+            return list(self._ring)[-limit:]
+
+    def page(self, before: Optional[int] = None, limit: int = DEFAULT_EVENT_PAGE_SIZE) -> dict:
+        """
+        Up to `limit` events logged before seq `before` (default: the newest ones), oldest first,
+        with the `before` value of the previous page (None when there is none). Reads the segment
+        file, so async callers should run it in a thread.
+        """
+        limit = max(1, limit)
+        with self._lock:
+            end = self._next_seq if before is None else max(self._first_seq, min(before, self._next_seq))
+            start = max(self._first_seq, end - limit)
+            ring_start = self._ring[0].seq if self._ring else self._next_seq
+            events = [record.to_dict() for record in self._ring if start <= record.seq < end]
+            if start < ring_start:
+                events = self._read_spilled(start, min(end, ring_start)) + events
+            return {
+                "events": events,
+                "next_before": start if start > self._first_seq else None,
+                "total": self._next_seq,
+            }
+
+    def _read_spilled(self, start: int, end: int) -> List[dict]:
+        # Caller holds the lock; spilled events are numbered from _first_seq without gaps
+        events = []
+        pending_seq = self._first_seq + self._flushed
+        if start < pending_seq:
+            chunk = (start - self._first_seq) // SPILL_INDEX_STRIDE
+            try:
+                with open(self.spill_path, "rb") as f:
+                    f.seek(self._spill_offsets[chunk])
+                    for index, line in enumerate(f, start=chunk * SPILL_INDEX_STRIDE + self._first_seq):
+                        if index >= min(end, pending_seq):
+                            break
+                        if index >= start:
+                            events.append(json.loads(line))
+            except OSError as e:
+                print(f"{WARNING_COLOR}(Event log) Failed to read {self.spill_path}: {e}{Colors.RESET}")
+        events.extend(json.loads(line) for line in self._pending[max(0, start - pending_seq):max(0, end - pending_seq)])
+        return events
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self._next_seq,
+                "in_memory": len(self._ring),
+                "spilled": self._spilled,
+                "spill_pending": len(self._pending),
+                "spill_bytes": self._spill_size,
+                "spill_path": self.spill_path,
+            }
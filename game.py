@@ -2,10 +2,13 @@ import json
 from chapter_logic import Chapter
 from classifier import Classifier
 from generator import ObjectGenerator
+from llm_clients import get_llm_registry
+from llm_routing import CallSite
 from models import *
 from server_communication import *
 from server_communication.events import EventBuilder
 from story_manager import StoryManager
+from turn_budget import turn_budget_scope
 from global_defines import *
 import asyncio
 import inspect
@@ -25,25 +28,20 @@ class Game:
         self.message_history = []
         self.listeners = []
         self.listener_names = [] # character names
-        self.generator = ObjectGenerator()
-        self.classifier = Classifier()
+        self.llm_registry = get_llm_registry()
+        self.generator = ObjectGenerator(registry=self.llm_registry)
+        self.classifier = Classifier(registry=self.llm_registry)
         self.context = ""
-        self.story_manager = StoryManager("campaigns/campaign.json")
+        self.story_manager = StoryManager("campaigns/campaign.json", registry=self.llm_registry)
         self.context = self.story_manager.get_current_plot_context()
 
-        # Generate the initial NPC based on the campaign's starting prompt
         self.chapter = Chapter(
             context=self.context,
             story_manager=self.story_manager,
             characters=[],
-            game=self
-        )
-        initial_npc = self.chapter.generate_character(
-            self.story_manager.story.initial_character_prompt,
-            self.context
+            game=self,
+            registry=self.llm_registry
         )
-        self.chapter.add_character(initial_npc)
-
         self.chapter.game_mode = GameMode.NARRATIVE
 
         # Announce the starting location and initial scene description
@@ -61,7 +59,17 @@ class Game:
         """
         Async factory for Game objects.
         """
-        self = cls()  # Synchronous __init__
+        self = cls()  # Synchronous __init__ (no LLM calls in there)
+
+        # LLM-backed setup is awaited here so it never blocks the event loop
+        await self.chapter.generate_scene()
+
+        # Generate the initial NPC based on the campaign's starting prompt
+        initial_npc = await self.chapter.generate_character(
+            self.story_manager.story.initial_character_prompt,
+            self.context
+        )
+        self.chapter.add_character(initial_npc)
         return self
 
     async def introduce_scene(self):
@@ -74,7 +82,7 @@ class Game:
             "Write a compelling introduction from the Dungeon Master's perspective to set the mood and describe the initial surroundings. "
             f"{HTML_TAG_PROMPT}"
         )
-        introduction = self.classifier.general_text_llm_request(prompt + self.context, "Russian")
+        introduction = await self.classifier.general_text_llm_request_async(prompt + self.context, "Russian", call_site=CallSite.SCENE_INTRODUCTION)
         
         message = {
             "message_text": introduction,
@@ -92,6 +100,8 @@ class Game:
             if self.chapter.game_mode == GameMode.COMBAT:
                 active_char = self.chapter.get_active_character()
                 print(f"{INFO_COLOR}It's {active_char.name}'s turn (COMBAT MODE).{Colors.RESET}")
+                # The next NPC's action is chosen while this turn is played
+                self.chapter.prefetch_next_NPC_action()
 
                 if active_char.is_player:
                     await self.announce(EventBuilder.lock([active_char.name], game_mode=self.chapter.game_mode.name))
@@ -106,7 +116,8 @@ class Game:
                 else: # NPC's turn in COMBAT
                     await self.announce(EventBuilder.lock_all(self.chapter.game_mode.name))
                     await self.make_system_announcement(f"Ход {active_char.name}...")
-                    await self.announce_from_the_game(self.chapter.NPC_turn())
+                    with turn_budget_scope():
+                        await self.announce_from_the_game(self.chapter.NPC_turn())
                     self.chapter.move_to_next_turn()
                     # await self.announce_from_the_game(self.chapter.after_turn())
                     await asyncio.sleep(1)
@@ -227,8 +238,17 @@ class Game:
         
         await self.announce(EventBuilder.lock_all(self.chapter.game_mode.name))
         
-        event_generator, was_action = await self.chapter.process_interaction(self.chapter.get_character_by_name(character_name), interaction)
-        await self.announce_from_the_game(event_generator)     
+        # Every LLM call made for this interaction shares one deadline
+        with turn_budget_scope():
+            try:
+                event_generator, was_action = await self.chapter.process_interaction(self.chapter.get_character_by_name(character_name), interaction)
+                await self.announce_from_the_game(event_generator)     
+            except Exception as e:
+                # A failed turn must not leave the game locked
+                print(f"{ERROR_COLOR}Failed to process interaction from {character_name}: {e}{Colors.RESET}")
+                await self.announce(EventBuilder.error(f"Не удалось обработать действие: {e}"))
+                await self.announce(EventBuilder.end_of_turn())
+                was_action = False
         
         if was_action and self.chapter.game_mode == GameMode.COMBAT:
             self.chapter.move_to_next_turn()
@@ -247,8 +267,9 @@ class Game:
         
     async def announce_from_the_game(self, generator):
         async for event in generator:
-            print("Event received from the game:")
-            print(event)
+            if event.get("event") != "DM_message_chunk":
+                print("Event received from the game:")
+                print(event)
             
             # Handle specific events that require special processing
             if event.get("event") == "message" and event.get("sender") == "DM":
@@ -272,6 +293,9 @@ class Game:
         Adds a message to the message history and ensures the history does not exceed MAX_MESSAGE_HISTORY_LENGTH.
         """
         self.message_history.append(message)
+        if message["sender_name"] == "DM":
+            # The chat history is short; the index keeps DM messages searchable for the whole session
+            self.chapter.history.add("dm_message", message["message_text"])
         if len(self.message_history) > MAX_MESSAGE_HISTORY_LENGTH:
             self.message_history.pop(0)
 
@@ -291,6 +315,8 @@ class Game:
             for key, value in updates.items():
                 if hasattr(character, key):
                     setattr(character, key, value)
+            self.chapter.state.mark_dirty(character)
+            self.chapter.characters.reindex()  # The name may have changed
             return character
         return None
 
@@ -300,7 +326,7 @@ class Game:
         """
         character = self.chapter.get_character_by_name(character_name)
         if character:
-            self.chapter.characters.remove(character)
+            self.chapter.remove_character(character)
             await self.announce(EventBuilder.player_left(character.name, self.listener_names))
             return True
         return False
\ No newline at end of file
@@ -0,0 +1,230 @@
+# game_state_context.py
+
+import json
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from llm_routing import CallSite
+
+if TYPE_CHECKING:
+    from event_log import EventLog
+
+RECENT_EVENTS_IN_CONTEXT = 10
+# Same ratio as utils.estimate_tokens
+CHARS_PER_TOKEN = 4
+PARTICIPANTS_DESCRIPTION = "A list of all characters currently in the scene."
+
+# Fields kept per detail level (None = every field)
+CHARACTER_DETAIL_FIELDS = {
+    "full": None,
+    "combat": frozenset({"name", "current_hp", "max_hp", "ac", "is_alive", "is_player", "conditions", "position_in_scene"}),
+}
+SCENE_DETAIL_FIELDS = {
+    "full": None,
+    "brief": frozenset({"name", "description", "size_description"}),
+}
+
+
+def _json_default(value: Any) -> Any:
+    # Event details may carry Pydantic objects (changes, corrections) or enums
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def to_json(value: Any) -> str:
+    """Compact JSON with non-ASCII text kept as is."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+class ContextProjection:
+    """
+    Which parts of the game state one kind of prompt sees.
+
+    `characters`: "full", "combat" (stats only), "names" or None. `focus`: detail level of
+    the acting character and of explicitly focused ones. `scene`: "full", "brief", "focus"
+    (full, but only when the scene is focused) or None. `events`: how many recent events.
+    """
+    def __init__(self, name: str, summary: bool = True, events: int = RECENT_EVENTS_IN_CONTEXT, scene: Optional[str] = "full", characters: Optional[str] = "full", focus: str = "full", story: bool = True):
+        self.name = name
+        self.summary = summary
+        self.events = events
+        self.scene = scene
+        self.characters = characters
+        self.focus = focus
+        self.story = story
+
+
+FULL_PROJECTION = ContextProjection("full")
+
+# Call sites not listed here (action outcome, after-action analysis, ...) get the full context
+CONTEXT_PROJECTIONS: Dict[CallSite, ContextProjection] = {
+    # Routing needs the conversation flow, not the character sheets
+    CallSite.INTENT_CLASSIFICATION: ContextProjection("intent_classification", summary=False, scene=None, characters="names", focus="combat", story=False),
+    # The audit only compares the objects the outcome touched
+    CallSite.AUDIT: ContextProjection("audit", summary=False, events=3, scene="focus", characters=None, story=False),
+    # The NPC's own full profile is already part of the prompt
+    CallSite.NPC_ACTION: ContextProjection("npc_action", characters="combat", focus="combat"),
+    CallSite.TURN_ORDER: ContextProjection("turn_order", events=5, scene="brief", characters="combat", focus="combat"),
+    # Summaries fold the history themselves, so only the current state is sent
+    CallSite.SUMMARIZATION: ContextProjection("summarization", summary=False, events=0, scene="brief", characters="combat", focus="combat"),
+    CallSite.FIGHT_SETUP: ContextProjection("fight_setup", summary=False, events=0, characters="combat", focus="combat"),
+}
+
+
+class GameStateContext:
+    """
+    Incrementally maintained JSON serialization of the game state used in prompts.
+
+    Every character and scene is serialized once per version and the fragment is
+    reused until the entity changes. Replaced entities (updates create new objects)
+    are detected automatically; in-place mutations must be reported with `mark_dirty`.
+    Events come from the chapter's EventLog, which serializes each one when it is logged.
+    """
+    def __init__(self):
+        self.version = 0
+        self._entity_versions: Dict[int, int] = {}
+        # (id(entity), fields) -> (version, entity, fragment); holding the entity keeps its id unique
+        self._fragments: Dict[Tuple[int, Optional[FrozenSet[str]]], Tuple[int, BaseModel, str]] = {}
+        # Last render per projection: (render key, text)
+        self._last_renders: Dict[str, Tuple[tuple, str]] = {}
+        self.stats = {"renders": 0, "render_reuses": 0, "fragment_hits": 0, "fragment_misses": 0}
+        # Per projection: renders and characters sent; on sampled renders, also the estimated
+        # size of the full context at the same moment
+        self.projection_stats: Dict[str, Dict[str, int]] = {}
+        # Size of the full render beyond its variable parts (JSON structure), from the last full render
+        self._full_overhead = 0
+
+    def mark_dirty(self, entity: BaseModel):
+        """Reports an in-place change of `entity` (e.g. attributes set directly)."""
+        self._entity_versions[id(entity)] = self._entity_versions.get(id(entity), 0) + 1
+        self.version += 1
+
+    def fragment(self, entity: BaseModel, fields: Optional[FrozenSet[str]] = None) -> str:
+        """
+        The JSON of `entity` (only `fields`, if given), serialized again only if the
+        entity changed since the last call.
+        """
+        key = (id(entity), fields)
+        version = self._entity_versions.get(id(entity), 0)
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] == version and cached[1] is entity:
+            self.stats["fragment_hits"] += 1
+            return cached[2]
+        self.stats["fragment_misses"] += 1
+        text = entity.model_dump_json(include=set(fields) if fields else None)
+        self._fragments[key] = (version, entity, text)
+        return text
+
+    def _events_json(self, event_log: "EventLog", count: int) -> str:
+        return "[" + ",".join(record.json for record in event_log.recent(count)) + "]"
+
+    def _prune(self, live_entities: List[BaseModel]):
+        live = {id(entity) for entity in live_entities}
+        for key in [key for key in self._fragments if key[0] not in live]:
+            del self._fragments[key]
+        for key in [key for key in self._entity_versions if key not in live]:
+            del self._entity_versions[key]
+
+    def _full_parts_length(self, summary: str, event_log: "EventLog", entities: List[BaseModel], story_context: str) -> Optional[int]:
+        """
+        Size of the variable parts of the full render, from cached full fragments (string escaping
+        ignored); None if an entity's current full fragment is not cached.
+        """
+        length = len(summary) + len(story_context)
+        length += sum(len(record.json) + 1 for record in event_log.recent(FULL_PROJECTION.events))
+        for entity in entities:
+            cached = self._fragments.get((id(entity), None))
+            if cached is None or cached[0] != self._entity_versions.get(id(entity), 0) or cached[1] is not entity:
+                return None
+            length += len(cached[2])
+        return length
+
+    def render(self, summary: str, event_log: "EventLog", scene: Optional[BaseModel], characters: List[BaseModel], active_character_name: Optional[str], story_context: str, projection: ContextProjection = FULL_PROJECTION, focus: Iterable[str] = ()) -> str:
+        """
+        The `<CONTEXT_DATA>` block for prompts, reduced to `projection`. `focus` names the
+        characters (or "scene") the prompt is about. An unchanged state returns the previous string.
+        """
+        focus_set = frozenset(focus) | ({active_character_name} if active_character_name else frozenset())
+        entities = list(characters) + ([scene] if scene is not None else [])
+        render_key = (
+            tuple((id(entity), self._entity_versions.get(id(entity), 0)) for entity in entities),
+            summary, len(event_log), active_character_name, story_context, focus_set,
+        )
+        last = self._last_renders.get(projection.name)
+        if last is not None and last[0] == render_key:
+            self.stats["render_reuses"] += 1
+            text = last[1]
+        else:
+            self.stats["renders"] += 1
+            self._prune(entities)
+            text = self._render(projection, summary, event_log, scene, characters, active_character_name, story_context, focus_set)
+            self._last_renders[projection.name] = (render_key, text)
+            if projection is FULL_PROJECTION:
+                parts_length = self._full_parts_length(summary, event_log, entities, story_context)
+                if parts_length is not None:
+                    self._full_overhead = len(text) - parts_length
+
+        if projection is not FULL_PROJECTION:
+            # The full context is not rendered for comparison; its size is estimated from the cached
+            # fragments, and renders whose entities have no current full fragment are not sampled
+            stats = self.projection_stats.setdefault(projection.name, {"renders": 0, "chars": 0, "sampled": 0, "sampled_chars": 0, "full_chars": 0})
+            stats["renders"] += 1
+            stats["chars"] += len(text)
+            parts_length = self._full_parts_length(summary, event_log, entities, story_context)
+            if parts_length is not None:
+                stats["sampled"] += 1
+                stats["sampled_chars"] += len(text)
+                stats["full_chars"] += parts_length + self._full_overhead
+        return text
+
+    def _render(self, projection: ContextProjection, summary: str, event_log: "EventLog", scene: Optional[BaseModel], characters: List[BaseModel], active_character_name: Optional[str], story_context: str, focus: FrozenSet[str]) -> str:
+        game_state = []
+        if projection.summary:
+            game_state.append(f'"summary_of_past_events":{to_json(summary)}')
+        if projection.events:
+            game_state.append(f'"recent_events":{self._events_json(event_log, projection.events)}')
+
+        scene_detail = projection.scene
+        if scene_detail == "focus":
+            scene_detail = "full" if "scene" in focus else None
+        if scene_detail:
+            scene_json = self.fragment(scene, SCENE_DETAIL_FIELDS[scene_detail]) if scene is not None else to_json("No scene is currently active.")
+            game_state.append(f'"current_scene":{scene_json}')
+
+        character_jsons = []
+        for character in characters:
+            detail = projection.focus if character.name in focus else projection.characters
+            if detail == "names":
+                character_jsons.append(to_json(character.name))
+            elif detail:
+                character_jsons.append(self.fragment(character, CHARACTER_DETAIL_FIELDS[detail]))
+        if projection.characters or focus:
+            game_state.append(
+                f'"participants":{{"description":{to_json(PARTICIPANTS_DESCRIPTION)},'
+                f'"currently_acting":{to_json(active_character_name)},'
+                f'"characters":[{",".join(character_jsons)}]}}'
+            )
+
+        text = '{"game_state":{' + ",".join(game_state) + "}"
+        if projection.story:
+            text += f',"global_story_context":{to_json(story_context)}'
+        return f"<CONTEXT_DATA>\n{text}}}\n</CONTEXT_DATA>"
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["version"] = self.version
+        stats["cached_fragments"] = len(self._fragments)
+        stats["projections"] = {}
+        for name, projection_stats in self.projection_stats.items():
+            full_chars = projection_stats["full_chars"]
+            reduction = 1 - projection_stats["sampled_chars"] / full_chars if full_chars else 0.0
+            # Extrapolated from the sampled renders to all of them
+            saved = projection_stats["chars"] * reduction / (1 - reduction) if reduction < 1 else 0.0
+            stats["projections"][name] = dict(
+                projection_stats,
+                tokens_saved=int(max(0.0, saved)) // CHARS_PER_TOKEN,
+                reduction=reduction,
+            )
+        return stats
@@ -2,12 +2,20 @@
 
 import os
 import json
+import asyncio
 import time
-from typing import Type, TypeVar, Optional
-from pydantic import BaseModel, ValidationError
-import google.generativeai as genai
+import threading
+from typing import Any, AsyncIterator, Dict, List, Tuple, Type, TypeVar, Optional
+from pydantic import BaseModel, Field, ValidationError, create_model
 from dotenv import load_dotenv
 from global_defines import *
+from llm_clients import LLMClientRegistry, get_llm_registry
+from llm_scheduler import LLMPriority
+from llm_routing import CallSite
+from utils import estimate_tokens
+from streaming_json import IncrementalJSONParser
+from json_repair import recover_json_object
+from turn_budget import BudgetExhausted
 
 # Import the self-contained schemas from our separate file
 # Make sure you have your schemas.py file in a 'models' subfolder or adjust the import.
@@ -16,17 +24,137 @@ from models import *
 # A Generic Type Variable for our generator's return type
 T = TypeVar('T', bound=BaseModel)
 
+DEFAULT_BATCH_CONCURRENCY = 4
+
+
+class CompiledSchemaPrompt:
+    """
+    The schema text and static prompt scaffold for one Pydantic model.
+    Built once per model and reused for every generation request.
+    """
+    def __init__(self, pydantic_model: Type[BaseModel], minify: bool):
+        schema = pydantic_model.model_json_schema()
+        pretty_schema = json.dumps(schema, indent=2)
+        if minify:
+            self.schema_text = json.dumps(schema, separators=(",", ":"), ensure_ascii=False)
+        else:
+            self.schema_text = pretty_schema
+
+        self.header = f"""
+        You are a data generation assistant. Your task is to create a JSON object that strictly adheres to the provided JSON schema.
+
+        JSON Schema:
+        ```json
+        {self.schema_text}
+        ```
+
+        Request:
+        """
+        self.footer = """
+
+        IMPORTANT: Your response MUST be ONLY the valid JSON object that conforms to the schema. Do not include any other text, explanations, or markdown formatting like ```json.
+        """
+
+        # Savings compared to sending the pretty-printed (ASCII-escaped) schema
+        self.bytes_saved_per_call = len(pretty_schema.encode("utf-8")) - len(self.schema_text.encode("utf-8"))
+        self.tokens_saved_per_call = estimate_tokens(pretty_schema) - estimate_tokens(self.schema_text)
+
+
+class IncompleteResponseError(ValueError):
+    """
+    A response that was recovered as JSON but still fails validation on a few
+    top-level fields. Those fields can be requested again on their own.
+    """
+    def __init__(self, pydantic_model: Type[BaseModel], data: Dict[str, Any], fields: List[str], error: Exception):
+        super().__init__(f"{pydantic_model.__name__}: invalid or incomplete fields {fields}: {error}")
+        self.pydantic_model = pydantic_model
+        self.data = data
+        self.fields = fields
+
+
 class ObjectGenerator:
     """
     A class to generate instances of Pydantic models in a specified language
     by instructing the Gemini API to return a JSON object.
     """
-    def __init__(self):
+    # Compiled prompts are shared by all generators: schemas never change at runtime
+    _compiled_prompts: Dict[tuple, CompiledSchemaPrompt] = {}
+    _compiled_prompts_lock = threading.Lock()
+    schema_prompt_stats = {"compiled": 0, "reused": 0, "bytes_saved": 0, "tokens_saved": 0}
+    # clean: parsed as is; repaired: valid after local JSON repair; field_fixed: valid after a
+    # follow-up request for the broken fields; failed: everything else
+    json_recovery_stats = {"clean": 0, "repaired": 0, "field_fixed": 0, "failed": 0}
+    _batch_models: Dict[Type[BaseModel], Type[BaseModel]] = {}
+
+    def __init__(self, model_name: Optional[str] = None, registry: Optional[LLMClientRegistry] = None, minify_schema: Optional[bool] = None):
+        """
+        Initializes the generator with a model handle from the shared client registry.
+
+        Args:
+            minify_schema: Send schemas as compact JSON. Defaults to the LLM_MINIFY_SCHEMA env variable.
+        """
+        self.registry = registry or get_llm_registry()
+        self.model_name = model_name or self.registry.default_model
+        self.model = self.registry.get_generative_model(self.model_name)
+        self.cache = self.registry.response_cache
+        self.single_flight = self.registry.single_flight
+        self.resilience = self.registry.resilience
+        self.router = self.registry.router
+        if minify_schema is None:
+            minify_schema = os.getenv("LLM_MINIFY_SCHEMA", "false").lower() in ("1", "true", "yes")
+        self.minify_schema = minify_schema
+        # Follow-up requests only make sense for a few broken fields; beyond that regenerate
+        self.max_fix_fields = int(os.getenv("LLM_JSON_FIX_MAX_FIELDS", "3"))
+        self.batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+
+    def _get_compiled_prompt(self, pydantic_model: Type[BaseModel]) -> CompiledSchemaPrompt:
         """
-        Initializes the generator with Google API credentials.
+        Returns the cached prompt scaffold for a model, compiling it on first use.
         """
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        self.model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_DUMB", "gemini-2.0-flash-lite"))
+        key = (pydantic_model, self.minify_schema)
+        stats = ObjectGenerator.schema_prompt_stats
+        with ObjectGenerator._compiled_prompts_lock:
+            compiled = ObjectGenerator._compiled_prompts.get(key)
+            if compiled is None:
+                compiled = CompiledSchemaPrompt(pydantic_model, self.minify_schema)
+                ObjectGenerator._compiled_prompts[key] = compiled
+                stats["compiled"] += 1
+            else:
+                stats["reused"] += 1
+            stats["bytes_saved"] += compiled.bytes_saved_per_call
+            stats["tokens_saved"] += compiled.tokens_saved_per_call
+
+        if compiled.bytes_saved_per_call:
+            print(f"{Colors.DIM}Schema prompt for {pydantic_model.__name__}: saved {compiled.bytes_saved_per_call} bytes (~{compiled.tokens_saved_per_call} tokens){Colors.RESET}")
+        return compiled
+
+    def _route(self, call_site: CallSite):
+        """
+        Resolves the route of `call_site` and returns it with its model handle.
+        """
+        route = self.router.resolve(call_site, self.model_name)
+        if route.model == self.model_name:
+            return route, self.model
+        return route, self.registry.get_generative_model(route.model)
+
+    @classmethod
+    def get_schema_prompt_stats(cls) -> dict:
+        with cls._compiled_prompts_lock:
+            return dict(cls.schema_prompt_stats)
+
+    @classmethod
+    def get_json_recovery_stats(cls) -> dict:
+        with cls._compiled_prompts_lock:
+            stats = dict(cls.json_recovery_stats)
+        total = sum(stats.values())
+        stats["recovered_rate"] = (stats["repaired"] + stats["field_fixed"]) / total if total else 0.0
+        stats["failure_rate"] = stats["failed"] / total if total else 0.0
+        return stats
+
+    @classmethod
+    def _count_recovery(cls, outcome: str):
+        with cls._compiled_prompts_lock:
+            cls.json_recovery_stats[outcome] += 1
 
     def _clean_json_response(self, text_response: str) -> str:
         """
@@ -42,20 +170,11 @@ class ObjectGenerator:
             
         return text_response[start_index : end_index + 1]
 
-    def generate(self, pydantic_model: Type[T], prompt: Optional[str] = None, context: Optional[str] = None, language: Optional[str] = None) -> T:
+    def _build_prompt(self, pydantic_model: Type[T], prompt: Optional[str] = None, context: Optional[str] = None, language: Optional[str] = None) -> str:
         """
-        Generates a Pydantic instance by asking the model for a JSON response.
-
-        Args:
-            pydantic_model: The Pydantic class to create an instance of.
-            prompt: A specific description of the object to generate.
-            context: Optional context to guide the generation.
-            language: The desired language for the generated text content (e.g., "Russian").
-
-        Returns:
-            An instance of the specified Pydantic class.
+        Builds the full generation prompt (schema + request + instructions) for a Pydantic model.
         """
-        schema_json = json.dumps(pydantic_model.model_json_schema(), indent=2)
+        compiled = self._get_compiled_prompt(pydantic_model)
 
         if prompt:
             user_request = f"Generate an object based on this description: '{prompt}'."
@@ -69,38 +188,333 @@ class ObjectGenerator:
         if language:
             language_instruction = f"CRITICAL: All generated text content (like names, descriptions, effects, etc.) MUST be in the following language: {language}."
 
-        # --- Construct the full prompt with the new language instruction ---
-        full_prompt = f"""
-        You are a data generation assistant. Your task is to create a JSON object that strictly adheres to the provided JSON schema.
-
-        JSON Schema:
-        ```json
-        {schema_json}
-        ```
-
-        Request:
-        {user_request}
-        {context_instruction}
-        {language_instruction}
+        # --- Construct the full prompt around the precompiled schema scaffold ---
+        return f"{compiled.header}{user_request}\n        {context_instruction}\n        {language_instruction}{compiled.footer}"
 
-        IMPORTANT: Your response MUST be ONLY the valid JSON object that conforms to the schema. Do not include any other text, explanations, or markdown formatting like ```json.
+    def _parse_response(self, pydantic_model: Type[T], text_response: str, count: bool = True) -> Tuple[T, bool]:
         """
-        
-        print(f"\n{HEADER_COLOR}Sending request to Gemini{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET} (Language: {INFO_COLOR}{language or 'Default'}{Colors.RESET})")
-        response = self.model.generate_content(full_prompt)
+        Turns the raw model response into an instance of the requested Pydantic model.
+        Malformed JSON goes through local repair; returns the instance and whether it was repaired.
+        `count` adds the outcome to the JSON recovery stats (off for cached responses).
 
+        Raises:
+            IncompleteResponseError: only a few fields are still broken after repair.
+        """
         try:
-            cleaned_response = self._clean_json_response(response.text)
+            cleaned_response = self._clean_json_response(text_response)
             parsed_data = json.loads(cleaned_response)
-            return pydantic_model(**parsed_data)
+            result = pydantic_model(**parsed_data)
+            if count:
+                self._count_recovery("clean")
+            return result, False
 
-        except (json.JSONDecodeError, ValidationError, ValueError) as e:
+        except (json.JSONDecodeError, ValidationError, ValueError, TypeError) as e:
+            recovered = recover_json_object(text_response)
+            if recovered is not None:
+                try:
+                    invalid_fields = self._invalid_fields(pydantic_model, recovered.data)
+                except ValidationError:
+                    invalid_fields = None
+                if invalid_fields is not None and recovered.incomplete_field in pydantic_model.model_fields:
+                    invalid_fields = sorted(set(invalid_fields) | {recovered.incomplete_field})
+                if invalid_fields == []:
+                    print(f"{WARNING_COLOR}Repaired malformed JSON{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET}")
+                    self._count_recovery("repaired")
+                    return pydantic_model(**recovered.data), True
+                if invalid_fields and len(invalid_fields) <= self.max_fix_fields:
+                    raise IncompleteResponseError(pydantic_model, recovered.data, invalid_fields, e) from e
+
+            self._count_recovery("failed")
             print(f"{ERROR_COLOR}Error processing Gemini response:{Colors.RESET} {e}")
             print(f"{WARNING_COLOR}Raw Response from API:{Colors.RESET}")
-            print(response.text)
+            print(text_response)
             print(f"{Colors.DIM}{'─' * 30}{Colors.RESET}")
             raise e
 
+    @staticmethod
+    def _invalid_fields(pydantic_model: Type[BaseModel], data: Dict[str, Any]) -> List[str]:
+        """
+        Top-level fields of `data` that fail validation (missing ones included).
+        Raises ValidationError if an error cannot be pinned to a single field.
+        """
+        try:
+            pydantic_model(**data)
+            return []
+        except ValidationError as e:
+            fields = set()
+            for error in e.errors():
+                if not error["loc"] or error["loc"][0] not in pydantic_model.model_fields:
+                    raise
+                fields.add(error["loc"][0])
+            return sorted(fields)
+
+    def _build_fix_prompt(self, incomplete: IncompleteResponseError, language: Optional[str]) -> str:
+        """
+        Prompt asking only for the broken fields of `incomplete`, with the rest of the object as context.
+        """
+        schema = incomplete.pydantic_model.model_json_schema()
+        field_schema = {
+            "type": "object",
+            "properties": {name: schema["properties"][name] for name in incomplete.fields},
+            "required": incomplete.fields,
+        }
+        if "$defs" in schema:
+            field_schema["$defs"] = schema["$defs"]
+        valid_part = {k: v for k, v in incomplete.data.items() if k not in incomplete.fields}
+        language_instruction = f"All generated text MUST be in the following language: {language}." if language else ""
+        return f"""
+        A JSON object was generated but the fields {", ".join(incomplete.fields)} are missing, cut off or invalid.
+        Return a JSON object containing ONLY these fields, consistent with the rest of the object.
+
+        Rest of the object:
+        {json.dumps(valid_part, ensure_ascii=False, separators=(",", ":"))}
+
+        JSON Schema of the fields:
+        {json.dumps(field_schema, ensure_ascii=False, separators=(",", ":"))}
+        {language_instruction}
+
+        IMPORTANT: Your response MUST be ONLY the valid JSON object. Do not include any other text, explanations, or markdown formatting like ```json.
+        """
+
+    def _merge_fix(self, incomplete: IncompleteResponseError, text_response: str) -> BaseModel:
+        """
+        Merges the follow-up response into the recovered object and validates the result.
+        """
+        recovered = recover_json_object(text_response)
+        fixed = recovered.data if recovered else {}
+        merged = dict(incomplete.data)
+        merged.update({name: fixed[name] for name in incomplete.fields if name in fixed})
+        try:
+            result = incomplete.pydantic_model(**merged)
+        except ValidationError:
+            self._count_recovery("failed")
+            print(f"{ERROR_COLOR}Field fix-up did not produce a valid {incomplete.pydantic_model.__name__}{Colors.RESET}")
+            raise
+        self._count_recovery("field_fixed")
+        print(f"{SUCCESS_COLOR}Fixed fields{Colors.RESET} {incomplete.fields} of: {ENTITY_COLOR}{incomplete.pydantic_model.__name__}{Colors.RESET}")
+        return result
+
+    def _fix_fields(self, incomplete: IncompleteResponseError, route, model, language: Optional[str]) -> BaseModel:
+        """Requests only the broken fields again instead of regenerating the whole object."""
+        fix_prompt = self._build_fix_prompt(incomplete, language)
+        print(f"{WARNING_COLOR}Requesting fix for fields{Colors.RESET} {incomplete.fields} of: {ENTITY_COLOR}{incomplete.pydantic_model.__name__}{Colors.RESET}")
+        try:
+            with self.router.track(route, fix_prompt) as tracked:
+                response = model.generate_content(fix_prompt, generation_config=route.generation_config or None)
+                tracked.set_response(response)
+        except Exception:
+            self._count_recovery("failed")
+            raise
+        return self._merge_fix(incomplete, response.text)
+
+    async def _fix_fields_async(self, incomplete: IncompleteResponseError, route, model, language: Optional[str], priority: LLMPriority) -> BaseModel:
+        """Awaitable counterpart of `_fix_fields`."""
+        fix_prompt = self._build_fix_prompt(incomplete, language)
+        print(f"{WARNING_COLOR}Requesting fix for fields{Colors.RESET} {incomplete.fields} of: {ENTITY_COLOR}{incomplete.pydantic_model.__name__}{Colors.RESET}")
+        try:
+            with self.router.track(route, fix_prompt) as tracked:
+                response = await self.resilience.call(
+                    f"ObjectGenerator:{incomplete.pydantic_model.__name__}:fix",
+                    lambda: model.generate_content_async(fix_prompt, generation_config=route.generation_config or None),
+                    model=route.model,
+                    priority=priority
+                )
+                tracked.set_response(response)
+        except Exception:
+            self._count_recovery("failed")
+            raise
+        return self._merge_fix(incomplete, response.text)
+
+    def generate(self, pydantic_model: Type[T], prompt: Optional[str] = None, context: Optional[str] = None, language: Optional[str] = None, call_site: CallSite = CallSite.DEFAULT) -> T:
+        """
+        Generates a Pydantic instance by asking the model for a JSON response.
+        Blocks the calling thread; use `generate_async` from async code.
+
+        Args:
+            pydantic_model: The Pydantic class to create an instance of.
+            prompt: A specific description of the object to generate.
+            context: Optional context to guide the generation.
+            language: The desired language for the generated text content (e.g., "Russian").
+            call_site: Where the request comes from; selects the model and generation config.
+
+        Returns:
+            An instance of the specified Pydantic class.
+        """
+        full_prompt = self._build_prompt(pydantic_model, prompt, context, language)
+        route, model = self._route(call_site)
+        cache_key = self.cache.make_key(route.cache_namespace, full_prompt, pydantic_model)
+        cached_text = self.cache.get(cache_key)
+        if cached_text is not None:
+            print(f"\n{SUCCESS_COLOR}Cache hit{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET}")
+            return self._parse_response(pydantic_model, cached_text, count=False)[0]
+        
+        print(f"\n{HEADER_COLOR}Sending request to Gemini{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET} (Language: {INFO_COLOR}{language or 'Default'}{Colors.RESET})")
+        incomplete = None
+        with self.router.track(route, full_prompt) as tracked:
+            response = model.generate_content(full_prompt, generation_config=route.generation_config or None)
+            tracked.set_response(response)
+            try:
+                result, repaired = self._parse_response(pydantic_model, response.text)
+            except IncompleteResponseError as e:
+                incomplete = e
+        if incomplete is not None:
+            result, repaired = self._fix_fields(incomplete, route, model, language), True
+        # Repaired responses are cached in their valid form
+        self.cache.put(cache_key, result.model_dump_json() if repaired else response.text)
+        return result
+
+    async def generate_async(self, pydantic_model: Type[T], prompt: Optional[str] = None, context: Optional[str] = None, language: Optional[str] = None, priority: LLMPriority = LLMPriority.NORMAL, call_site: CallSite = CallSite.DEFAULT) -> T:
+        """
+        Awaitable counterpart of `generate`. Uses the SDK's async surface so the
+        event loop keeps serving other players while the model is thinking.
+        `priority` is the request's scheduling class.
+        """
+        full_prompt = self._build_prompt(pydantic_model, prompt, context, language)
+        route, model = self._route(call_site)
+        cache_key = self.cache.make_key(route.cache_namespace, full_prompt, pydantic_model)
+        cached_text = await self.cache.get_async(cache_key)
+        if cached_text is not None:
+            print(f"\n{SUCCESS_COLOR}Cache hit{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET}")
+            return self._parse_response(pydantic_model, cached_text, count=False)[0]
+
+        async def request_and_parse() -> T:
+            print(f"\n{HEADER_COLOR}Sending async request to Gemini{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET} (Language: {INFO_COLOR}{language or 'Default'}{Colors.RESET})")
+            incomplete = None
+            with self.router.track(route, full_prompt) as tracked:
+                response = await self.resilience.call(
+                    f"ObjectGenerator:{pydantic_model.__name__}",
+                    lambda: model.generate_content_async(full_prompt, generation_config=route.generation_config or None),
+                    model=route.model,
+                    priority=priority
+                )
+                tracked.set_response(response)
+                try:
+                    result, repaired = self._parse_response(pydantic_model, response.text)
+                except IncompleteResponseError as e:
+                    incomplete = e
+            if incomplete is not None:
+                result, repaired = await self._fix_fields_async(incomplete, route, model, language, priority), True
+            await self.cache.put_async(cache_key, result.model_dump_json() if repaired else response.text)
+            return result
+
+        # Concurrent identical requests share one model call
+        return await self.single_flight.do(cache_key, request_and_parse)
+
+    @classmethod
+    def _batch_model(cls, pydantic_model: Type[BaseModel]) -> Type[BaseModel]:
+        """A `{"items": [...]}` wrapper model, built once per item model."""
+        with cls._compiled_prompts_lock:
+            batch_model = cls._batch_models.get(pydantic_model)
+            if batch_model is None:
+                batch_model = create_model(
+                    f"{pydantic_model.__name__}Batch",
+                    items=(List[pydantic_model], Field(description="The generated objects, one per requested description, in the requested order."))
+                )
+                cls._batch_models[pydantic_model] = batch_model
+        return batch_model
+
+    async def generate_many_async(self, pydantic_model: Type[T], prompts: List[str], context: Optional[str] = None, language: Optional[str] = None, priority: LLMPriority = LLMPriority.NORMAL, call_site: CallSite = CallSite.DEFAULT) -> List[T]:
+        """
+        Generates one instance per prompt, in order.
+
+        All instances are requested in a single call. Items the batch response lacks
+        (or all of them, if the batch call fails) are generated individually,
+        at most LLM_BATCH_CONCURRENCY at a time.
+        """
+        if len(prompts) <= 1:
+            return [await self.generate_async(pydantic_model, prompt, context, language, priority, call_site) for prompt in prompts]
+
+        results: List[Optional[T]] = [None] * len(prompts)
+        descriptions = "\n".join(f"{i + 1}. {prompt}" for i, prompt in enumerate(prompts))
+        batch_prompt = f"Exactly {len(prompts)} objects in `items`, one per description, in this order:\n{descriptions}\n"
+        try:
+            batch = await self.generate_async(self._batch_model(pydantic_model), batch_prompt, context, language, priority, call_site)
+            for i, item in enumerate(batch.items[:len(prompts)]):  # type: ignore
+                results[i] = item
+        except BudgetExhausted:
+            raise
+        except Exception as e:
+            print(f"{WARNING_COLOR}Batch generation of {len(prompts)} {pydantic_model.__name__} failed, generating them one by one:{Colors.RESET} {e}")
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            print(f"{INFO_COLOR}Generating {len(missing)} of {len(prompts)} {pydantic_model.__name__} individually{Colors.RESET}")
+            semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+            async def generate_one(i: int):
+                async with semaphore:
+                    results[i] = await self.generate_async(pydantic_model, prompts[i], context, language, priority, call_site)
+
+            await asyncio.gather(*(generate_one(i) for i in missing))
+        return results  # type: ignore
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Text of one streamed response chunk (chunks without text parts yield '')."""
+        try:
+            return chunk.text
+        except (ValueError, IndexError):
+            return ""
+
+    async def generate_streaming_async(self, pydantic_model: Type[T], prompt: Optional[str] = None, context: Optional[str] = None, language: Optional[str] = None, stream_field: Optional[str] = None, priority: LLMPriority = LLMPriority.NORMAL, call_site: CallSite = CallSite.DEFAULT) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming counterpart of `generate_async`. The response is parsed as it arrives and yields:
+          - ("text", delta): decoded text of the top-level string field `stream_field`
+            while the model is still generating it;
+          - ("field", (name, value)): a top-level field as soon as its value closes,
+            so callers can act on early fields before the tail of the response arrives;
+          - ("object", instance): the complete response, parsed and validated.
+        """
+        full_prompt = self._build_prompt(pydantic_model, prompt, context, language)
+        route, model = self._route(call_site)
+        cache_key = self.cache.make_key(route.cache_namespace, full_prompt, pydantic_model)
+        parser = IncrementalJSONParser([stream_field] if stream_field else None)
+
+        cached_text = await self.cache.get_async(cache_key)
+        if cached_text is not None:
+            print(f"\n{SUCCESS_COLOR}Cache hit{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET}")
+            result = self._parse_response(pydantic_model, cached_text, count=False)[0]
+            for kind, name, value in parser.feed(cached_text):
+                yield kind, (value if kind == "text" else (name, value))
+            yield "object", result
+            return
+
+        print(f"\n{HEADER_COLOR}Streaming request to Gemini{Colors.RESET} for: {ENTITY_COLOR}{pydantic_model.__name__}{Colors.RESET} (Language: {INFO_COLOR}{language or 'Default'}{Colors.RESET})")
+        chunks = []
+        operation = f"ObjectGenerator:{pydantic_model.__name__}:stream"
+        with self.router.track(route, full_prompt) as tracked:
+            # The scheduler slot is held until the whole stream is read, not just while it is opened
+            async with self.resilience.slot(operation, route.model, priority):
+                # A stream cannot be hedged once text went out; only opening it is retried
+                response = await self.resilience.call(
+                    operation,
+                    lambda: model.generate_content_async(full_prompt, stream=True, generation_config=route.generation_config or None),
+                    hedge=False,
+                    model=route.model,
+                    priority=priority,
+                    scheduled=False
+                )
+                async for chunk in self.resilience.iterate(operation, response):
+                    text = self._chunk_text(chunk)
+                    if not text:
+                        continue
+                    chunks.append(text)
+                    for kind, name, value in parser.feed(text):
+                        yield kind, (value if kind == "text" else (name, value))
+
+            full_text = "".join(chunks)
+            tracked.set_response(response, full_text)
+            # The incremental parse is best-effort; the whole response is still validated here
+            incomplete = None
+            try:
+                result, repaired = self._parse_response(pydantic_model, full_text)
+            except IncompleteResponseError as e:
+                incomplete = e
+        if incomplete is not None:
+            result, repaired = await self._fix_fields_async(incomplete, route, model, language, priority), True
+        await self.cache.put_async(cache_key, result.model_dump_json() if repaired else full_text)
+        yield "object", result
+
 # --- Main execution block (Updated with Russian examples and colorful output) ---
 if __name__ == "__main__":
     load_dotenv()
@@ -0,0 +1,133 @@
+# history_index.py
+
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_HISTORY_INDEX_MAX_DOCS = 5000
+DEFAULT_HISTORY_RECALL_TOP_K = 5
+# Recalled events are cut to this length in prompts
+SNIPPET_CHARS = 300
+# Russian is heavily inflected; a fixed-length prefix is a cheap stand-in for a stemmer
+STEM_LENGTH = 6
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TAG = re.compile(r"<[^>]+>")
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, tag-free word stems of `text`."""
+    words = _WORD.findall(_TAG.sub(" ", text).lower().replace("ё", "е"))
+    return [word[:STEM_LENGTH] for word in words if len(word) > 1]
+
+
+class HistoryDocument:
+    """One indexed piece of session history (an action, an object update, a DM message)."""
+    __slots__ = ("id", "kind", "text", "length", "term_counts")
+
+    def __init__(self, id: int, kind: str, text: str, term_counts: Counter):
+        self.id = id
+        self.kind = kind
+        self.text = text
+        self.length = sum(term_counts.values())
+        self.term_counts = term_counts
+
+    def snippet(self, limit: int = SNIPPET_CHARS) -> str:
+        text = " ".join(_TAG.sub("", self.text).split())
+        return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+class HistoryIndex:
+    """
+    Incremental BM25 index over the session history, so prompts can recall the past
+    events relevant to the current action instead of carrying the whole history.
+
+    Holds at most HISTORY_INDEX_MAX_DOCS documents; the oldest are evicted first.
+    `folded_until` is the id of the first document still present verbatim in the
+    chapter context (newer ones are not worth recalling).
+    """
+    def __init__(self, max_docs: Optional[int] = None):
+        self.max_docs = max_docs or int(os.getenv("HISTORY_INDEX_MAX_DOCS", DEFAULT_HISTORY_INDEX_MAX_DOCS))
+        self.docs: "OrderedDict[int, HistoryDocument]" = OrderedDict()
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.next_id = 0
+        self.folded_until = 0
+        self.stats = {"searches": 0, "hits": 0}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, kind: str, text: str) -> Optional[int]:
+        """Indexes `text`; returns its document id (None if it has no words)."""
+        term_counts = Counter(tokenize(text))
+        if not term_counts:
+            return None
+        document = HistoryDocument(self.next_id, kind, text, term_counts)
+        self.next_id += 1
+        self.docs[document.id] = document
+        self.total_length += document.length
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[document.id] = count
+        while len(self.docs) > self.max_docs:
+            self._remove(next(iter(self.docs)))
+        return document.id
+
+    def _remove(self, doc_id: int):
+        document = self.docs.pop(doc_id)
+        self.total_length -= document.length
+        for term in document.term_counts:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = DEFAULT_HISTORY_RECALL_TOP_K, kinds: Optional[Iterable[str]] = None, before: Optional[int] = None) -> List[HistoryDocument]:
+        """
+        The `k` documents that best match `query` by BM25, best first. `kinds` restricts the
+        document kinds, `before` the ids (e.g. to events no longer in the context).
+        """
+        self.stats["searches"] += 1
+        if not self.docs or k <= 0:
+            return []
+        kinds = set(kinds) if kinds is not None else None
+        doc_count = len(self.docs)
+        average_length = self.total_length / doc_count
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, count in postings.items():
+                if before is not None and doc_id >= before:
+                    continue
+                document = self.docs[doc_id]
+                if kinds is not None and document.kind not in kinds:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * document.length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        best = sorted(scores, key=lambda doc_id: (-scores[doc_id], -doc_id))[:k]
+        self.stats["hits"] += len(best)
+        return [self.docs[doc_id] for doc_id in best]
+
+    def recall(self, query: str, k: Optional[int] = None) -> str:
+        """
+        Past events relevant to `query` that are no longer in the context, oldest first,
+        one per line; empty if there are none.
+        """
+        k = k if k is not None else int(os.getenv("HISTORY_RECALL_TOP_K", DEFAULT_HISTORY_RECALL_TOP_K))
+        documents = sorted(self.search(query, k, before=self.folded_until), key=lambda document: document.id)
+        return "\n".join(f"[#{document.id} {document.kind}] {document.snippet()}" for document in documents)
+
+    def get_stats(self) -> dict:
+        return dict(
+            self.stats,
+            documents=len(self.docs),
+            terms=len(self.postings),
+            folded_until=self.folded_until,
+        )
@@ -11,16 +11,21 @@ import time
 import queue
 import threading
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 from global_defines import *
+from llm_clients import LLMClientRegistry, get_llm_registry
+from llm_scheduler import LLMPriority
+from llm_routing import CallSite
 
 PROMPT_PREVIEW_LENGTH = 10
+DEFAULT_IMAGE_MODEL = "gemini-2.0-flash-preview-image-generation"
 
 class ImageGenerator:
-    def __init__(self, game: 'Game', main_loop: Optional[asyncio.AbstractEventLoop] = None):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        self.model = "gemini-2.0-flash-preview-image-generation"
+    def __init__(self, game: 'Game', main_loop: Optional[asyncio.AbstractEventLoop] = None, registry: Optional[LLMClientRegistry] = None):
+        self.registry = registry or get_llm_registry()
+        self.client = self.registry.get_client(api_key_env="GEMINI_API_KEY")
+        self.route = self.registry.router.resolve(CallSite.IMAGE, DEFAULT_IMAGE_MODEL)
+        self.model = self.route.model
         self.image_dir = os.path.join("static", "images")
         if not os.path.exists(self.image_dir):
             os.makedirs(self.image_dir, exist_ok=True)
@@ -68,43 +73,53 @@ The composition is theatrical and dynamic, rich with intricate, macabre details.
 """
         
         try:
-            # The SDK call is synchronous, so we run it in a thread to avoid blocking our worker's loop
-            response_chunks = await asyncio.to_thread(
-                self.client.models.generate_content_stream,
-                model=self.model,
-                contents=[types.Content(role="user", parts=[types.Part.from_text(text=full_prompt)])],
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE", "TEXT"],
-                    response_mime_type="text/plain",
-                ),
-            )
+            with self.registry.router.track(self.route, full_prompt) as tracked:
+                # The SDK stream is a lazy synchronous generator: it is read to the end in a thread,
+                # so neither opening nor consuming it blocks our worker's loop, and the scheduler slot
+                # is held for the whole download.
+                # Images are background work: they wait behind player-facing requests in the scheduler.
+                response_chunks = await self.registry.scheduler.run(
+                    self.model,
+                    LLMPriority.BACKGROUND,
+                    lambda: asyncio.to_thread(lambda: list(self.client.models.generate_content_stream(
+                        model=self.model,
+                        contents=[types.Content(role="user", parts=[types.Part.from_text(text=full_prompt)])],
+                        config=types.GenerateContentConfig(
+                            **self.route.generation_config,
+                            response_modalities=["IMAGE", "TEXT"],
+                            response_mime_type="text/plain",
+                        ),
+                    )))
+                )
+                tracked.set_response(None, "")  # Image responses carry no text tokens
 
-            image_saved = False
-            for chunk in response_chunks:
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        if part.inline_data and part.inline_data.data:
-                            file_extension = mimetypes.guess_extension(part.inline_data.mime_type) or ".png" # type: ignore
-                            image_path = os.path.join(self.image_dir, f"{file_name}{file_extension}")
+                image_saved = False
+                for chunk in response_chunks:
+                    if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                        for part in chunk.candidates[0].content.parts:
+                            if part.inline_data and part.inline_data.data:
+                                file_extension = mimetypes.guess_extension(part.inline_data.mime_type) or ".png" # type: ignore
+                                image_path = os.path.join(self.image_dir, f"{file_name}{file_extension}")
                             
-                            with open(image_path, "wb") as f:
-                                f.write(part.inline_data.data)
+                                with open(image_path, "wb") as f:
+                                    f.write(part.inline_data.data)
                             
-                            end_time = time.monotonic()
-                            print(f"{TIME_COLOR}Image generation for '{file_name}' took {end_time - start_time:.2f}s.{Colors.RESET}")
-                            print(f"{SUCCESS_COLOR}File saved to: {image_path}{Colors.RESET}")
+                                end_time = time.monotonic()
+                                print(f"{TIME_COLOR}Image generation for '{file_name}' took {end_time - start_time:.2f}s.{Colors.RESET}")
+                                print(f"{SUCCESS_COLOR}File saved to: {image_path}{Colors.RESET}")
                             
-                            # This is the crucial part: calling back to the main thread
-                            if self.main_loop and self.main_loop.is_running():
-                                if  request_type == "SCENE":
-                                    event = EventBuilder.scene_change("info",f"{file_name}{file_extension}")
-                                    asyncio.run_coroutine_threadsafe(self.game.announce(event), self.main_loop)
+                                # This is the crucial part: calling back to the main thread
+                                if self.main_loop and self.main_loop.is_running():
+                                    if  request_type == "SCENE":
+                                        event = EventBuilder.scene_change("info",f"{file_name}{file_extension}")
+                                        asyncio.run_coroutine_threadsafe(self.game.announce(event), self.main_loop)
                             
-                            image_saved = True
-                            break
-                if image_saved:
-                    break
+                                image_saved = True
+                                break
+                    if image_saved:
+                        break
             
+
             if not image_saved:
                 print(f"{WARNING_COLOR}Image generation for '{file_name}' finished with no image data.{Colors.RESET}")
 
@@ -0,0 +1,162 @@
+# json_repair.py
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# How many '{' positions to try when the response has prose around the object
+MAX_OBJECT_CANDIDATES = 5
+
+
+class RecoveredJSON:
+    """
+    A JSON object recovered from a malformed model response.
+
+    `incomplete_field` is the top-level field that was still being written when
+    the response broke off (its value was closed artificially and may be cut short).
+    """
+    def __init__(self, data: Dict[str, Any], incomplete_field: Optional[str] = None):
+        self.data = data
+        self.incomplete_field = incomplete_field
+
+
+def find_json_object(text: str, start: int = 0) -> Optional[str]:
+    """
+    Balanced-brace scan from the first '{' at or after `start`. Returns the object
+    text, or everything from the '{' on if the object never closes (truncated response).
+    """
+    start = text.find("{", start)
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _strip_trailing_comma(out: List[str]):
+    while out and out[-1] in " \t\r\n":
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(fragment: str) -> Tuple[str, Optional[str]]:
+    """
+    Tolerant repair of a JSON object fragment: drops trailing commas, closes an
+    unterminated string, completes a dangling key and closes open arrays/objects.
+
+    Returns the repaired text and the top-level key whose value was cut off
+    (None if the fragment was complete).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Object keys are strings read while the enclosing object expects a key
+    expecting_key: List[bool] = []
+    string_is_key = False
+    string_start = 0
+    pending_key = False
+    top_level_key: Optional[str] = None
+
+    for char in fragment:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if string_is_key:
+                    pending_key = True
+                    expecting_key[-1] = False
+                    if len(stack) == 1:
+                        try:
+                            top_level_key = json.loads("".join(out[string_start:]))
+                        except json.JSONDecodeError:
+                            top_level_key = None
+            continue
+
+        if char == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == "{" and expecting_key[-1]
+            string_start = len(out)
+        elif char in "{[":
+            stack.append(char)
+            expecting_key.append(char == "{")
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+                expecting_key.pop()
+        elif char == ",":
+            if stack and stack[-1] == "{":
+                expecting_key[-1] = True
+        elif char == ":":
+            pending_key = False
+        out.append(char)
+        if not stack and out and out[-1] == "}":
+            break
+
+    if not stack:
+        return "".join(out), None
+
+    if in_string and string_is_key:
+        # A half-written key carries no value: drop it
+        del out[string_start:]
+        if len(stack) == 1:
+            top_level_key = None
+    elif in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    _strip_trailing_comma(out)
+    while out and out[-1] in " \t\r\n":
+        out.pop()
+    if out and out[-1] == ":":
+        out.append("null")
+    elif pending_key and stack[-1] == "{":
+        out.append(":null")
+    for opener in reversed(stack):
+        _strip_trailing_comma(out)
+        out.append("}" if opener == "{" else "]")
+    return "".join(out), top_level_key
+
+
+def recover_json_object(text: str) -> Optional[RecoveredJSON]:
+    """
+    Best-effort extraction of a JSON object from a model response with prose
+    around it, trailing commas or a truncated tail. None if nothing parses.
+    """
+    position = 0
+    for _ in range(MAX_OBJECT_CANDIDATES):
+        fragment = find_json_object(text, position)
+        if fragment is None:
+            return None
+        repaired, incomplete_field = repair_json(fragment)
+        try:
+            data = json.loads(repaired, strict=False)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return RecoveredJSON(data, incomplete_field)
+        position = text.find("{", position) + 1
+    return None
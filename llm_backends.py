@@ -0,0 +1,359 @@
+# llm_backends.py
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Callable, List, Optional
+
+from google.genai import types
+from pydantic import BaseModel, TypeAdapter
+
+from global_defines import *
+from llm_cache import LLMResponseCache
+
+BACKEND_MODES = ("live", "record", "replay", "stub")
+DEFAULT_CASSETTE_DIR = "cassettes"
+STREAM_CHUNK_CHARS = 32
+
+# ObjectGenerator embeds the JSON schema in the prompt as a ```json fenced block
+_PROMPT_SCHEMA_PATTERN = re.compile(r"```json\s*(\{.*\})\s*```", re.S)
+
+
+class LLMRequest:
+    """One request as seen by a backend, independent of the SDK that would send it."""
+    def __init__(self, kind: str, model: str, prompt: str, schema: Any = None, config: Any = None):
+        self.kind = kind  # "text" or "image"
+        self.model = model
+        self.prompt = prompt
+        self.schema = schema
+        self.config = config
+
+    def _config_json(self) -> str:
+        config = self.config
+        if isinstance(config, BaseModel):
+            config = config.model_dump(exclude_none=True, mode="json")
+        config = {k: v for k, v in dict(config or {}).items() if k != "response_schema"}
+        return json.dumps(config, sort_keys=True, default=str)
+
+    @property
+    def key(self) -> str:
+        return LLMResponseCache.make_key(f"{self.kind}|{self.model}|{self._config_json()}", self.prompt, self.schema)
+
+
+class LLMResult:
+    """What a backend returns: response text, or image bytes for image requests."""
+    def __init__(self, text: str = "", image: Optional[bytes] = None, mime_type: Optional[str] = None, latency: float = 0.0):
+        self.text = text
+        self.image = image
+        self.mime_type = mime_type
+        self.latency = latency
+
+
+class CassetteStore:
+    """Recorded request/response pairs, one JSON file per request key."""
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv("LLM_CASSETTE_DIR", DEFAULT_CASSETTE_DIR)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[LLMResult]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        image = base64.b64decode(entry["image"]) if entry.get("image") else None
+        return LLMResult(entry.get("text", ""), image, entry.get("mime_type"), entry.get("latency", 0.0))
+
+    def save(self, request: LLMRequest, result: LLMResult):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {
+            "kind": request.kind,
+            "model": request.model,
+            "prompt_preview": request.prompt[:200],
+            "latency": result.latency,
+            "text": result.text,
+            "image": base64.b64encode(result.image).decode("ascii") if result.image else None,
+            "mime_type": result.mime_type,
+        }
+        path = self._path(request.key)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+
+class SchemaStub:
+    """
+    Fabricates a valid JSON document for a JSON schema. Deterministic per request:
+    the same request always yields the same document.
+    """
+    def __init__(self, seed: str):
+        self.rng = random.Random(seed)
+
+    def fabricate(self, schema: dict) -> Any:
+        return self._value(schema, schema.get("$defs", {}), "")
+
+    def _value(self, schema: dict, defs: dict, name: str) -> Any:
+        if "$ref" in schema:
+            return self._value(defs[schema["$ref"].split("/")[-1]], defs, name)
+        for combinator in ("anyOf", "oneOf", "allOf"):
+            if combinator in schema:
+                return self._value(schema[combinator][0], defs, name)
+        if "default" in schema:
+            return schema["default"]
+        if "enum" in schema:
+            return schema["enum"][0]
+
+        schema_type = schema.get("type")
+        if schema_type == "object" or "properties" in schema:
+            return {key: self._value(value, defs, key) for key, value in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            count = max(1, schema.get("minItems", 1))
+            return [self._value(schema.get("items", {}), defs, name) for _ in range(count)]
+        if schema_type == "integer":
+            return self.rng.randint(schema.get("minimum", 1), schema.get("maximum", 20))
+        if schema_type == "number":
+            return round(self.rng.uniform(schema.get("minimum", 0.0), schema.get("maximum", 10.0)), 2)
+        if schema_type == "boolean":
+            # Flags like is_alive / is_legal keep the game moving; everything else is off
+            return name.startswith("is_")
+        return f"{name or 'text'} {self.rng.randint(1, 999)}"
+
+
+class LLMBackend:
+    """
+    Serves requests in one of the non-live modes:
+      - record: calls the live SDK and writes a cassette for every response;
+      - replay: serves cassettes offline, sleeping for the recorded latency
+        (or a fixed LLM_REPLAY_LATENCY in seconds);
+      - stub: fabricates schema-valid responses without any cassette.
+    """
+    def __init__(self, mode: str, cassettes: Optional[CassetteStore] = None):
+        if mode not in BACKEND_MODES:
+            raise ValueError(f"Unknown LLM backend mode '{mode}', expected one of {BACKEND_MODES}")
+        self.mode = mode
+        self.cassettes = cassettes or CassetteStore()
+        self.replay_latency = os.getenv("LLM_REPLAY_LATENCY", "recorded")
+        self.replay_missing = os.getenv("LLM_REPLAY_MISSING", "error")  # "error" or "stub"
+        self.stub_latency = float(os.getenv("LLM_STUB_LATENCY", 0.0))
+        self.stats = {"recorded": 0, "replayed": 0, "replay_misses": 0, "stubbed": 0}
+
+    @property
+    def needs_live_clients(self) -> bool:
+        return self.mode == "record"
+
+    def _latency(self, result: LLMResult) -> float:
+        if self.mode == "stub":
+            return self.stub_latency
+        if self.replay_latency == "recorded":
+            return result.latency
+        return float(self.replay_latency)
+
+    def _offline(self, request: LLMRequest) -> LLMResult:
+        if self.mode == "replay":
+            result = self.cassettes.load(request.key)
+            if result is not None:
+                self.stats["replayed"] += 1
+                return result
+            self.stats["replay_misses"] += 1
+            if self.replay_missing != "stub":
+                raise LookupError(f"No cassette for {request.kind} request to {request.model} (key {request.key[:12]}...)")
+            print(f"{WARNING_COLOR}(LLM replay) No cassette for {request.key[:12]}..., using stub{Colors.RESET}")
+        self.stats["stubbed"] += 1
+        return self._stub(request)
+
+    def _stub(self, request: LLMRequest) -> LLMResult:
+        if request.kind == "image":
+            return LLMResult()
+        schema = request.schema
+        if schema is not None:
+            json_schema = TypeAdapter(schema).json_schema()
+        else:
+            match = _PROMPT_SCHEMA_PATTERN.search(request.prompt)
+            json_schema = json.loads(match.group(1)) if match else None
+        if json_schema is None:
+            return LLMResult(f"Ответ-заглушка {hashlib.sha256(request.prompt.encode('utf-8')).hexdigest()[:8]}.")
+        document = SchemaStub(request.key).fabricate(json_schema)
+        return LLMResult(json.dumps(document, ensure_ascii=False))
+
+    def respond(self, request: LLMRequest, live_call: Callable[[], LLMResult]) -> LLMResult:
+        if self.mode == "record":
+            started_at = time.monotonic()
+            result = live_call()
+            result.latency = time.monotonic() - started_at
+            self.cassettes.save(request, result)
+            self.stats["recorded"] += 1
+            return result
+        result = self._offline(request)
+        time.sleep(self._latency(result))
+        return result
+
+    async def respond_async(self, request: LLMRequest, live_call: Callable[[], Any]) -> LLMResult:
+        if self.mode == "record":
+            started_at = time.monotonic()
+            result = await live_call()
+            result.latency = time.monotonic() - started_at
+            self.cassettes.save(request, result)
+            self.stats["recorded"] += 1
+            return result
+        result = self._offline(request)
+        await asyncio.sleep(self._latency(result))
+        return result
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["mode"] = self.mode
+        return stats
+
+
+def create_backend() -> Optional[LLMBackend]:
+    """Backend selected by LLM_BACKEND; None in the default live mode."""
+    mode = os.getenv("LLM_BACKEND", "live").lower()
+    if mode == "live":
+        return None
+    print(f"{WARNING_COLOR}(LLM) Using '{mode}' backend{Colors.RESET}")
+    return LLMBackend(mode)
+
+
+# --- SDK-shaped wrappers handed out by the client registry ---
+
+def _text_of(contents: Any) -> str:
+    """Prompt text of `contents` (a string or a list of google.genai Content objects)."""
+    if isinstance(contents, str):
+        return contents
+    texts: List[str] = []
+    for content in contents or []:
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.text for part in (content.parts or []) if part.text)
+    return "\n".join(texts)
+
+
+def _schema_of(config: Any) -> Any:
+    if isinstance(config, dict):
+        return config.get("response_schema")
+    return getattr(config, "response_schema", None)
+
+
+class _TextResponse:
+    """Minimal `google.generativeai` response: only `.text` is used by the game."""
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _TextStream:
+    """Async iterable of `_TextResponse` chunks, like a `stream=True` response."""
+    def __init__(self, text: str):
+        self.text = text
+
+    async def __aiter__(self):
+        for start in range(0, len(self.text), STREAM_CHUNK_CHARS):
+            await asyncio.sleep(0)
+            yield _TextResponse(self.text[start:start + STREAM_CHUNK_CHARS])
+
+
+class BackendGenerativeModel:
+    """Stands in for `google.generativeai.GenerativeModel`."""
+    def __init__(self, model_name: str, backend: LLMBackend, live: Any = None):
+        self.model_name = model_name
+        self.backend = backend
+        self.live = live
+
+    def generate_content(self, prompt: str, generation_config: Any = None, **kwargs) -> _TextResponse:
+        request = LLMRequest("text", self.model_name, prompt, config=generation_config)
+        live_call = lambda: LLMResult(self.live.generate_content(prompt, generation_config=generation_config).text)
+        return _TextResponse(self.backend.respond(request, live_call).text)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, generation_config: Any = None, **kwargs):
+        request = LLMRequest("text", self.model_name, prompt, config=generation_config)
+
+        async def live_call() -> LLMResult:
+            response = await self.live.generate_content_async(prompt, stream=stream, generation_config=generation_config)
+            if not stream:
+                return LLMResult(response.text)
+            # Recording needs the whole text, so a recorded stream is only passed on once complete
+            return LLMResult("".join([chunk.text async for chunk in response]))
+
+        result = await self.backend.respond_async(request, live_call)
+        return _TextStream(result.text) if stream else _TextResponse(result.text)
+
+
+def _genai_response(result: LLMResult, schema: Any) -> types.GenerateContentResponse:
+    if result.image is not None:
+        part = types.Part(inline_data=types.Blob(mime_type=result.mime_type or "image/png", data=result.image))
+    elif result.text:
+        part = types.Part(text=result.text)
+    else:
+        return types.GenerateContentResponse(candidates=[])
+    response = types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))])
+    if schema is not None and result.text:
+        response.parsed = TypeAdapter(schema).validate_json(result.text)
+    return response
+
+
+def _genai_result(response: Any) -> LLMResult:
+    """Turns a live google.genai response (or stream of responses) into an `LLMResult`."""
+    is_stream = hasattr(response, "__iter__") and not isinstance(response, BaseModel)
+    texts: List[str] = []
+    for item in (response if is_stream else [response]):
+        for candidate in getattr(item, "candidates", None) or []:
+            for part in (candidate.content.parts if candidate.content else None) or []:
+                if part.inline_data and part.inline_data.data:
+                    return LLMResult(image=part.inline_data.data, mime_type=part.inline_data.mime_type)
+        if getattr(item, "text", None):
+            texts.append(item.text)
+    return LLMResult("".join(texts))
+
+
+class _BackendModels:
+    """Stands in for `google.genai.Client().models`."""
+    def __init__(self, backend: LLMBackend, live: Any = None):
+        self.backend = backend
+        self.live = live
+
+    def generate_content(self, model: str, contents: Any, config: Any = None, **kwargs) -> types.GenerateContentResponse:
+        schema = _schema_of(config)
+        request = LLMRequest("text", model, _text_of(contents), schema, config)
+        live_call = lambda: _genai_result(self.live.generate_content(model=model, contents=contents, config=config))
+        return _genai_response(self.backend.respond(request, live_call), schema)
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None, **kwargs) -> List[types.GenerateContentResponse]:
+        request = LLMRequest("image", model, _text_of(contents), config=config)
+        live_call = lambda: _genai_result(self.live.generate_content_stream(model=model, contents=contents, config=config))
+        result = self.backend.respond(request, live_call)
+        return [_genai_response(result, None)]
+
+
+class _BackendAsyncModels:
+    """Stands in for `google.genai.Client().aio.models`."""
+    def __init__(self, backend: LLMBackend, live: Any = None):
+        self.backend = backend
+        self.live = live
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None, **kwargs) -> types.GenerateContentResponse:
+        schema = _schema_of(config)
+        request = LLMRequest("text", model, _text_of(contents), schema, config)
+
+        async def live_call() -> LLMResult:
+            return _genai_result(await self.live.generate_content(model=model, contents=contents, config=config))
+
+        return _genai_response(await self.backend.respond_async(request, live_call), schema)
+
+
+class _BackendAio:
+    def __init__(self, backend: LLMBackend, live: Any = None):
+        self.models = _BackendAsyncModels(backend, live)
+
+
+class BackendClient:
+    """Stands in for `google.genai.Client` (the `models` and `aio.models` surfaces)."""
+    def __init__(self, backend: LLMBackend, live: Any = None):
+        self.models = _BackendModels(backend, live.models if live else None)
+        self.aio = _BackendAio(backend, live.aio.models if live else None)
@@ -0,0 +1,250 @@
+# llm_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from pydantic import TypeAdapter
+
+from global_defines import *
+
+DEFAULT_CACHE_MAX_ENTRIES = 256
+DEFAULT_CACHE_DISK_MAX_ENTRIES = 5000
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_CACHE_DIR = ".llm_cache"
+
+
+_schema_fingerprints: Dict[Any, str] = {}
+
+
+def _schema_fingerprint(schema: Any) -> str:
+    """Hash of a schema's JSON schema, memoized per schema object."""
+    fingerprint = _schema_fingerprints.get(schema)
+    if fingerprint is None:
+        try:
+            schema_json = json.dumps(TypeAdapter(schema).json_schema(), sort_keys=True)
+        except Exception:
+            schema_json = repr(schema)
+        fingerprint = hashlib.sha256(schema_json.encode("utf-8")).hexdigest()
+        _schema_fingerprints[schema] = fingerprint
+    return fingerprint
+
+
+class LLMResponseCache:
+    """
+    Opt-in, content-addressed cache of raw LLM responses.
+
+    Keys are derived from model + prompt + response schema, so identical requests
+    (campaign start scene, initial NPC, repeated DM questions...) are served without
+    a network round-trip. Two tiers:
+      - an in-memory LRU capped at `max_entries`;
+      - a persistent on-disk tier (one JSON file per key) with a TTL, so entries
+        survive dev restarts, capped at `disk_max_entries` (oldest evicted first).
+
+    Async callers use `get_async` / `put_async`, which do the disk I/O in a worker thread.
+    """
+    def __init__(self, enabled: Optional[bool] = None, max_entries: Optional[int] = None, disk_dir: Optional[str] = None, ttl_seconds: Optional[float] = None, disk_max_entries: Optional[int] = None):
+        if enabled is None:
+            enabled = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS))
+        self.disk_dir = disk_dir if disk_dir is not None else os.getenv("LLM_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.disk_max_entries = disk_max_entries or int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", DEFAULT_CACHE_DISK_MAX_ENTRIES))
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        # Keys stored on disk, oldest first
+        self._disk_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, schema: Any = None) -> str:
+        """
+        Builds the cache key for a request. `schema` may be a Pydantic model
+        (or `list[Model]`); its JSON schema is part of the key, so editing a
+        model invalidates its cached responses.
+        """
+        schema_fingerprint = _schema_fingerprint(schema) if schema is not None else ""
+        payload = json.dumps([model, schema_fingerprint, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+        return None
+
+    def _after_disk_read(self, key: str, text: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if text is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, text)
+        return text
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response text for `key`, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        text = self._get_memory(key)
+        if text is not None:
+            return text
+        return self._after_disk_read(key, self._read_disk(key))
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """`get` with the disk lookup done in a worker thread."""
+        if not self.enabled:
+            return None
+        text = self._get_memory(key)
+        if text is not None:
+            return text
+        if not self._on_disk(key):
+            return self._after_disk_read(key, None)
+        return self._after_disk_read(key, await asyncio.to_thread(self._read_disk, key))
+
+    def put(self, key: str, text: str):
+        """
+        Stores a (successfully parsed) response in both tiers.
+        """
+        if not self.enabled:
+            return
+        self._put_memory(key, text)
+        self._write_disk(key, text)
+
+    async def put_async(self, key: str, text: str):
+        """`put` with the disk write done in a worker thread."""
+        if not self.enabled:
+            return
+        self._put_memory(key, text)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, text)
+
+    def _put_memory(self, key: str, text: str):
+        with self._lock:
+            self._remember(key, text)
+            self.stats["stores"] += 1
+
+    def _on_disk(self, key: str) -> bool:
+        with self._lock:
+            return bool(self.disk_dir) and key in self._disk_keys
+
+    def _remember(self, key: str, text: str):
+        # Caller holds the lock
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self._on_disk(key):
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self._disk_keys.pop(key, None)
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            with self._lock:
+                self.stats["expired"] += 1
+                self._disk_keys.pop(key, None)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("text")
+
+    def _write_disk(self, key: str, text: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "text": text}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"{WARNING_COLOR}(LLM cache) Failed to write {path}: {e}{Colors.RESET}")
+            return
+
+        with self._lock:
+            self._disk_keys.pop(key, None)
+            self._disk_keys[key] = None
+            evicted = []
+            while len(self._disk_keys) > self.disk_max_entries:
+                evicted.append(self._disk_keys.popitem(last=False)[0])
+            self.stats["disk_evictions"] += len(evicted)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+    def _scan_disk(self):
+        """Removes on-disk entries older than the TTL and indexes the rest, oldest first."""
+        now = time.time()
+        entries = []
+        for file_name in os.listdir(self.disk_dir):
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, file_name)
+            try:
+                modified = os.path.getmtime(path)
+                if now - modified > self.ttl_seconds:
+                    os.remove(path)
+                    self.stats["expired"] += 1
+                else:
+                    entries.append((modified, file_name[:-len(".json")]))
+            except OSError:
+                continue
+        entries.sort()
+        excess = max(0, len(entries) - self.disk_max_entries)
+        for _, key in entries[:excess]:
+            try:
+                os.remove(self._disk_path(key))
+                self.stats["disk_evictions"] += 1
+            except OSError:
+                pass
+        self._disk_keys = OrderedDict((key, None) for _, key in entries[excess:])
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = len(self._disk_keys)
+        stats["enabled"] = self.enabled
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,143 @@
+# llm_clients.py
+
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+import google.generativeai as generativeai
+from google import genai
+from google.genai import types
+
+from global_defines import *
+from llm_cache import LLMResponseCache
+from single_flight import SingleFlight
+from llm_resilience import ResilientCaller
+from llm_scheduler import LLMScheduler
+from llm_routing import LLMRouter
+from llm_telemetry import LLMTelemetry
+from llm_backends import BackendClient, BackendGenerativeModel, create_backend
+
+# Connection pool defaults for the google.genai client (can be overridden through the environment)
+DEFAULT_HTTP_POOL_SIZE = 20
+DEFAULT_HTTP_KEEPALIVE_SECONDS = 60.0
+
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of LLM SDK clients.
+
+    Every `Game`, `Chapter`, `StoryManager` and `ImageGenerator` takes its clients
+    from here instead of building new ones, so connections (and their TLS
+    handshakes) are reused across turns and across games.
+
+    The LLM_HTTP_POOL_SIZE / LLM_HTTP_KEEPALIVE_SECONDS limits only apply to the
+    `google.genai` clients (`get_client`: Classifier and images). The
+    `google.generativeai` model handles talk gRPC over one multiplexed HTTP/2
+    channel that these limits do not cover; their concurrency is bounded by the
+    scheduler (LLM_MAX_CONCURRENCY) instead.
+
+    With LLM_BACKEND set to record, replay or stub, the handed-out clients are
+    wrappers from `llm_backends` with the same surface.
+    """
+    def __init__(self, pool_size: Optional[int] = None, keepalive_seconds: Optional[float] = None):
+        self.pool_size = pool_size or int(os.getenv("LLM_HTTP_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE))
+        self.keepalive_seconds = keepalive_seconds or float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", DEFAULT_HTTP_KEEPALIVE_SECONDS))
+        self.default_model = os.getenv("GEMINI_MODEL_DUMB", "gemini-2.0-flash-lite")
+
+        self._lock = threading.Lock()
+        self._clients: Dict[Optional[str], genai.Client] = {}
+        self._model_handles: Dict[str, generativeai.GenerativeModel] = {}
+        self._generativeai_configured = False
+        self.backend = create_backend()
+        self.response_cache = LLMResponseCache()
+        self.single_flight = SingleFlight()
+        self.telemetry = LLMTelemetry()
+        self.router = LLMRouter(telemetry=self.telemetry)
+        self.scheduler = LLMScheduler()
+        self.resilience = ResilientCaller(scheduler=self.scheduler)
+
+        self.stats = {
+            "clients_created": 0,
+            "client_lookups": 0,
+            "model_handles_created": 0,
+            "model_handle_lookups": 0,
+        }
+
+    def _http_options(self) -> types.HttpOptions:
+        limits = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_seconds,
+        )
+        return types.HttpOptions(
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        )
+
+    def get_client(self, api_key_env: str = "GOOGLE_API_KEY") -> genai.Client:
+        """
+        Returns the shared `google.genai` client for the API key stored in `api_key_env`.
+        """
+        api_key = os.getenv(api_key_env)
+        with self._lock:
+            self.stats["client_lookups"] += 1
+            client = self._clients.get(api_key)
+            if client is None:
+                live_client = None
+                if self.backend is None or self.backend.needs_live_clients:
+                    live_client = genai.Client(api_key=api_key, http_options=self._http_options())
+                client = BackendClient(self.backend, live_client) if self.backend else live_client
+                self._clients[api_key] = client
+                self.stats["clients_created"] += 1
+                print(f"{INFO_COLOR}(LLM) Created pooled client{Colors.RESET} (pool size: {ENTITY_COLOR}{self.pool_size}{Colors.RESET})")
+            return client
+
+    def get_generative_model(self, model_name: Optional[str] = None) -> generativeai.GenerativeModel:
+        """
+        Returns the shared `google.generativeai` model handle for `model_name`.
+        `generativeai.configure` is only called once per process. The HTTP pool
+        limits do not apply to these handles (see the class docstring).
+        """
+        model_name = model_name or self.default_model
+        with self._lock:
+            self.stats["model_handle_lookups"] += 1
+            if not self._generativeai_configured:
+                generativeai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                self._generativeai_configured = True
+
+            handle = self._model_handles.get(model_name)
+            if handle is None:
+                handle = generativeai.GenerativeModel(model_name)
+                if self.backend:
+                    handle = BackendGenerativeModel(model_name, self.backend, handle if self.backend.needs_live_clients else None)
+                self._model_handles[model_name] = handle
+                self.stats["model_handles_created"] += 1
+            return handle
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters that show how often pooled clients were reused.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pool_size"] = self.pool_size
+        stats["client_reuses"] = stats["client_lookups"] - stats["clients_created"]
+        stats["model_handle_reuses"] = stats["model_handle_lookups"] - stats["model_handles_created"]
+        stats["backend"] = self.backend.get_stats() if self.backend else {"mode": "live"}
+        return stats
+
+
+_registry: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    """
+    Returns the process-wide `LLMClientRegistry`, creating it on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMClientRegistry()
+        return _registry
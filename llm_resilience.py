@@ -0,0 +1,214 @@
+# llm_resilience.py
+
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+from google.api_core import exceptions as api_exceptions
+from google.genai import errors as genai_errors
+
+from global_defines import *
+from llm_scheduler import LLMPriority, LLMScheduler
+from turn_budget import BudgetExhausted, get_turn_budget
+from utils import RollingWindow
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_BASE_SECONDS = 0.5
+DEFAULT_BACKOFF_MAX_SECONDS = 8.0
+DEFAULT_HEDGE_PERCENTILE = 95.0
+HEDGE_MIN_SAMPLES = 10
+
+_TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    httpx.TransportError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.GatewayTimeout,
+    genai_errors.ServerError,
+)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """True for errors worth retrying: timeouts, connection problems, 5xx and 429."""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, genai_errors.ClientError) and error.code == 429
+
+
+class ResilientCaller:
+    """
+    Runs LLM requests inside the current `TurnBudget`.
+
+    - every attempt is bounded by the time left in the turn budget;
+    - transient errors are retried with jittered exponential backoff;
+    - optionally, when an attempt is slower than the p95 latency of its
+      operation, a duplicate (hedge) request is started and whichever finishes
+      first wins;
+    - every request (retries and hedges included) is admitted by the scheduler;
+      streamed responses hold their slot (see `slot`) until they are consumed.
+    """
+    def __init__(self, max_attempts: Optional[int] = None, hedge_enabled: Optional[bool] = None, scheduler: Optional[LLMScheduler] = None):
+        self.scheduler = scheduler or LLMScheduler()
+        self.max_attempts = max_attempts or int(os.getenv("LLM_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        if hedge_enabled is None:
+            hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE))
+        self.backoff_base = DEFAULT_BACKOFF_BASE_SECONDS
+        self.backoff_max = DEFAULT_BACKOFF_MAX_SECONDS
+
+        self.latencies: Dict[str, RollingWindow] = {}
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "budget_exhausted": 0,
+            "failures": 0,
+        }
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """Seconds to wait before hedging `operation`, or None when hedging is off."""
+        window = self.latencies.get(operation)
+        if not self.hedge_enabled or window is None or len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        return window.percentile(self.hedge_percentile)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, capped exponential]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _exhausted(self, operation: str) -> BudgetExhausted:
+        self.stats["budget_exhausted"] += 1
+        return BudgetExhausted(f"No turn budget left for {operation}")
+
+    async def call(self, operation: str, make_call: Callable[[], Awaitable[Any]], hedge: bool = True, model: str = "", priority: LLMPriority = LLMPriority.NORMAL, scheduled: bool = True) -> Any:
+        """
+        Awaits `make_call()` with retries (and hedging, if `hedge`) inside the turn budget.
+        `operation` groups latency samples, e.g. "ObjectGenerator:ActionOutcome";
+        `model` and `priority` are used for scheduling. Pass `scheduled=False` when the
+        caller already holds a scheduler slot for the request.
+
+        Raises:
+            BudgetExhausted: If the turn budget ran out before a response arrived.
+        """
+        budget = get_turn_budget()
+        self.stats["calls"] += 1
+        scheduled_call = (lambda: self.scheduler.run(model, priority, make_call)) if scheduled else make_call
+
+        for attempt in range(self.max_attempts):
+            timeout = budget.remaining() if budget else None
+            if timeout is not None and timeout <= 0:
+                raise self._exhausted(operation)
+
+            started_at = time.monotonic()
+            try:
+                result = await self._attempt(operation, scheduled_call, timeout, hedge)
+            except Exception as e:
+                if budget and budget.expired:
+                    raise self._exhausted(operation) from e
+                if not is_transient_error(e) or attempt == self.max_attempts - 1:
+                    self.stats["failures"] += 1
+                    raise
+
+                delay = self._backoff(attempt)
+                if budget and delay >= budget.remaining():
+                    raise self._exhausted(operation) from e
+                self.stats["retries"] += 1
+                print(f"{WARNING_COLOR}(LLM) {operation} failed ({type(e).__name__}: {e}); retry {attempt + 1}/{self.max_attempts - 1} in {delay:.2f}s{Colors.RESET}")
+                await asyncio.sleep(delay)
+                continue
+
+            self.latencies.setdefault(operation, RollingWindow()).add(time.monotonic() - started_at)
+            return result
+
+    async def _attempt(self, operation: str, make_call: Callable[[], Awaitable[Any]], timeout: Optional[float], hedge: bool) -> Any:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        primary = asyncio.ensure_future(make_call())
+        pending = {primary}
+        try:
+            hedge_delay = self.hedge_delay(operation) if hedge else None
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.stats["hedges"] += 1
+                    print(f"{Colors.DIM}(LLM) {operation} slower than p{self.hedge_percentile:.0f} ({hedge_delay:.2f}s), hedging{Colors.RESET}")
+                    pending.add(asyncio.ensure_future(make_call()))
+                else:
+                    pending = done
+
+            last_error: Optional[BaseException] = None
+            while pending:
+                left = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"{operation} did not finish within the turn budget")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error  # type: ignore
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @asynccontextmanager
+    async def slot(self, operation: str, model: str = "", priority: LLMPriority = LLMPriority.NORMAL) -> AsyncIterator[None]:
+        """
+        Holds one scheduler slot for the block, e.g. while a streamed response is opened
+        (with `call(..., scheduled=False)`) and consumed. Waiting for the slot counts
+        against the turn budget.
+
+        Raises:
+            BudgetExhausted: If the turn budget ran out before a slot was granted.
+        """
+        budget = get_turn_budget()
+        timeout = budget.remaining() if budget else None
+        if timeout is not None and timeout <= 0:
+            raise self._exhausted(operation)
+        try:
+            slot = self.scheduler.slot(model, priority, timeout=timeout)
+            await slot.__aenter__()
+        except asyncio.TimeoutError as e:
+            raise self._exhausted(operation) from e
+        try:
+            yield
+        finally:
+            await slot.__aexit__(None, None, None)
+
+    async def iterate(self, operation: str, stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        Re-yields the items of a streamed response, giving up with `BudgetExhausted`
+        if the next item does not arrive before the turn budget runs out.
+        """
+        budget = get_turn_budget()
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                if budget:
+                    item = await asyncio.wait_for(iterator.__anext__(), timeout=budget.remaining())
+                else:
+                    item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError as e:
+                raise self._exhausted(operation) from e
+            yield item
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["hedge_enabled"] = self.hedge_enabled
+        stats["p95_latency_seconds"] = {
+            operation: window.percentile(95)
+            for operation, window in self.latencies.items()
+        }
+        return stats
@@ -0,0 +1,186 @@
+# llm_routing.py
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from global_defines import *
+from llm_telemetry import LLMTelemetry
+from utils import RollingWindow, estimate_tokens
+
+DEFAULT_ROUTES_FILE = "llm_routes.json"
+
+
+class CallSite(str, Enum):
+    """Places in the game that call an LLM. Each one can be routed to its own model."""
+    INTENT_CLASSIFICATION = "intent_classification"
+    ACTION_OUTCOME = "action_outcome"
+    AUDIT = "audit"
+    AFTER_ACTION = "after_action"
+    NPC_ACTION = "npc_action"
+    TURN_ORDER = "turn_order"
+    SUMMARIZATION = "summarization"
+    SCENE_GENERATION = "scene_generation"
+    SCENE_INTRODUCTION = "scene_introduction"
+    CHARACTER_GENERATION = "character_generation"
+    STATE_UPDATE = "state_update"
+    STORY_CHECK = "story_check"
+    FIGHT_SETUP = "fight_setup"
+    IMAGE = "image"
+    DEFAULT = "default"
+
+
+class Route:
+    """The model and generation config used for one call site."""
+    def __init__(self, call_site: CallSite, model: str, generation_config: Optional[Dict[str, Any]] = None):
+        self.call_site = call_site
+        self.model = model
+        self.generation_config = generation_config or {}
+
+    @property
+    def cache_namespace(self) -> str:
+        """Model plus generation config, so cached responses never cross configurations."""
+        if not self.generation_config:
+            return self.model
+        return f"{self.model}|{json.dumps(self.generation_config, sort_keys=True)}"
+
+
+class RouteStats:
+    """Rolling latency, token usage and failure counters of one (call site, model) pair."""
+    def __init__(self):
+        self.latencies = RollingWindow(size=200)
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    def to_dict(self) -> dict:
+        successes = self.calls - self.failures
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "failure_rate": self.failures / self.calls if self.calls else 0.0,
+            "latency_p50": self.latencies.percentile(50),
+            "latency_p95": self.latencies.percentile(95),
+            "latency_p99": self.latencies.percentile(99),
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "avg_prompt_tokens": self.prompt_tokens / successes if successes else 0,
+            "avg_response_tokens": self.response_tokens / successes if successes else 0,
+        }
+
+
+def response_token_usage(response: Any, prompt: str, response_text: Optional[str] = None) -> Tuple[int, int]:
+    """
+    (prompt tokens, response tokens) of a response. Uses the SDK's usage metadata
+    when it is there, otherwise estimates from the text.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    response_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(prompt)
+    if response_tokens is None:
+        if response_text is None:
+            try:
+                response_text = response.text or ""
+            except (AttributeError, ValueError):
+                response_text = ""
+        response_tokens = estimate_tokens(response_text)
+    return prompt_tokens, response_tokens
+
+
+class TrackedCall:
+    """Handle given to the caller by `LLMRouter.track`; report the response with `set_response`."""
+    def __init__(self, route: Route, prompt: str):
+        self.route = route
+        self.prompt = prompt
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.has_response = False
+
+    def set_response(self, response: Any, response_text: Optional[str] = None):
+        self.prompt_tokens, self.response_tokens = response_token_usage(response, self.prompt, response_text)
+        self.has_response = True
+
+
+class LLMRouter:
+    """
+    Routing table: call site -> model + generation config.
+
+    Routes come from a JSON file (LLM_ROUTES_FILE, default `llm_routes.json`):
+        {"audit": {"model": "gemini-2.0-flash-lite", "generation_config": {"temperature": 0.2}}}
+    and `LLM_ROUTE_<CALL_SITE>_MODEL` environment variables, which take precedence.
+    Unrouted call sites use the calling component's default model.
+    Every tracked call is also reported to `telemetry`.
+    """
+    def __init__(self, routes_file: Optional[str] = None, telemetry: Optional[LLMTelemetry] = None):
+        self.routes_file = routes_file or os.getenv("LLM_ROUTES_FILE", DEFAULT_ROUTES_FILE)
+        self.telemetry = telemetry
+        self.table: Dict[str, Dict[str, Any]] = self._load_table()
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], RouteStats] = {}
+
+    def _load_table(self) -> Dict[str, Dict[str, Any]]:
+        table: Dict[str, Dict[str, Any]] = {}
+        if self.routes_file and os.path.exists(self.routes_file):
+            try:
+                with open(self.routes_file, "r", encoding="utf-8") as f:
+                    table = json.load(f)
+                print(f"{INFO_COLOR}(LLM) Loaded {len(table)} routes from {self.routes_file}{Colors.RESET}")
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"{ERROR_COLOR}(LLM) Failed to load routes from {self.routes_file}: {e}{Colors.RESET}")
+
+        for call_site in CallSite:
+            model = os.getenv(f"LLM_ROUTE_{call_site.name}_MODEL")
+            if model:
+                table.setdefault(call_site.value, {})["model"] = model
+        return table
+
+    def resolve(self, call_site: CallSite, default_model: str) -> Route:
+        """Returns the route for `call_site`, falling back to `default_model`."""
+        entry = self.table.get(call_site.value, {})
+        return Route(call_site, entry.get("model") or default_model, entry.get("generation_config"))
+
+    @contextmanager
+    def track(self, route: Route, prompt: str) -> Iterator[TrackedCall]:
+        """
+        Measures one call on `route` (retries and scheduling included). Exceptions
+        count as failures and are re-raised.
+        """
+        call = TrackedCall(route, prompt)
+        started_at = time.monotonic()
+        try:
+            yield call
+        except Exception as e:
+            self._record(route, time.monotonic() - started_at, call, error=type(e).__name__)
+            raise
+        self._record(route, time.monotonic() - started_at, call)
+
+    def _record(self, route: Route, latency: float, call: TrackedCall, error: Optional[str] = None):
+        with self._lock:
+            stats = self._stats.setdefault((route.call_site.value, route.model), RouteStats())
+            stats.calls += 1
+            if error:
+                stats.failures += 1
+            else:
+                stats.latencies.add(latency)
+                stats.prompt_tokens += call.prompt_tokens
+                stats.response_tokens += call.response_tokens
+
+        if self.telemetry:
+            # Failed calls never got usage metadata; their prompt size still matters
+            prompt_tokens = call.prompt_tokens if call.has_response else estimate_tokens(call.prompt)
+            self.telemetry.record(route.call_site.value, route.model, len(call.prompt), prompt_tokens, call.response_tokens, latency, error)
+
+    def get_stats(self) -> dict:
+        """Per call site, per model statistics plus the configured table."""
+        with self._lock:
+            routes: Dict[str, Dict[str, dict]] = {}
+            for (call_site, model), stats in self._stats.items():
+                routes.setdefault(call_site, {})[model] = stats.to_dict()
+        return {"table": self.table, "routes": routes}
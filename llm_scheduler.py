@@ -0,0 +1,229 @@
+# llm_scheduler.py
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from global_defines import *
+from utils import RollingWindow
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_INTERACTIVE_RESERVED_SLOTS = 2
+DEFAULT_RATE_LIMIT_RPM = 120.0
+DEFAULT_RATE_LIMIT_BURST = 20
+# Share of each token bucket that background work may not consume
+BACKGROUND_TOKEN_RESERVE = 0.2
+
+
+class LLMPriority(IntEnum):
+    """Priority classes of LLM requests (lower value is served first)."""
+    INTERACTIVE = 0  # A player is waiting for it: intent routing, action outcomes
+    NORMAL = 1
+    BACKGROUND = 2  # Audits, story checks, context trimming, image prompts
+
+
+class TokenBucket:
+    """Requests-per-minute limiter for one model. Caller holds the scheduler lock."""
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def try_take(self, reserve: float = 0.0) -> bool:
+        """Takes one token if at least `reserve` tokens stay in the bucket afterwards."""
+        self._refill()
+        if self.tokens - 1 >= reserve:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until(self, reserve: float = 0.0) -> float:
+        self._refill()
+        missing = reserve + 1 - self.tokens
+        return max(0.0, missing / self.rate_per_second) if self.rate_per_second > 0 else 1.0
+
+
+class _Waiter:
+    def __init__(self, priority: LLMPriority, seq: int, model: str):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Central admission control for LLM requests.
+
+    Every request waits here for a free concurrency slot and a token from its
+    model's bucket. Waiters are served by priority class, then in arrival order.
+    Background requests can never take the last `interactive_reserved_slots`
+    slots or the reserved share of a bucket, so player-facing calls keep a fast
+    lane when background work piles up or the provider limit is near.
+
+    Thread-safe: the image worker runs its own event loop in another thread.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, interactive_reserved_slots: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        if interactive_reserved_slots is None:
+            interactive_reserved_slots = int(os.getenv("LLM_INTERACTIVE_RESERVED_SLOTS", DEFAULT_INTERACTIVE_RESERVED_SLOTS))
+        self.interactive_reserved_slots = min(interactive_reserved_slots, self.max_concurrency - 1)
+        self.default_rpm = float(os.getenv("LLM_RATE_LIMIT_RPM", DEFAULT_RATE_LIMIT_RPM))
+        self.burst = int(os.getenv("LLM_RATE_LIMIT_BURST", DEFAULT_RATE_LIMIT_BURST))
+        self.model_rpm = self._parse_model_limits(os.getenv("LLM_RATE_LIMITS", ""))
+
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight = 0
+        self._seq = itertools.count()
+
+        self.wait_times: Dict[LLMPriority, RollingWindow] = {p: RollingWindow() for p in LLMPriority}
+        self.stats = {
+            "granted": {p.name: 0 for p in LLMPriority},
+            "queued": {p.name: 0 for p in LLMPriority},
+            "cancelled_while_queued": 0,
+        }
+
+    @staticmethod
+    def _parse_model_limits(spec: str) -> Dict[str, float]:
+        """Parses "model-a=30,model-b=10" (requests per minute per model)."""
+        limits = {}
+        for item in spec.split(","):
+            if "=" in item:
+                model, rpm = item.split("=", 1)
+                limits[model.strip()] = float(rpm)
+        return limits
+
+    def _bucket(self, model: str) -> Optional[TokenBucket]:
+        rpm = self.model_rpm.get(model, self.default_rpm)
+        if rpm <= 0:
+            return None  # No rate limit for this model
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = TokenBucket(rpm, self.burst)
+        return bucket
+
+    def _slot_limit(self, priority: LLMPriority) -> int:
+        if priority == LLMPriority.BACKGROUND:
+            return self.max_concurrency - self.interactive_reserved_slots
+        return self.max_concurrency
+
+    def _token_reserve(self, priority: LLMPriority) -> float:
+        return self.burst * BACKGROUND_TOKEN_RESERVE if priority == LLMPriority.BACKGROUND else 0.0
+
+    def _dispatch(self):
+        """Grants slots to the best eligible waiters. Caller holds the lock."""
+        for waiter in sorted(self._waiters):
+            if self._in_flight >= self.max_concurrency:
+                break
+            if self._in_flight >= self._slot_limit(waiter.priority):
+                continue
+            bucket = self._bucket(waiter.model)
+            if bucket and not bucket.try_take(self._token_reserve(waiter.priority)):
+                continue
+            self._waiters.remove(waiter)
+            self._in_flight += 1
+            waiter.granted = True
+            self.stats["granted"][waiter.priority.name] += 1
+            self.wait_times[waiter.priority].add(time.monotonic() - waiter.enqueued_at)
+            waiter.loop.call_soon_threadsafe(waiter.event.set)
+
+    def _refill_delay(self, waiter: _Waiter) -> Optional[float]:
+        """How long `waiter` should sleep before re-checking a rate-limited bucket."""
+        bucket = self._bucket(waiter.model)
+        if bucket is None:
+            return None
+        delay = bucket.seconds_until(self._token_reserve(waiter.priority))
+        return delay if delay > 0 else None
+
+    async def _acquire(self, model: str, priority: LLMPriority):
+        waiter = _Waiter(priority, next(self._seq), model)
+        with self._lock:
+            self._waiters.append(waiter)
+            self._dispatch()
+            if not waiter.granted:
+                self.stats["queued"][priority.name] += 1
+        try:
+            while not waiter.granted:
+                with self._lock:
+                    delay = self._refill_delay(waiter)
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                waiter.event.clear()
+                if not waiter.granted:
+                    with self._lock:
+                        self._dispatch()
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._in_flight -= 1
+                else:
+                    self._waiters.remove(waiter)
+                    self.stats["cancelled_while_queued"] += 1
+                self._dispatch()
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: LLMPriority, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Holds one slot (and spends one rate-limit token for `model`) for the duration of the block,
+        e.g. while a streamed response is consumed.
+
+        Raises:
+            asyncio.TimeoutError: If no slot was granted within `timeout` seconds.
+        """
+        await asyncio.wait_for(self._acquire(model, priority), timeout=timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run(self, model: str, priority: LLMPriority, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Awaits `call()` once a slot and a rate-limit token for `model` are available.
+        """
+        async with self.slot(model, priority):
+            return await call()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            queue_depth = {p.name: 0 for p in LLMPriority}
+            for waiter in self._waiters:
+                queue_depth[waiter.priority.name] += 1
+            stats = {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "interactive_reserved_slots": self.interactive_reserved_slots,
+                "queue_depth": queue_depth,
+                "granted": dict(self.stats["granted"]),
+                "queued": dict(self.stats["queued"]),
+                "cancelled_while_queued": self.stats["cancelled_while_queued"],
+                "tokens_available": {model: round(bucket.tokens, 2) for model, bucket in self._buckets.items()},
+            }
+        stats["p95_wait_seconds"] = {p.name: self.wait_times[p].percentile(95) for p in LLMPriority}
+        return stats
@@ -0,0 +1,146 @@
+# llm_telemetry.py
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from global_defines import *
+from utils import RollingWindow
+
+DEFAULT_TELEMETRY_RING_SIZE = 1000
+DEFAULT_TELEMETRY_FLUSH_RECORDS = 32
+# Number of first calls per call site that form the prompt-size baseline
+BASELINE_CALLS = 10
+
+
+class CallSiteAggregate:
+    """Running prompt/response size and latency figures for one call site."""
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_chars_total = 0
+        self.prompt_tokens_total = 0
+        self.response_tokens_total = 0
+        self.prompt_chars_max = 0
+        self.baseline_prompt_tokens: List[int] = []
+        self.recent_prompt_tokens = RollingWindow(size=50)
+        self.recent_prompt_chars = RollingWindow(size=50)
+        self.latencies = RollingWindow(size=200)
+        self.models: Dict[str, int] = {}
+
+    def add(self, record: dict):
+        self.calls += 1
+        if record["error"]:
+            self.errors += 1
+        self.models[record["model"]] = self.models.get(record["model"], 0) + 1
+        self.prompt_chars_total += record["prompt_chars"]
+        self.prompt_tokens_total += record["prompt_tokens"]
+        self.response_tokens_total += record["response_tokens"]
+        self.prompt_chars_max = max(self.prompt_chars_max, record["prompt_chars"])
+        if len(self.baseline_prompt_tokens) < BASELINE_CALLS:
+            self.baseline_prompt_tokens.append(record["prompt_tokens"])
+        self.recent_prompt_tokens.add(record["prompt_tokens"])
+        self.recent_prompt_chars.add(record["prompt_chars"])
+        self.latencies.add(record["latency"])
+
+    def to_dict(self) -> dict:
+        baseline = sum(self.baseline_prompt_tokens) / len(self.baseline_prompt_tokens) if self.baseline_prompt_tokens else 0
+        recent = sum(self.recent_prompt_tokens.samples) / len(self.recent_prompt_tokens) if len(self.recent_prompt_tokens) else 0
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "models": dict(self.models),
+            "prompt_chars_avg": self.prompt_chars_total / self.calls if self.calls else 0,
+            "prompt_chars_p95": self.recent_prompt_chars.percentile(95),
+            "prompt_chars_max": self.prompt_chars_max,
+            "prompt_tokens_total": self.prompt_tokens_total,
+            "response_tokens_total": self.response_tokens_total,
+            "prompt_tokens_baseline_avg": baseline,
+            "prompt_tokens_recent_avg": recent,
+            # > 1 means prompts for this call site grew since the start of the session
+            "prompt_growth_ratio": recent / baseline if baseline else None,
+            "latency_p50": self.latencies.percentile(50),
+            "latency_p95": self.latencies.percentile(95),
+        }
+
+
+class LLMTelemetry:
+    """
+    Per-call LLM instrumentation.
+
+    Every call is kept in an in-memory ring (LLM_TELEMETRY_RING_SIZE) and, when
+    LLM_TELEMETRY_FILE is set, appended to that file as one JSON line; lines are
+    buffered and written through one open handle LLM_TELEMETRY_FLUSH_RECORDS at a
+    time, and `close` writes the rest. Per call site aggregates make prompt growth
+    over a long session visible.
+    """
+    def __init__(self, ring_size: Optional[int] = None, sink_path: Optional[str] = None):
+        self.ring_size = ring_size or int(os.getenv("LLM_TELEMETRY_RING_SIZE", DEFAULT_TELEMETRY_RING_SIZE))
+        self.sink_path = sink_path if sink_path is not None else os.getenv("LLM_TELEMETRY_FILE", "")
+        self._ring = deque(maxlen=self.ring_size)
+        self._aggregates: Dict[str, CallSiteAggregate] = {}
+        self.flush_records = max(1, int(os.getenv("LLM_TELEMETRY_FLUSH_RECORDS", DEFAULT_TELEMETRY_FLUSH_RECORDS)))
+        self._sink = None
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+
+    def record(self, call_site: str, model: str, prompt_chars: int, prompt_tokens: int, response_tokens: int, latency: float, error: Optional[str] = None):
+        record = {
+            "timestamp": time.time(),
+            "call_site": call_site,
+            "model": model,
+            "prompt_chars": prompt_chars,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "latency": round(latency, 4),
+            "error": error,
+        }
+        with self._lock:
+            self._ring.append(record)
+            self._aggregates.setdefault(call_site, CallSiteAggregate()).add(record)
+            if self.sink_path:
+                self._pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+                if len(self._pending) >= self.flush_records:
+                    self._flush()
+
+    def _flush(self):
+        # Caller holds the lock, so lines from different threads never interleave
+        if not self._pending or not self.sink_path:
+            return
+        try:
+            if self._sink is None:
+                self._sink = open(self.sink_path, "a", encoding="utf-8")
+            self._sink.writelines(self._pending)
+            self._sink.flush()
+        except OSError as e:
+            print(f"{WARNING_COLOR}(LLM telemetry) Failed to write {self.sink_path}, file output disabled: {e}{Colors.RESET}")
+            self._close_sink()
+            self.sink_path = ""
+        self._pending = []
+
+    def _close_sink(self):
+        if self._sink is not None:
+            try:
+                self._sink.close()
+            except OSError:
+                pass
+            self._sink = None
+
+    def close(self):
+        """Writes the buffered records and closes the telemetry file."""
+        with self._lock:
+            self._flush()
+            self._close_sink()
+
+    def recent(self, limit: int = 50, call_site: Optional[str] = None) -> List[dict]:
+        """The latest `limit` calls, newest last, optionally for one call site."""
+        with self._lock:
+            records = [r for r in self._ring if call_site is None or r["call_site"] == call_site]
+        return records[-limit:] if limit > 0 else []
+
+    def get_aggregates(self) -> dict:
+        with self._lock:
+            return {call_site: aggregate.to_dict() for call_site, aggregate in self._aggregates.items()}
@@ -13,6 +13,10 @@ from pydantic import BaseModel
 from global_defines import *
 from models.schemas import Character
 from game import Game
+from generator import ObjectGenerator
+from llm_routing import CallSite
+from rules_engine import RulesEngine
+from event_log import DEFAULT_EVENT_PAGE_SIZE
 
 
 # --- FastAPI Setup ---
@@ -60,6 +64,11 @@ async def startup_event():
     await game.introduce_scene()
     asyncio.create_task(game.game_loop())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    game.chapter.event_log.close()
+    game.llm_registry.telemetry.close()
+
 # --- HTML Routes ---
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -75,7 +84,7 @@ async def player(request: Request, name: str):
 
 @app.get("/admin", response_class=HTMLResponse)
 async def admin(request: Request):
-    return templates.TemplateResponse("admin.html", {"request": request, "event_log": game.chapter.event_log})
+    return templates.TemplateResponse("admin.html", {"request": request, "event_log": game.chapter.get_recent_events()})
 
 @app.get("/character-creation", response_class=HTMLResponse)
 async def character_creation(request: Request):
@@ -102,7 +111,7 @@ async def create_character(payload: CharacterCreatePayload):
         f"Charisma {payload.stats['charisma']}. "
         "Generate a complete character sheet with abilities, inventory, and other details."
     )
-    new_char = game.generator.generate(Character, prompt, game.context, "Russian")
+    new_char = await game.generator.generate_async(Character, prompt, game.context, "Russian", call_site=CallSite.CHARACTER_GENERATION)
     new_char.is_player = True
     game.chapter.image_generator.submit_generation_task(new_char.model_dump_json(), new_char.name)
     await game.add_player_character(new_char)
@@ -117,7 +126,7 @@ async def get_game_state():
         "characters": [p.model_dump() for p in game.chapter.characters],
         "chat_history": game.message_history,
         "game_mode": game.chapter.game_mode.name,
-        "turn_order": [p for p in game.chapter.turn_order],
+        "turn_order": game.chapter.get_turn_order_names(),
         "story": {
             "title": story_manager.story.title,
             "main_goal": story_manager.story.main_goal,
@@ -125,10 +134,45 @@ async def get_game_state():
             "all_plot_points": [p.model_dump() for p in story_manager.story.plot_points]
         },
         "context": game.context,
-        "event_log": game.chapter.event_log
+        # Only the tail; older events are paged through /api/events
+        "event_log": game.chapter.get_recent_events()
     }
     return JSONResponse(content=state)
 
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    registry = game.llm_registry
+    return JSONResponse(content={
+        "clients": registry.get_stats(),
+        "cache": registry.response_cache.get_stats(),
+        "single_flight": registry.single_flight.get_stats(),
+        "resilience": registry.resilience.get_stats(),
+        "scheduler": registry.scheduler.get_stats(),
+        "routes": registry.router.get_stats(),
+        "schema_prompts": ObjectGenerator.get_schema_prompt_stats(),
+        "json_recovery": ObjectGenerator.get_json_recovery_stats(),
+        "rules_engine": RulesEngine.get_stats(),
+        "context_cache": game.chapter.state.get_stats(),
+        "event_log": game.chapter.event_log.get_stats(),
+        "summarizer": game.chapter.summarizer.get_stats(),
+        "history_index": game.chapter.history.get_stats(),
+        "npc_prefetch": game.chapter.npc_prefetcher.get_stats(),
+    })
+
+@app.get("/api/llm/telemetry")
+async def get_llm_telemetry(limit: int = Query(50), call_site: str | None = Query(None)):
+    telemetry = game.llm_registry.telemetry
+    return JSONResponse(content={
+        "call_sites": telemetry.get_aggregates(),
+        "recent": telemetry.recent(limit, call_site),
+    })
+
+@app.get("/api/events")
+async def get_events(before: int | None = Query(None), limit: int = Query(DEFAULT_EVENT_PAGE_SIZE, ge=1, le=500)):
+    # Older pages are read from the segment file; keep that off the event loop
+    page = await asyncio.to_thread(game.chapter.event_log.page, before, limit)
+    return JSONResponse(content=page)
+
 @app.get("/api/get_current_character")
 async def get_current_character():
     active_character_name = game.chapter.get_active_character_name()
@@ -175,7 +175,27 @@ class ChangesToMake(BaseModel):
     """
     object_type: str = Field(description="Тип объекта, который нужно изменить. Варианты: 'character', 'scene'. Important: if for example a character took their sword and left it in the middle of the road it should be a change for the charactera and a cahnge for the scene as well.")
     object_name: str = Field(description="Имя объекта, который нужно изменить. Если тип объекта 'character', то это имя персонажа. Если тип объекта 'scene', то это название сцены.")
-    changes: str = Field(description="Описание изменений, которые нужно внести в объект. Все изменения, которые поисаны в запросе обязяны быть записаны в этом поле. Изменения должны быть в формате инструкций для выполнения. Все изменения, которые возможно измерить числом должны быть описаны числом. Если информации для того, тчобы оценить числовое значение недостаточно, оченить проблизительно и записать числом.")
+    changes: str = Field(default="", description="Описание изменений, которые нужно внести в объект и которые не выражены полями hp_delta, conditions_add, conditions_remove и items_remove (пустая строка, если таких нет). Изменения должны быть в формате инструкций для выполнения. Все изменения, которые возможно измерить числом должны быть описаны числом. Если информации для того, тчобы оценить числовое значение недостаточно, оченить проблизительно и записать числом. Простые механические изменения персонажа пиши короткими фразами по одной на строку: 'current_hp: -7', 'ac: +2', 'add condition: Отравлен', 'remove condition: Отравлен', 'remove item: Зелье лечения'.")
+    # Structured mechanical changes of a character: applied in code without another LLM call
+    hp_delta: Optional[int] = Field(default=None, description="Only for characters: change of current_hp (negative for damage, positive for healing), e.g. -7. Leave null if HP does not change.")
+    conditions_add: List[str] = Field(default_factory=list, description="Only for characters: names of conditions the character gains, e.g. ['Отравлен'].")
+    conditions_remove: List[str] = Field(default_factory=list, description="Only for characters: names of conditions the character loses.")
+    items_remove: List[str] = Field(default_factory=list, description="Only for characters: names of inventory items used up or lost (one entry per unit).")
+
+class PatchOp(str, Enum):
+    ADD = "add"
+    REMOVE = "remove"
+    REPLACE = "replace"
+
+class PatchOperation(BaseModel):
+    """One JSON-Patch style operation on a character or scene."""
+    op: PatchOp = Field(description="'replace' sets an existing value, 'add' appends to a list (path ending in '/-') or inserts at an index, 'remove' deletes a list element.")
+    path: str = Field(description="JSON Pointer to the value, e.g. '/current_hp', '/conditions/-', '/inventory/2/quantity'.")
+    value: Any = Field(default=None, description="The new value (a number, string, boolean or a complete object for list items). Omit for 'remove'.")
+
+class StatePatch(BaseModel):
+    """The minimal set of operations that applies the requested changes to an object."""
+    operations: List[PatchOperation] = Field(description="Only the operations required by the changes, in the order they must be applied. Empty if nothing changes.")
 
 class ActionOutcome(BaseModel):
     """The result of a character's action, including the narrative and its mechanical effects."""
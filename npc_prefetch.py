@@ -0,0 +1,193 @@
+# npc_prefetch.py
+
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Dict, Optional
+
+from global_defines import *
+from llm_routing import CallSite
+from llm_scheduler import LLMPriority
+from models.game_modes import GameMode
+from models.schemas import Character
+from turn_budget import BudgetExhausted, get_turn_budget
+
+if TYPE_CHECKING:
+    from chapter_logic import Chapter
+    from character_registry import CharacterEntry
+
+DEFAULT_NPC_PREFETCH_MIN_HIT_RATE = 0.25
+# Outcomes (used or wasted) of the latest prefetches the hit rate is judged on
+RECENT_OUTCOMES = 10
+MIN_OUTCOMES_FOR_BACKOFF = 5
+# While backing off, one prefetch in this many is still made so a better hit rate is noticed
+BACKOFF_PROBE_EVERY = 5
+
+
+def _hp_band(character: Character) -> int:
+    # Quarters of max HP: the NPC tactics prompt reasons in these terms (e.g. "below 25%")
+    if not character.is_alive or character.current_hp <= 0:
+        return -1
+    return min(3, character.current_hp * 4 // max(1, character.max_hp))
+
+
+def tactical_fingerprint(chapter: 'Chapter', actor: Character) -> tuple:
+    """
+    The parts of the game state an NPC's action choice depends on: who is in the fight, their
+    HP band and conditions, the actor's resources, the scene and the game mode. Exact HP and
+    free-text positions are left out; the chosen action is resolved against the live state anyway.
+    """
+    characters = tuple(sorted(
+        (character.name, _hp_band(character), tuple(sorted(character.conditions)))
+        for character in chapter.characters
+    ))
+    resources = (
+        tuple(sorted(item.name for item in actor.inventory)),
+        tuple(sorted(ability.name for ability in actor.abilities)),
+    )
+    scene = chapter.scene.name if chapter.scene is not None else None
+    return (chapter.game_mode, scene, characters, resources)
+
+
+class NPCSpeculation:
+    """An action choice generated ahead of time for one NPC, with the state it was based on."""
+    def __init__(self, entry: 'CharacterEntry', fingerprint: tuple, task: asyncio.Task):
+        self.entry = entry
+        self.fingerprint = fingerprint
+        self.task = task
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self.finished_at = time.perf_counter()
+        # Retrieve the exception of a failed or discarded prefetch so it is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+
+class NPCActionPrefetcher:
+    """
+    Speculatively chooses the next NPC's combat action while the current turn is resolved.
+
+    `start` renders the action-choice prompt from the current state and generates the
+    answer in the background. When the NPC's turn comes, `take` returns the prefetched
+    action if the tactical situation (see `tactical_fingerprint`) has not changed since;
+    otherwise the speculation is discarded and the caller chooses the action live.
+
+    Wasted prefetches still use rate limit; when fewer than NPC_PREFETCH_MIN_HIT_RATE of
+    the recent ones were used, most prefetches are skipped.
+    """
+    def __init__(self, chapter: 'Chapter'):
+        self.chapter = chapter
+        self.enabled = os.getenv("NPC_PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.min_hit_rate = float(os.getenv("NPC_PREFETCH_MIN_HIT_RATE", DEFAULT_NPC_PREFETCH_MIN_HIT_RATE))
+        self._recent_outcomes = deque(maxlen=RECENT_OUTCOMES)
+        self._skipped_in_row = 0
+        # id(entry) -> speculation; the NPC acting now may still have one when the next is started
+        self.speculations: Dict[int, NPCSpeculation] = {}
+        self.stats = {"started": 0, "skipped": 0, "hits": 0, "stale": 0, "failed": 0, "misses": 0, "seconds_saved": 0.0}
+
+    def _backing_off(self) -> bool:
+        if len(self._recent_outcomes) < MIN_OUTCOMES_FOR_BACKOFF:
+            return False
+        if sum(self._recent_outcomes) / len(self._recent_outcomes) >= self.min_hit_rate:
+            return False
+        if self._skipped_in_row + 1 >= BACKOFF_PROBE_EVERY:
+            return False
+        return True
+
+    def start(self, entry: 'CharacterEntry'):
+        """Starts choosing `entry`'s next action, unless it is a player, dead or already being prefetched."""
+        character = entry.character
+        if not self.enabled or self.chapter.game_mode != GameMode.COMBAT or character.is_player or not character.is_alive:
+            return
+        if id(entry) in self.speculations:
+            return
+        if self._backing_off():
+            self._skipped_in_row += 1
+            self.stats["skipped"] += 1
+            return
+        self._skipped_in_row = 0
+        # Characters that left the turn order will never take theirs
+        for key, speculation in list(self.speculations.items()):
+            if speculation.entry not in self.chapter.turn_order:
+                speculation.task.cancel()
+                del self.speculations[key]
+
+        prompt = self.chapter.get_NPC_action_choice_prompt(character)
+        fingerprint = tactical_fingerprint(self.chapter, character)
+        # A fresh context: the prefetch outlives the turn that started it and must not use its budget
+        task = asyncio.create_task(
+            self.chapter.classifier.general_text_llm_request_async(prompt, priority=LLMPriority.BACKGROUND, call_site=CallSite.NPC_ACTION),
+            context=contextvars.Context()
+        )
+        self.speculations[id(entry)] = NPCSpeculation(entry, fingerprint, task)
+        self.stats["started"] += 1
+        print(f"{DEBUG_COLOR}(NPC prefetch) Choosing {character.name}'s next action in the background{Colors.RESET}")
+
+    def discard(self):
+        """Cancels all speculations, e.g. when a fight ends or a new one is set up."""
+        if self.speculations:
+            print(f"{DEBUG_COLOR}(NPC prefetch) Discarding {len(self.speculations)} prefetched action(s){Colors.RESET}")
+        for speculation in self.speculations.values():
+            speculation.task.cancel()
+        self.speculations = {}
+
+    async def take(self, entry: 'CharacterEntry') -> Optional[str]:
+        """
+        The prefetched action for `entry` if it is still valid (waiting for it if it is
+        still being generated), otherwise None.
+        """
+        speculation = self.speculations.pop(id(entry), None)
+        if speculation is None:
+            self.stats["misses"] += 1
+            return None
+
+        if tactical_fingerprint(self.chapter, entry.character) != speculation.fingerprint:
+            speculation.task.cancel()
+            self.stats["stale"] += 1
+            self._recent_outcomes.append(0)
+            print(f"{DEBUG_COLOR}(NPC prefetch) The situation changed, choosing {entry.name}'s action again{Colors.RESET}")
+            return None
+
+        if speculation.task.cancelled():
+            return self._failed(entry, "it was cancelled")
+
+        waited_from = time.perf_counter()
+        budget = get_turn_budget()
+        try:
+            action = await asyncio.wait_for(asyncio.shield(speculation.task), timeout=budget.remaining() if budget else None)
+        except asyncio.TimeoutError:
+            speculation.task.cancel()
+            raise BudgetExhausted(f"NPC action prefetch for {entry.name} did not finish in time")
+        except asyncio.CancelledError:
+            # Only the speculation was cancelled (e.g. by `start`'s cleanup), not the turn waiting for it
+            current = asyncio.current_task()
+            if not speculation.task.cancelled() or (current is not None and current.cancelling()):
+                raise
+            return self._failed(entry, "it was cancelled")
+        except Exception as e:
+            return self._failed(entry, e)
+
+        self.stats["hits"] += 1
+        self._recent_outcomes.append(1)
+        # Generation time that overlapped the previous turn instead of this one
+        self.stats["seconds_saved"] += min(speculation.finished_at or waited_from, waited_from) - speculation.started_at
+        print(f"{SUCCESS_COLOR}(NPC prefetch) Using {entry.name}'s prefetched action{Colors.RESET}")
+        return action
+
+    def _failed(self, entry: 'CharacterEntry', reason) -> None:
+        self.stats["failed"] += 1
+        self._recent_outcomes.append(0)
+        print(f"{WARNING_COLOR}(NPC prefetch) Prefetch for {entry.name} failed, choosing the action live: {reason}{Colors.RESET}")
+        return None
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        taken = stats["hits"] + stats["stale"] + stats["failed"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / taken if taken else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
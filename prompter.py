@@ -4,6 +4,7 @@ if TYPE_CHECKING:
     from story_manager import StoryManager
 
 import global_defines
+from llm_routing import CallSite
 from models.game_modes import GameMode
 from models.schemas import (
     Character,
@@ -13,6 +14,21 @@ from models.schemas import (
 
 
 class Prompter:
+    def get_past_events_section(self, chapter: 'Chapter', query: str) -> str:
+        """
+        Earlier events of the session relevant to `query` that are no longer in the context
+        (see HistoryIndex); empty when there are none.
+        """
+        past_events = chapter.history.recall(query)
+        if not past_events:
+            return ""
+        return f"""
+<RELEVANT_PAST_EVENTS>
+Earlier events of this session that may matter now. They are no longer part of <CONTEXT>; use them only if relevant.
+{past_events}
+</RELEVANT_PAST_EVENTS>
+"""
+
     def get_after_action_analysis_prompt(self, chapter: 'Chapter') -> str:
         """
         Generates a prompt for an LLM to act as a combined Game Director and Narrative Director.
@@ -82,7 +98,7 @@ Here are the last few messages from the DM. Avoid using the same phrases. Be cre
 
 <CONTEXT>
 - **Current Game Mode:** `{chapter.game_mode.name}`
-- **Full Game State:** {chapter.get_actual_context()}
+- **Full Game State:** {chapter.get_actual_context(call_site=CallSite.AFTER_ACTION)}
 </CONTEXT>
 
 <TASK>
@@ -172,12 +188,13 @@ Your response MUST be a SINGLE JSON object, WITHOUT any additional explanations
 2.  **Atomicity:** Each change should be a single, atomic operation.
 3.  **Scope Limitation:** ONLY list changes for the DIRECTLY affected object. If a player leaves a tavern, the only change is to the player's `position_in_scene` field. DO NOT add a change for the tavern saying "a player left." The scene's state is independent of the character's location within it.
 4.  **No Narrative Changes:** DO NOT modify narrative fields like `personality_history`, `appearance`, or `interactions` via `structural_changes`. These are part of the character's core identity and should only be changed through significant, story-driven events handled by `proactive_world_changes`. `structural_changes` is for mechanical effects ONLY.
+5.  **Structured Fields First:** For characters, put HP changes in `hp_delta`, gained/lost conditions in `conditions_add`/`conditions_remove` and used-up or lost items in `items_remove`; these are applied instantly by the game engine. Use `changes` only for what these fields cannot express (leave it `""` otherwise), one short instruction per line, e.g. `ac: +2`.
 
 **Examples:**
 - **Action:** "I attack the goblin with my sword."
-  - **Result:** `narrative_description` contains the attack roll, damage. `structural_changes` contains a change for the goblin: `changes: "current_hp: -5"`. `turn_wasted` is `true`.
+  - **Result:** `narrative_description` contains the attack roll, damage. `structural_changes` contains a change for the goblin: `hp_delta: -5`, `changes: ""`. `turn_wasted` is `true`.
 - **Action:** "I drink a healing potion."
-  - **Result:** `narrative_description` describes the character drinking the potion and feeling better. `structural_changes` contains two changes for the character: `changes: "current_hp: +8"` and `changes: "inventory: -Healing Potion"`. `turn_wasted` is `true`.
+  - **Result:** `narrative_description` describes the character drinking the potion and feeling better. `structural_changes` contains one change for the character: `hp_delta: 8`, `items_remove: ["Healing Potion"]`, `changes: ""`. `turn_wasted` is `true`.
 - **Action:** "I try to persuade the guard to let me pass."
   - **Result:** `narrative_description` contains the Persuasion skill check and the guard's reaction. `structural_changes` may be empty if the guard does not change their mind. `turn_wasted` is `true`.
 - **Action:** "What do I see in the room?"
@@ -190,8 +207,9 @@ Here are the last few messages from the DM. Avoid using the same phrases. Be cre
 </MEMORY>
 
 <CONTEXT>
-{chapter.get_actual_context()}
+{chapter.get_actual_context(active_character_name=character.name, call_site=CallSite.ACTION_OUTCOME)}
 </CONTEXT>
+{self.get_past_events_section(chapter, f"{character.name} {user_request.text}")}
 
 <TASK>
 The character <span class="name">{character.name}</span> makes the following request: "{user_request.text}"
@@ -321,7 +339,7 @@ You will be given an `ActionOutcome` object, which represents the *intended* res
 <RULES_OF_AUDIT>
 1.  **Verify Every Change:** For each instruction in the `structural_changes` of the `intended_outcome`, verify that the change is accurately reflected in the `actual_state`.
 2.  **Check for Omissions:** Look for things implied by the `narrative_description` that are missing from the `actual_state`. For example, if "the sword shatters," it must be removed from the inventory, even if it wasn't in the original `structural_changes`.
-3.  **Generate Corrections:** If you find any discrepancies, create a new list of `ChangesToMake` objects that will fix the `actual_state`. The `changes` description should be clear, e.g., "Set current_hp to 50 to match the damage taken" or "Remove Healing Potion from inventory as it was consumed."
+3.  **Generate Corrections:** If you find any discrepancies, create a new list of `ChangesToMake` objects that will fix the `actual_state`. Express HP, condition and item fixes for characters through `hp_delta`, `conditions_add`, `conditions_remove` and `items_remove` (e.g. `hp_delta: -10` for damage that was not applied); use `changes` only for anything else, and keep it clear, e.g. "current_hp: 50" or "Update the scene description: the door is now broken."
 4.  **Return Empty if Correct:** If the `actual_state` perfectly matches the `intended_outcome`, you MUST return an empty list `[]`.
 
 <INTENDED_OUTCOME>
@@ -329,7 +347,7 @@ You will be given an `ActionOutcome` object, which represents the *intended* res
 </INTENDED_OUTCOME>
 
 <ACTUAL_STATE>
-{chapter.get_actual_context()}
+{chapter.get_actual_context(call_site=CallSite.AUDIT, focus=chapter.get_changed_objects(intended_outcome.structural_changes))}
 </ACTUAL_STATE>
 
 <TASK>
@@ -387,10 +405,45 @@ Here are the last few messages from the DM. Avoid using the same phrases. Be cre
 </MEMORY>
 
 <CONTEXT>
-{chapter.get_actual_context()}
+{chapter.get_actual_context(active_character_name=character.name, call_site=CallSite.NPC_ACTION)}
 </CONTEXT>
+{self.get_past_events_section(chapter, f"{character.name} {chapter.scene.name if chapter.scene else ''}")}
 
 <TASK>
 It is now **{character.name}**'s turn to act. Based on your profile and the current context, decide on the most logical action and generate the `ActionOutcome` JSON object describing it.
 </TASK>
-"""
\ No newline at end of file
+"""
+
+    def get_context_fold_prompt(self, summary: str, new_events: str, state: str, instructions: str = "") -> str:
+        """
+        Generates a prompt that folds new log blocks into the rolling summary of the chapter.
+        `state` is the current game state (characters, scene, story) without the history.
+        """
+        return f"""
+<ROLE>
+Ты — ассистент Мастера Игры. Ты ведёшь краткую сводку истории и дополняешь её новыми событиями.
+</ROLE>
+
+{state}
+
+<CURRENT_SUMMARY>
+{summary or "Сводки пока нет."}
+</CURRENT_SUMMARY>
+
+<NEW_EVENTS>
+{new_events}
+</NEW_EVENTS>
+
+<TASK>
+Перепиши <CURRENT_SUMMARY> так, чтобы она учитывала <NEW_EVENTS>, и верни только новую сводку (не более {global_defines.MAX_CONTEXT_LENGTH} слов). Обязательно сохрани:
+1.  **Расположение персонажей:** где находятся все персонажи в текущей сцене.
+2.  **Основная цель:** главная цель группы авантюристов в данный момент.
+3.  **Основная цель врагов:** главная цель их противников.
+4.  **Ключевые отношения:** союзы и конфликты между персонажами.
+5.  **Важные детали прошлого:** 1-2 самых важных события, которые напрямую влияют на мотивацию персонажей.
+6.  **Намерение DM:** намеки на будущие события или секреты от Мастера.
+
+Не включай нерелевантные детали или описания уже прошедших действий, если они не влияют на будущее.
+{instructions}
+</TASK>
+"""
@@ -0,0 +1,220 @@
+# rules_engine.py
+
+import re
+import threading
+from typing import List, Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+from global_defines import *
+from models.schemas import ChangesToMake, Character
+
+# Minimum similarity (0-100) for an item or condition named in a change to match the character's one
+NAME_MATCH_CUTOFF = 80
+
+FIELD_ALIASES = {
+    "hp": "current_hp", "хп": "current_hp", "current_hp": "current_hp", "current hp": "current_hp",
+    "hit points": "current_hp", "здоровье": "current_hp", "очки здоровья": "current_hp",
+    "health": "current_hp", "current health": "current_hp", "текущее здоровье": "current_hp",
+    "max_hp": "max_hp", "max hp": "max_hp", "максимальное здоровье": "max_hp",
+    "ac": "ac", "кб": "ac", "класс брони": "ac", "armor class": "ac",
+    "strength": "strength", "сила": "strength",
+    "dexterity": "dexterity", "ловкость": "dexterity",
+    "constitution": "constitution", "телосложение": "constitution",
+    "intelligence": "intelligence", "интеллект": "intelligence",
+    "wisdom": "wisdom", "мудрость": "wisdom",
+    "charisma": "charisma", "харизма": "charisma",
+}
+
+_FIELD = r"(?P<field>[^\d:=+-]+?)"
+_NUMBER = r"(?P<number>\d+)"
+_HP_WORDS = r"(?:hp|хп|hit points|очк(?:ов|а|о)? здоровья|здоровья)"
+# Up to three leading words naming the subject ("Персонаж получает ...", "The goblin takes ...")
+_SUBJECT = r"(?:\S+\s+){0,3}?"
+# A comma or a conjunction starts another effect ("... from the fireball and drops his sword");
+# names and trailing text may not contain one, so such clauses are left to the LLM instead of
+# being applied with the extra effects lost
+_NO_CONJUNCTION = r"(?!\s+(?:and|then|also|и|а|затем|также|потом)\s)"
+_NAME = rf"['\"«]?(?P<name>(?:{_NO_CONJUNCTION}[^'\"»,])+?)['\"»]?"
+_TAIL = rf"(?:{_NO_CONJUNCTION}[^,])+"
+# Trailing source or reason ("... от огненного шара", "... to match the damage taken")
+_SOURCE = rf"(?:\s+(?:от|из-за|from|by)\s+{_TAIL})?"
+_REASON = rf"(?:\s*,?\s+(?:to match|so that|as|because|чтобы|так как|поскольку)\s+{_TAIL})?"
+_DAMAGE_WORDS = r"(?:(?:points? of\s+)?damage|(?:ед(?:иниц[аы]?)?\.?\s*)?урона)"
+
+# (operation, pattern); patterns match one whole clause, case-insensitively
+CLAUSE_PATTERNS = [
+    ("delta", re.compile(rf"^{_FIELD}\s*[:=]?\s*(?P<sign>[+-])\s*{_NUMBER}$", re.I)),
+    ("delta", re.compile(rf"^(?P<sign>[+-])\s*{_NUMBER}\s*{_FIELD}$", re.I)),
+    ("decrease", re.compile(rf"^(?:уменьшить|снизить|понизить|decrease|reduce|lower)\s+{_FIELD}\s+(?:на|by)\s+{_NUMBER}{_SOURCE}{_REASON}$", re.I)),
+    ("increase", re.compile(rf"^(?:увеличить|повысить|increase|raise)\s+{_FIELD}\s+(?:на|by)\s+{_NUMBER}{_SOURCE}{_REASON}$", re.I)),
+    ("set", re.compile(rf"^{_FIELD}\s*[:=]\s*{_NUMBER}$", re.I)),
+    ("set", re.compile(rf"^(?:set|установить)\s+{_FIELD}\s+(?:to|в|равным)\s+{_NUMBER}{_REASON}$", re.I)),
+    ("damage", re.compile(rf"^(?:takes?|получает|получил[аи]?)?\s*{_NUMBER}\s*{_DAMAGE_WORDS}$", re.I)),
+    ("damage", re.compile(rf"^{_SUBJECT}(?:takes?|took|получает|получил[аи]?)\s+{_NUMBER}\s+{_DAMAGE_WORDS}{_SOURCE}$", re.I)),
+    ("damage", re.compile(rf"^{_SUBJECT}(?:loses?|lost|теряет|потерял[аи]?)\s+{_NUMBER}\s+{_HP_WORDS}{_SOURCE}$", re.I)),
+    ("damage", re.compile(rf"^(?:damage|урон)\s*[:=]?\s*{_NUMBER}$", re.I)),
+    ("heal", re.compile(rf"^(?:heals?|восстанавливает|восстановил[аи]?|исцеляется на)\s*{_NUMBER}\s*{_HP_WORDS}?$", re.I)),
+    ("heal", re.compile(rf"^(?:healing|лечение|исцеление)\s*[:=]?\s*{_NUMBER}$", re.I)),
+    ("add_condition", re.compile(rf"^(?:add condition|gains? condition|добавить состояние|получает состояние)\s*[:=]?\s*{_NAME}$", re.I)),
+    ("remove_condition", re.compile(rf"^(?:remove condition|loses? condition|снять состояние|удалить состояние|убрать состояние)\s*[:=]?\s*{_NAME}$", re.I)),
+    ("remove_item", re.compile(rf"^(?:remove item|loses? item|удалить предмет|убрать предмет|теряет предмет)\s*[:=]?\s*{_NAME}$", re.I)),
+    ("remove_item", re.compile(rf"^(?:inventory|инвентарь)\s*:\s*-\s*{_NAME}$", re.I)),
+    ("remove_item", re.compile(rf"^(?:remove|удалить|убрать)\s+{_NAME}\s+(?:from (?:the )?inventory|из инвентаря){_REASON}$", re.I)),
+]
+
+# Splits "1. ...\n2. ..." and "...; ..." into clauses
+_CLAUSE_SPLIT = re.compile(r"[\n;]+")
+_LIST_PREFIX = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+")
+
+
+def enforce_character_rules(character: Character) -> Character:
+    """Clamps HP into [0, max_hp] and keeps `is_alive` consistent with it."""
+    current_hp = max(0, min(character.current_hp, character.max_hp))
+    is_alive = character.is_alive and current_hp > 0
+    if current_hp == character.current_hp and is_alive == character.is_alive:
+        return character
+    return character.model_copy(update={"current_hp": current_hp, "is_alive": is_alive})
+
+
+def describe_change(change: ChangesToMake) -> str:
+    """
+    The change as text: its structured fields as clauses `parse_changes` understands,
+    followed by the free-form `changes` description.
+    """
+    clauses = []
+    if change.hp_delta:
+        clauses.append(f"current_hp: {change.hp_delta:+d}")
+    clauses.extend(f"add condition: {name}" for name in change.conditions_add)
+    clauses.extend(f"remove condition: {name}" for name in change.conditions_remove)
+    clauses.extend(f"remove item: {name}" for name in change.items_remove)
+    if change.changes.strip():
+        clauses.append(change.changes.strip())
+    return "\n".join(clauses)
+
+
+def parse_changes(text: str) -> Optional[List[Tuple[str, str, object]]]:
+    """
+    Parses a change description into mechanical operations (operation, field or name, value).
+    Returns None if any clause is not a plain mechanical change.
+    """
+    operations = []
+    for clause in _CLAUSE_SPLIT.split(text):
+        clause = _LIST_PREFIX.sub("", clause).strip().rstrip(".").strip()
+        if not clause:
+            continue
+        for operation, pattern in CLAUSE_PATTERNS:
+            match = pattern.match(clause)
+            if not match:
+                continue
+            groups = match.groupdict()
+            if operation in ("delta", "set", "decrease", "increase"):
+                field = FIELD_ALIASES.get(groups["field"].strip().lower())
+                if field is None:
+                    continue
+                value = int(groups["number"]) * (-1 if groups.get("sign") == "-" or operation == "decrease" else 1)
+                operation = "set" if operation == "set" else "delta"
+                operations.append((operation, field, value))
+            elif operation in ("damage", "heal"):
+                operations.append(("delta", "current_hp", int(groups["number"]) * (-1 if operation == "damage" else 1)))
+            else:
+                operations.append((operation, groups["name"].strip(), None))
+            break
+        else:
+            return None
+    return operations or None
+
+
+def _match_name(name: str, choices: List[str]) -> Optional[int]:
+    match = process.extractOne(name, choices, scorer=fuzz.WRatio, score_cutoff=NAME_MATCH_CUTOFF)
+    return match[2] if match else None
+
+
+class RulesEngine:
+    """
+    Applies plain mechanical changes ("take 7 damage", "AC +2", "remove condition poisoned")
+    to characters in code, with the HP cap and life/death rules enforced. Anything else
+    is left to the LLM-based update.
+    """
+    stats = {"fast_path": 0, "fallback": 0}
+    _stats_lock = threading.Lock()
+
+    @classmethod
+    def _count(cls, outcome: str):
+        with cls._stats_lock:
+            cls.stats[outcome] += 1
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        with cls._stats_lock:
+            stats = dict(cls.stats)
+        total = stats["fast_path"] + stats["fallback"]
+        stats["hit_rate"] = stats["fast_path"] / total if total else 0.0
+        return stats
+
+    def apply(self, character: Character, changes_to_make: str) -> Optional[Character]:
+        """
+        The updated character, or None if the changes need the LLM.
+        """
+        operations = parse_changes(changes_to_make)
+        updated = self._apply_operations(character, operations) if operations else None
+        self._count("fast_path" if updated is not None else "fallback")
+        if updated is not None:
+            print(f"{Colors.DIM}(rules) {character.name}: {operations}{Colors.RESET}")
+        return updated
+
+    def _apply_operations(self, character: Character, operations: List[Tuple[str, str, object]]) -> Optional[Character]:
+        data = character.model_dump()
+        for operation, target, value in operations:
+            if operation == "delta":
+                data[target] += value
+            elif operation == "set":
+                data[target] = value
+            elif operation == "add_condition":
+                if _match_name(target, data["conditions"]) is None:
+                    data["conditions"].append(target)
+            elif operation == "remove_condition":
+                index = _match_name(target, data["conditions"])
+                if index is None:
+                    return None
+                del data["conditions"][index]
+            elif operation == "remove_item":
+                index = _match_name(target, [item["name"] for item in data["inventory"]])
+                if index is None:
+                    return None
+                if data["inventory"][index]["quantity"] > 1:
+                    data["inventory"][index]["quantity"] -= 1
+                else:
+                    del data["inventory"][index]
+
+        # Rule of life and death: healing a dead character back above 0 HP revives them
+        if not character.is_alive and data["current_hp"] > max(character.current_hp, 0):
+            data["is_alive"] = True
+        return enforce_character_rules(Character.model_validate(data))
+
+
+if __name__ == "__main__":
+    # Self-check of the clause grammar
+    expected = {
+        "current_hp: -5": [("delta", "current_hp", -5)],
+        "Уменьшить текущее здоровье на 7": [("delta", "current_hp", -7)],
+        "Персонаж получает 7 единиц урона от огненного шара": [("delta", "current_hp", -7)],
+        "потерял 12 очков здоровья": [("delta", "current_hp", -12)],
+        "Goblin takes 7 damage from the fireball": [("delta", "current_hp", -7)],
+        "Set current_hp to 50 to match the damage taken": [("set", "current_hp", 50)],
+        "Remove Healing Potion from inventory as it was consumed.": [("remove_item", "Healing Potion", None)],
+        "add condition: Prone\nremove item: Rope": [("add_condition", "Prone", None), ("remove_item", "Rope", None)],
+        # More effects after the first one: nothing may be dropped, so the clause goes to the LLM
+        "Goblin takes 7 damage from the fireball and drops his sword": None,
+        "decrease current_hp by 5 because of the trap, and add condition Prone": None,
+        "Гоблин получает 7 урона от огненного шара и роняет меч": None,
+        "add condition Prone and remove item Sword": None,
+    }
+    failed = 0
+    for text, operations in expected.items():
+        result = parse_changes(text)
+        if result != operations:
+            failed += 1
+            print(f"{ERROR_COLOR}FAIL{Colors.RESET} {text!r}: expected {operations}, got {result}")
+    print(f"{SUCCESS_COLOR if not failed else ERROR_COLOR}{len(expected) - failed}/{len(expected)} clause checks passed{Colors.RESET}")
+    raise SystemExit(1 if failed else 0)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from models import GameMode
 
@@ -67,21 +67,43 @@ class EventBuilder:
         }
 
     @staticmethod
-    def DM_message(data: str):
+    def DM_message(data: str, message_id: Optional[str] = None):
         """Создает событие сообщения от DM (Мастера).
 
         Args:
             data (str): Содержимое отправляемого сообщения.
+            message_id (str, optional): Идентификатор сообщения, если оно уже передавалось фрагментами (DM_message_chunk).
 
         Returns:
             dict: Событие сообщения от DM, содержащее данные сообщения и информацию об отправителе.
         """
-        return {
+        event = {
             "event": "message",
             "data": data,
             "sender": "DM"
         }
+        if message_id:
+            event["message_id"] = message_id
+        return event
+
+
+    @staticmethod
+    def DM_message_chunk(data: str, message_id: str):
+        """Создает событие с очередным фрагментом сообщения DM, пока модель еще генерирует ответ.
+
+        Args:
+            data (str): Новый фрагмент текста.
+            message_id (str): Идентификатор сообщения, к которому относится фрагмент.
 
+        Returns:
+            dict: Событие фрагмента сообщения от DM.
+        """
+        return {
+            "event": "DM_message_chunk",
+            "data": data,
+            "message_id": message_id,
+            "sender": "DM"
+        }
 
     @staticmethod
     def state_update_required(update: str, total: int, current: int):
@@ -0,0 +1,53 @@
+# single_flight.py
+
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from global_defines import *
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async calls.
+
+    The first caller for a key starts the call; every caller that arrives with the
+    same key while it is still in flight awaits that same call and receives a
+    copy of its result (or its exception) instead of issuing a request of its own.
+    """
+    def __init__(self):
+        self._in_flight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.stats = {
+            "calls": 0,
+            "executed": 0,
+            "deduplicated": 0,
+        }
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `call()` unless an identical call (same `key`) is already running,
+        in which case its result is shared.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        self.stats["calls"] += 1
+
+        task = self._in_flight.get(flight_key)
+        if task is not None:
+            self.stats["deduplicated"] += 1
+            print(f"{Colors.DIM}(LLM) Joined in-flight request {key[:12]}...{Colors.RESET}")
+            result = await asyncio.shield(task)
+            # Followers get their own copy so callers can mutate results independently
+            return copy.deepcopy(result)
+
+        self.stats["executed"] += 1
+        task = loop.create_task(call())
+        self._in_flight[flight_key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(flight_key, None))
+        # Shielded so a cancelled leader does not cancel the call for its followers
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._in_flight)
+        return stats
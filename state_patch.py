@@ -0,0 +1,91 @@
+# state_patch.py
+
+from typing import Any, List, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from models.schemas import PatchOp, PatchOperation
+
+T = TypeVar('T', bound=BaseModel)
+
+
+class PatchError(ValueError):
+    """A patch operation that cannot be applied, or whose result does not validate."""
+
+
+def parse_pointer(path: str) -> List[str]:
+    """Splits a JSON Pointer ('/inventory/0/name') into its unescaped tokens."""
+    if not path.startswith("/") or path == "/":
+        raise PatchError(f"Invalid path '{path}'")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    try:
+        index = int(token)
+    except ValueError:
+        raise PatchError(f"'{token}' is not a list index")
+    if not 0 <= index < len(container) + (1 if allow_end else 0):
+        raise PatchError(f"List index {index} out of range")
+    return index
+
+
+def _resolve(data: Any, tokens: List[str], path: str) -> Any:
+    for token in tokens:
+        if isinstance(data, list):
+            data = data[_list_index(data, token, allow_end=False)]
+        elif isinstance(data, dict) and token in data:
+            data = data[token]
+        else:
+            raise PatchError(f"Path '{path}' does not exist")
+    return data
+
+
+def _apply_operation(data: dict, operation: PatchOperation):
+    tokens = parse_pointer(operation.path)
+    parent = _resolve(data, tokens[:-1], operation.path)
+    key = tokens[-1]
+
+    if isinstance(parent, list):
+        if operation.op == PatchOp.ADD:
+            parent.insert(_list_index(parent, key, allow_end=True), operation.value)
+        elif operation.op == PatchOp.REPLACE:
+            parent[_list_index(parent, key, allow_end=False)] = operation.value
+        else:
+            del parent[_list_index(parent, key, allow_end=False)]
+    elif isinstance(parent, dict):
+        if key not in parent:
+            # Objects have a fixed schema: operations never introduce new keys
+            raise PatchError(f"Path '{operation.path}' does not exist")
+        if operation.op == PatchOp.REMOVE:
+            raise PatchError(f"Cannot remove field '{operation.path}'; replace its value instead")
+        parent[key] = operation.value
+    else:
+        raise PatchError(f"Path '{operation.path}' does not point into an object or list")
+
+
+def apply_patch(obj: T, operations: List[PatchOperation], protected: Tuple[str, ...] = ()) -> Tuple[T, List[str]]:
+    """
+    Applies `operations` to a copy of `obj` and validates the result against its model.
+    Top-level fields in `protected` cannot be changed.
+
+    Returns:
+        The patched instance and the paths that were changed.
+
+    Raises:
+        PatchError: If any operation is invalid; `obj` is never partially patched.
+    """
+    data = obj.model_dump(mode="json")
+    for operation in operations:
+        field = parse_pointer(operation.path)[0]
+        if field in protected:
+            raise PatchError(f"Field '{field}' cannot be changed")
+        _apply_operation(data, operation)
+
+    try:
+        patched = type(obj).model_validate(data)
+    except ValidationError as e:
+        raise PatchError(f"Patched {type(obj).__name__} is invalid: {e}") from e
+    return patched, [operation.path for operation in operations]
@@ -39,6 +39,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
 
     let lastMessageCount = 0; // Для отслеживания новых сообщений
+    const streamingMessages = {}; // message_id -> { element, text } для сообщений DM, приходящих фрагментами
 
     // Создаем EventSource для получения обновлений
     let eventSource = new EventSource(`/stream?name=${character_name}`);
@@ -50,12 +51,21 @@ document.addEventListener('DOMContentLoaded', function() {
             console.log(data)
             switch (data.event) {
             case "message":
-                addMessage(
-                    data.data,
-                    data.sender
-                );
+                if (data.message_id && streamingMessages[data.message_id]) {
+                    // The DM message was already streamed in chunks; replace it with the final text
+                    finishStreamedMessage(data.message_id, data.data);
+                } else {
+                    addMessage(
+                        data.data,
+                        data.sender
+                    );
+                }
                 break; // Prevents "fall-through" to the next case
 
+            case "DM_message_chunk":
+                addMessageChunk(data.message_id, data.data);
+                break;
+
             case "alert":
                 addMessage(
                     data.data,
@@ -234,6 +244,33 @@ document.addEventListener('DOMContentLoaded', function() {
     // Set the initial theme based on the current character
     setGlobalTheme(character_name);
 
+    function addMessageChunk(messageId, chunk) {
+        let entry = streamingMessages[messageId];
+        if (!entry) {
+            addMessage("", "DM");
+            entry = { element: chatMessages.lastElementChild, text: "" };
+            streamingMessages[messageId] = entry;
+        }
+        entry.text += chunk;
+        renderStreamedMessage(entry);
+    }
+
+    function finishStreamedMessage(messageId, messageText) {
+        const entry = streamingMessages[messageId];
+        entry.text = messageText;
+        renderStreamedMessage(entry);
+        delete streamingMessages[messageId];
+    }
+
+    function renderStreamedMessage(entry) {
+        const scrollThreshold = 60;
+        const isScrolledToBottom = chatMessages.scrollHeight - chatMessages.clientHeight <= chatMessages.scrollTop + scrollThreshold;
+        entry.element.querySelector('.message-text').innerHTML = marked.parse(entry.text.trimStart());
+        if (isScrolledToBottom) {
+            entry.element.scrollIntoView({ behavior: 'smooth', block: 'end' });
+        }
+    }
+
     function addMessage(messageText, senderName) {
         const scrollThreshold = 60; 
         const isScrolledToBottom = chatMessages.scrollHeight - chatMessages.clientHeight <= chatMessages.scrollTop + scrollThreshold;
@@ -4,12 +4,15 @@ from typing import Optional
 from generator import ObjectGenerator
 from prompter import Prompter
 from models import StoryProgressionCheck
+from llm_clients import LLMClientRegistry
+from llm_scheduler import LLMPriority
+from llm_routing import CallSite
 
 class StoryManager:
-    def __init__(self, story_file_path: str):
+    def __init__(self, story_file_path: str, registry: Optional[LLMClientRegistry] = None):
         with open(story_file_path, 'r', encoding='utf-8') as f:
             self.story: StoryArc = StoryArc.model_validate(json.load(f))
-        self.generator = ObjectGenerator()
+        self.generator = ObjectGenerator(registry=registry)
         self.prompter = Prompter()
 
     def get_current_plot_context(self) -> str:
@@ -54,16 +57,33 @@ class StoryManager:
             print(f"Plot point with id {plot_point_id} not found.")
             return None
 
-    def check_and_advance(self, context: str):
+    async def check_progress(self, context: str) -> Optional[StoryProgressionCheck]:
+        """Asks whether the current plot point is completed; doesn't change the story."""
         prompt = self.prompter.get_story_progression_prompt(self, context)
         if not prompt:
-            return
+            return None
 
-        result: StoryProgressionCheck = self.generator.generate(
+        result: StoryProgressionCheck = await self.generator.generate_async(
             pydantic_model=StoryProgressionCheck,
-            prompt=prompt
+            prompt=prompt,
+            priority=LLMPriority.BACKGROUND,
+            call_site=CallSite.STORY_CHECK
         )
-
         print(f"Story progression check: {result.reasoning}")
-        if result.conditions_met:
-            self.advance_story()
+        return result
+
+    def apply_progress(self, result: Optional[StoryProgressionCheck], checked_plot_point_id: Optional[str] = None):
+        """
+        Advances the story if `result` says so. A result for a plot point other than the
+        current one (`checked_plot_point_id`, e.g. the story was moved meanwhile) is ignored.
+        """
+        if result is None or not result.conditions_met:
+            return
+        if checked_plot_point_id is not None and checked_plot_point_id != self.story.current_plot_point_id:
+            print(f"Story progression check for {checked_plot_point_id} is outdated, ignoring it.")
+            return
+        self.advance_story()
+
+    async def check_and_advance(self, context: str):
+        plot_point_id = self.story.current_plot_point_id
+        self.apply_progress(await self.check_progress(context), plot_point_id)
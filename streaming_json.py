@@ -0,0 +1,193 @@
+# streaming_json.py
+
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object while it is still being generated.
+
+    Feed it raw response chunks; every call returns the events that became
+    available, in order:
+      - ("text", field_name, delta): newly decoded text of a watched top-level
+        string field whose value is still open;
+      - ("field", field_name, value): a top-level field whose value just closed,
+        already decoded with `json.loads`.
+
+    Text outside the outermost object (prose, markdown fences) is ignored.
+    """
+    def __init__(self, stream_fields: Optional[Iterable[str]] = None):
+        self.stream_fields = set(stream_fields or [])
+        self.complete = False
+
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode_remaining = 0
+
+        self._expecting_key = False
+        self._reading_key = False
+        self._key_chars: List[str] = []
+        self._current_key: Optional[str] = None
+        self._awaiting_value = False
+        self._value_start: Optional[int] = None
+        self._value_kind: Optional[str] = None  # "string", "container" or "scalar"
+
+        # State of the watched string value currently being streamed
+        self._streaming = False
+        self._raw_value: List[str] = []
+        self._safe_length = 0  # raw prefix that contains no half-received escape
+        self._pending_high_surrogate = False
+        self._emitted_length = 0
+
+        self.fields: dict = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        for char in chunk:
+            if self.complete:
+                break
+            self._consume(char, events)
+        if self._streaming:
+            self._flush_text(events)
+        return events
+
+    # --- character-level state machine ---
+
+    def _consume(self, char: str, events: list):
+        if self._depth == 0 and char != "{":
+            return  # outside the outermost object
+        index = len(self._buffer)
+        self._buffer.append(char)
+
+        if self._in_string:
+            self._consume_string_char(char, index, events)
+            return
+
+        if char == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expecting_key:
+                self._reading_key = True
+                self._expecting_key = False
+                self._key_chars = []
+            elif self._depth == 1 and self._awaiting_value:
+                self._start_value(index, "string")
+                if self._current_key in self.stream_fields:
+                    self._start_streaming()
+        elif char in "{[":
+            if self._depth == 1 and self._awaiting_value:
+                self._start_value(index, "container")
+            self._depth += 1
+            if self._depth == 1:
+                self._expecting_key = True
+        elif char in "}]":
+            if self._depth == 1 and self._value_kind == "scalar":
+                self._finish_value(index, events)
+            self._depth -= 1
+            if self._depth == 1 and self._value_kind == "container":
+                self._finish_value(index + 1, events)
+            elif self._depth == 0:
+                self.complete = True
+        elif self._depth == 1:
+            if char == ":" and self._current_key is not None and self._value_start is None:
+                self._awaiting_value = True
+            elif char == ",":
+                if self._value_kind == "scalar":
+                    self._finish_value(index, events)
+                self._expecting_key = True
+                self._current_key = None
+            elif self._awaiting_value and char not in _WHITESPACE:
+                self._start_value(index, "scalar")
+
+    def _consume_string_char(self, char: str, index: int, events: list):
+        if self._unicode_remaining:
+            self._append_string_char(char)
+            self._unicode_remaining -= 1
+            if self._unicode_remaining == 0:
+                code_point = int("".join(self._raw_value[-4:]), 16) if self._streaming else 0
+                # Wait for the low half of a surrogate pair before decoding
+                self._pending_high_surrogate = 0xD800 <= code_point <= 0xDBFF
+                self._mark_safe()
+        elif self._escape:
+            self._escape = False
+            self._append_string_char(char)
+            if char == "u":
+                self._unicode_remaining = 4
+            else:
+                self._pending_high_surrogate = False
+                self._mark_safe()
+        elif char == "\\":
+            self._escape = True
+            self._append_string_char(char)
+        elif char == '"':
+            self._in_string = False
+            if self._reading_key:
+                self._reading_key = False
+                self._current_key = "".join(self._key_chars)
+            elif self._depth == 1 and self._value_kind == "string":
+                if self._streaming:
+                    self._pending_high_surrogate = False
+                    self._mark_safe()
+                    self._flush_text(events)
+                    self._streaming = False
+                self._finish_value(index + 1, events)
+        else:
+            self._append_string_char(char)
+            self._pending_high_surrogate = False
+            self._mark_safe()
+
+    def _append_string_char(self, char: str):
+        if self._reading_key:
+            self._key_chars.append(char)
+        elif self._streaming:
+            self._raw_value.append(char)
+
+    # --- value bookkeeping ---
+
+    def _start_value(self, index: int, kind: str):
+        self._awaiting_value = False
+        self._value_start = index
+        self._value_kind = kind
+
+    def _finish_value(self, end: int, events: list):
+        raw = "".join(self._buffer[self._value_start:end]).strip()
+        key = self._current_key
+        self._value_start = None
+        self._value_kind = None
+        try:
+            value = json.loads(raw, strict=False)
+        except json.JSONDecodeError:
+            return  # left for the final parse of the whole response
+        self.fields[key] = value
+        events.append(("field", key, value))
+
+    # --- partial text of watched string fields ---
+
+    def _start_streaming(self):
+        self._streaming = True
+        self._raw_value = []
+        self._safe_length = 0
+        self._pending_high_surrogate = False
+        self._emitted_length = 0
+
+    def _mark_safe(self):
+        if self._streaming and not self._pending_high_surrogate:
+            self._safe_length = len(self._raw_value)
+
+    def _flush_text(self, events: list):
+        if self._safe_length <= 0:
+            return
+        raw = "".join(self._raw_value[:self._safe_length])
+        try:
+            decoded = json.loads(f'"{raw}"', strict=False)
+        except json.JSONDecodeError:
+            # Malformed escape from the model: fall back to the undecoded text
+            decoded = raw
+        new_text = decoded[self._emitted_length:]
+        self._emitted_length = len(decoded)
+        if new_text:
+            events.append(("text", self._current_key, new_text))
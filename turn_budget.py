@@ -0,0 +1,69 @@
+# turn_budget.py
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from global_defines import *
+
+DEFAULT_TURN_BUDGET_SECONDS = 90.0
+
+
+class BudgetExhausted(Exception):
+    """Raised when an LLM call cannot finish inside the current turn budget."""
+
+
+class TurnBudget:
+    """
+    Wall-clock deadline shared by every LLM call made while processing one turn.
+
+    Optional steps (audit, after-action analysis, context trimming...) are
+    skipped once the budget runs out; the steps that were skipped are
+    recorded in `degraded_steps`.
+    """
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds or float(os.getenv("TURN_BUDGET_SECONDS", DEFAULT_TURN_BUDGET_SECONDS))
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + self.seconds
+        self.degraded_steps: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def degrade(self, step: str, reason: str = "turn budget exhausted"):
+        """Records that `step` was skipped or cut short."""
+        self.degraded_steps.append(step)
+        print(f"{WARNING_COLOR}(Turn budget) Skipping {step}: {reason} ({self.elapsed():.1f}s of {self.seconds:.0f}s used){Colors.RESET}")
+
+
+_current_budget: ContextVar[Optional[TurnBudget]] = ContextVar("current_turn_budget", default=None)
+
+
+def get_turn_budget() -> Optional[TurnBudget]:
+    """Returns the budget of the turn being processed, if any."""
+    return _current_budget.get()
+
+
+@contextmanager
+def turn_budget_scope(budget: Optional[TurnBudget] = None):
+    """
+    Makes `budget` (a fresh `TurnBudget` by default) the current budget for every
+    LLM call awaited inside the block, including tasks spawned from it.
+    """
+    budget = budget or TurnBudget()
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+        if budget.degraded_steps:
+            print(f"{WARNING_COLOR}(Turn budget) Turn finished degraded, skipped: {', '.join(budget.degraded_steps)}{Colors.RESET}")
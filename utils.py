@@ -1,3 +1,7 @@
+import math
+from collections import deque
+from typing import Optional
+
 from thefuzz import process
 import requests
 
@@ -20,6 +24,33 @@ def find_closest_match(query: str, choices: list[str]) -> str:
     
     return best_match
 
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for prompt-size bookkeeping (~4 characters per token).
+    """
+    return (len(text) + 3) // 4
+
+class RollingWindow:
+    """
+    Keeps the last `size` samples (e.g. request latencies) for percentile queries.
+    """
+    def __init__(self, size: int = 100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile, `q` in [0, 100]; None when there are no samples."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
 def get_fun_fact():
 
     response = requests.get("https://uselessfacts.jsph.pl/api/v2/facts/random")